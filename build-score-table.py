@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import time
+
+from sklearn.externals import joblib
+
+from flask_app.recommender import Recommender
+from flask_app.score_table import ScoreTable
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the score table of a tree based model " +
+                                                 "to serve the recommendations with table lookups")
+    parser.add_argument("model_file",
+                        help="Path to the model file.",
+                        metavar="MODEL_FILE")
+    parser.add_argument("output_dir",
+                        help="Path to the output table directory. To use it, set the " +
+                             "SCORE_TABLE_PATH environment variable of the application to this path.",
+                        metavar="OUTPUT_DIR")
+    args = parser.parse_args()
+
+    print("Loading model from %s" % args.model_file)
+    recommender = Recommender.from_pipeline(joblib.load(args.model_file))
+
+    print("Building score table")
+    start = time.time()
+    score_table = ScoreTable.build(recommender)
+    print("Score table built in %.2f seconds: %d age intervals, %d genders, %d occupations, %d movies" %
+          ((time.time() - start,) + score_table.rankings.shape))
+
+    score_table.save(args.output_dir)
+    print("Score table saved in %s" % args.output_dir)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import numpy as np
+
+from sklearn.externals import joblib
+
+from flask_app.artifacts import export_artifacts
+from flask_app.forest import FlatForest
+from flask_app.recommender import Recommender
+from flask_app.score_table import ScoreTable
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a tree based model as a directory of " +
+                                                 "artifacts that the application memory-maps")
+    parser.add_argument("model_file",
+                        help="Path to the model file.",
+                        metavar="MODEL_FILE")
+    parser.add_argument("output_dir",
+                        help="Path to the output directory. To use it, set the ML_MODEL_PATH " +
+                             "environment variable of the application to this path.",
+                        metavar="OUTPUT_DIR")
+    parser.add_argument("--score-table",
+                        action="store_true",
+                        help="Precompute the score table of the model and export it as well.")
+    parser.add_argument("--float32",
+                        action="store_true",
+                        help="Store the thresholds and values of the trees as float32 values. The " +
+                             "splits are exactly the same, only the values lose precision.")
+    parser.add_argument("--max-depth",
+                        type=int,
+                        default=None,
+                        help="Cut the trees at this depth.")
+    parser.add_argument("--merge-tolerance",
+                        type=float,
+                        default=None,
+                        help="Merge the subtrees whose leaves have values closer than this tolerance.")
+    args = parser.parse_args()
+
+    print("Loading model from %s" % args.model_file)
+    model = joblib.load(args.model_file)
+    recommender = Recommender.from_pipeline(model)
+    forest = FlatForest.from_estimator(recommender.estimator)
+
+    if args.float32 or args.max_depth is not None or args.merge_tolerance is not None:
+        compact_forest = forest.compact(args.max_depth, args.merge_tolerance,
+                                        np.float32 if args.float32 else np.float64)
+        print("Compact forest: %d nodes (%.1fMB), from %d nodes (%.1fMB)" %
+              (compact_forest.feature.shape[0], compact_forest.nbytes / 2. ** 20,
+               forest.feature.shape[0], forest.nbytes / 2. ** 20))
+        forest = compact_forest
+
+    score_table = None
+    if args.score_table:
+        # The table is built with the exported forest, so it matches its splits
+        print("Building score table")
+        recommender.estimator = forest
+        score_table = ScoreTable.build(recommender)
+
+    export_artifacts(args.output_dir, model, score_table, forest)
+    print("Model artifacts exported in %s" % args.output_dir)
@@ -3,18 +3,33 @@
 from __future__ import absolute_import, unicode_literals
 
 import os
-import numpy as np
+import threading
+import time
 import uuid
 
-from flask import Flask, jsonify, request
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+from flask import Flask, g, request
+from flask_jwt_extended import JWTManager, create_access_token
 from logging.config import dictConfig
-from passlib.hash import pbkdf2_sha256 as sha256
-from sklearn.externals import joblib
 
-from flask_app.config import LOGGING_CONFIG, get_config_from_environment
+from flask_app.artifacts import load_recommender
+from flask_app.auth import PasswordVerifier, VerifiedTokenCache, get_client_address
+from flask_app.batching import MicroBatcher
+from flask_app.cache import LRUCache, ModelCache, RingBuffer
+from flask_app.config import DEFAULT_CONFIG, LOGGING_CONFIG, get_config_from_environment
+from flask_app.feedback import FeedbackSink, get_feedback_writer
+from flask_app.forest import FlatForest
+from flask_app.json_backend import JSONBackend
+from flask_app.logs import LogEvent, setup_logging
+from flask_app.metrics import STAGE_HISTOGRAM, STAGES, MetricsRegistry, stage
+from flask_app.prefilter import DemographicPrefilter
+from flask_app.profiling import RequestProfiler
+from flask_app.recommender import Recommender
+from flask_app.registry import ModelRegistry, ServingModel
+from flask_app.score_table import ScoreTable
+from flask_app.warmup import is_ready, warm_up
 from flask_app.utils import InvalidConfigurationError, InvalidUsage,\
-    check_recommend_data_parameters, check_login_parameters, check_score_parameters
+    check_recommend_batch_parameters, check_recommend_data_parameters, check_recommend_page_parameters,\
+    check_login_parameters, check_score_parameters
 
 
 def create_app(test_config=None, dummy_test_model=None):
@@ -30,6 +45,7 @@ def create_app(test_config=None, dummy_test_model=None):
 
     # Initialize the application
     app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
 
     if test_config is None:
         app.config.update(get_config_from_environment(app.logger))
@@ -38,7 +54,72 @@ def create_app(test_config=None, dummy_test_model=None):
             app.config.from_envvar("PROD_SETTINGS")
         elif os.environ.get("DEV_SETTINGS", None) is not None:
             app.config.from_envvar("DEV_SETTINGS")
+    else:
+        # In case the app is being tested, update the configuration accordingly
+        app.logger.info("Loading app for testing")
+        app.config.update(test_config)
+
+    # Set the format and handlers of the logs
+    setup_logging(app.config)
+
+    # Set the library to decode the requests and encode the responses with
+    try:
+        json_backend = JSONBackend(app.config["JSON_BACKEND"])
+    except ValueError as e:
+        raise InvalidConfigurationError(str(e))
+    json_backend.init_app(app)
+    jsonify = json_backend.jsonify
+
+    def prepare_recommender(recommender):
+        """
+        Prepares a loaded model to serve it with the configured settings
+        """
+        # Replace the scikit-learn regressor by the flat forest if requested
+        if app.config["INFERENCE_ENGINE"] == "flat" and not isinstance(recommender.estimator, FlatForest):
+            try:
+                recommender.estimator = FlatForest.from_estimator(recommender.estimator)
+            except ValueError as e:
+                raise InvalidConfigurationError("The flat inference engine can't be used with the " +
+                                                "loaded model: %s" % e)
+            app.logger.info("Using the flat inference engine")
+
+        # Serve the recommendations from the precomputed score table if available
+        if app.config["SCORE_TABLE_PATH"] is not None:
+            app.logger.info("Loading score table from path %s" % app.config["SCORE_TABLE_PATH"])
+            score_table = ScoreTable.load(app.config["SCORE_TABLE_PATH"], mmap_mode="r")
+            if not score_table.check_model(recommender):
+                raise InvalidConfigurationError("The score table in \"%s\" " % app.config["SCORE_TABLE_PATH"] +
+                                                "was not built for the loaded model.")
+            recommender.score_table = score_table
+        elif app.config["PRECOMPUTE_SCORE_TABLE"] and recommender.score_table is None:
+            app.logger.info("Precomputing the score table of the model")
+            recommender.score_table = ScoreTable.build(recommender)
+            app.logger.info("Score table successfully precomputed")
+
+        # Only score the top candidates of the demographic group of each user if requested
+        # (not needed with a score table, which has the exact rankings)
+        if app.config["PREFILTER_CANDIDATES"] > 0 and recommender.score_table is None:
+            app.logger.info("Building the candidates prefilter of the model")
+            recommender.prefilter = DemographicPrefilter.build(recommender, app.config["PREFILTER_CANDIDATES"])
+
+        # Warm the model before serving it
+        app.logger.info("Warming up the model")
+        warmup_stats = warm_up(recommender, app.config["WARMUP_REQUESTS"])
+        app.logger.info("Model warmed up (p50: %.2fms, p95: %.2fms)" %
+                        (warmup_stats["p50"] * 1000, warmup_stats["p95"] * 1000))
 
+        return recommender
+
+    if app.config["MODEL_REGISTRY_PATH"] is not None:
+        # Serve the versions of the model registry, checking for new ones in background
+        app.logger.info("Loading model from the registry %s" % app.config["MODEL_REGISTRY_PATH"])
+        serving = ModelRegistry(app.config["MODEL_REGISTRY_PATH"], prepare_recommender,
+                                app.config["MODEL_REGISTRY_POLL_INTERVAL"], app.logger,
+                                app.config["MODEL_REGISTRY_RETRY_INTERVAL"])
+        if not serving.check():
+            raise InvalidConfigurationError("The model registry \"%s\" " % app.config["MODEL_REGISTRY_PATH"] +
+                                            "doesn't have any model.")
+    elif test_config is None:
         # Load the model given by the environment variable
         app.logger.info("Getting the machine learning model from the ML_MODEL_PATH " +
                         "environment variable.")
@@ -49,17 +130,93 @@ def create_app(test_config=None, dummy_test_model=None):
                                             "Please declare it before starting " +
                                             "this application.")
         app.logger.info("Loading model from path %s" % model_path)
-        model = joblib.load(model_path)
+        recommender = load_recommender(model_path)
+        recommender.version = app.config["MODEL_VERSION"]
+        serving = ServingModel(prepare_recommender(recommender))
         app.logger.info("Model successfully loaded")
     else:
-        # In case the app is being tested, update the configuration accordingly
-        # And use the dummy test model
-        app.logger.info("Loading app for testing")
-        app.config.update(test_config)
-        model = dummy_test_model
+        # Use the dummy test model
+        recommender = Recommender.from_pipeline(dummy_test_model)
+        recommender.version = app.config["MODEL_VERSION"]
+        serving = ServingModel(prepare_recommender(recommender))
+
+    # Rankings of the last recommendations, to serve their next pages
+    rankings_cache = LRUCache(app.config["RANKINGS_CACHE_SIZE"])
+
+    # Rankings of the most requested users (invalidated when the model changes)
+    recommendations_cache = ModelCache(app.config["RECOMMENDATIONS_CACHE_SIZE"],
+                                       app.config["RECOMMENDATIONS_CACHE_TTL"])
+
+    # Results of the last recommendations, to validate and enrich their scores
+    recommendations_history = RingBuffer(app.config["RECOMMENDATIONS_HISTORY_SIZE"])
+
+    # Metrics of the requests (aggregated over the workers if they are kept in a directory)
+    metrics = MetricsRegistry(app.config["METRICS_DIR"]) if app.config["METRICS_ENABLED"] else None
+
+    # Coalesce the concurrent recommendations in a single call to the model if requested
+    batcher = None
+    if app.config["MICRO_BATCHING"]:
+        batcher = MicroBatcher(window=app.config["MICRO_BATCH_WINDOW"],
+                               max_batch_size=app.config["MICRO_BATCH_MAX_SIZE"], metrics=metrics,
+                               timeout=app.config["MICRO_BATCH_TIMEOUT"])
+
+    # Write the feedback of the users in batches, out of the request path
+    feedback_sink = FeedbackSink(get_feedback_writer(app.config["FEEDBACK_PATH"], app.logger),
+                                 app.config["FEEDBACK_FLUSH_INTERVAL"], app.config["FEEDBACK_FLUSH_SIZE"],
+                                 app.config["FEEDBACK_QUEUE_SIZE"], app.config["FEEDBACK_OVERFLOW"], app.logger)
 
     jwt = JWTManager(app)
 
+    # Tokens already verified, so the requests reusing them skip the verification
+    verified_tokens = VerifiedTokenCache(app.config["JWT_CACHE_SIZE"])
+    jwt_required = verified_tokens.jwt_required
+
+    # Verify the passwords of the logins in a bounded pool, with a rate limit per client
+    password_verifier = PasswordVerifier(app.config["SESSION_PASSWORD"], app.config["LOGIN_WORKERS"],
+                                         app.config["LOGIN_MAX_PENDING"], app.config["LOGIN_RATE_LIMIT"],
+                                         app.config["LOGIN_CACHE_TTL"], app.config["LOGIN_TIMEOUT"])
+
+    # Profile a sample of the requests if requested (the hooks are not registered otherwise)
+    profiler = None
+    if app.config["PROFILING_DIR"] is not None:
+        profiler = RequestProfiler(app.config["PROFILING_DIR"], app.config["PROFILING_SAMPLE_RATE"],
+                                   app.config["PROFILING_WINDOW"], app.config["PROFILING_TOKEN"],
+                                   app.config["PROFILING_HEADER"], app.logger)
+
+        @app.before_request
+        def start_request_profile():
+            if profiler.should_profile(request):
+                g.request_profile = profiler.start()
+
+        @app.teardown_request
+        def stop_request_profile(exception):
+            profile = g.pop("request_profile", None)
+            if profile is not None:
+                profiler.stop(profile, request.url_rule.rule if request.url_rule is not None else "unmatched")
+
+    @app.before_request
+    def start_background_tasks():
+        serving.ensure_watcher()
+
+    @app.before_request
+    def start_request_metrics():
+        if metrics is not None:
+            g.request_start = time.perf_counter()
+            metrics.bind()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if metrics is not None and "request_start" in g:
+            labels = (("route", request.url_rule.rule if request.url_rule is not None else "unmatched"),)
+            metrics.observe("recommend_request_duration_seconds", labels, time.perf_counter() - g.request_start)
+            metrics.inc("recommend_requests_total", labels + (("status", "%dxx" % (response.status_code // 100)),))
+        return response
+
+    @app.teardown_request
+    def stop_request_metrics(exception):
+        if metrics is not None:
+            metrics.unbind()
+
     @app.route("/")
     def index():
         """
@@ -67,13 +224,64 @@ def create_app(test_config=None, dummy_test_model=None):
         """
         return jsonify({"message": "Hello, World!"})
 
+    readiness_lock = threading.Lock()
+
+    def measure_readiness(recommender):
+        """
+        Measures again the latency of a recommender that was not ready
+        """
+        try:
+            warm_up(recommender, app.config["WARMUP_REQUESTS"])
+        except Exception as e:
+            app.logger.error("There was an exception while warming up the model: %s" % e)
+        finally:
+            readiness_lock.release()
+
+    @app.route("/ready")
+    def ready():
+        """
+        View for the load balancer to check the worker is warm and fast enough
+        """
+        recommender = serving.recommender
+        p95_budget = app.config["READINESS_P95_BUDGET"]
+        worker_ready = is_ready(recommender, p95_budget)
+
+        # A slow measure (e.g. under a load spike) is retried after a while, in background so the probe
+        # only reports the last measure
+        if not worker_ready and \
+                time.time() - recommender.warmup_stats["measured_at"] >= app.config["READINESS_RETRY_INTERVAL"] and \
+                readiness_lock.acquire(blocking=False):
+            threading.Thread(target=measure_readiness, args=(recommender,), name="readiness-warmup",
+                             daemon=True).start()
+
+        response = jsonify({
+            "ready": worker_ready,
+            "model_version": recommender.version,
+            "p95_budget": p95_budget,
+            "warmup": recommender.warmup_stats
+        })
+        response.status_code = 200 if worker_ready else 503
+
+        return response
+
+    @app.route("/metrics")
+    def metrics_view():
+        """
+        View with the metrics of the requests in the Prometheus text format
+        """
+        if metrics is None:
+            raise InvalidUsage("The metrics are not enabled", status_code=404)
+
+        return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/api/login", methods=["POST"])
     def login():
         # Check the parameters are correct
         data = check_login_parameters(request)
 
         # Verify the password is valid
-        if not sha256.verify(data["session_password"], app.config["SESSION_PASSWORD"]):
+        if not password_verifier.verify(data["session_password"],
+                                        get_client_address(request, app.config["TRUSTED_PROXIES"])):
             raise InvalidUsage("Incorrect session password", status_code=401)
 
         # Return the access token
@@ -88,58 +296,122 @@ def create_app(test_config=None, dummy_test_model=None):
         """
         return jsonify({"message": "Protected"})
 
+    @app.route("/api/stats", methods=["GET"])
+    @jwt_required
+    def stats():
+        """
+        View with the statistics of the caches and batching of the worker
+        """
+        worker_stats = {
+            "model_version": serving.recommender.version,
+            "verified_tokens": verified_tokens.stats(),
+            "login": password_verifier.stats(),
+            "rankings_cache": rankings_cache.stats(),
+            "recommendations_cache": recommendations_cache.stats(),
+            "recommendations_history": recommendations_history.stats(),
+            "feedback": feedback_sink.stats()
+        }
+        if profiler is not None:
+            worker_stats["profiling"] = profiler.stats()
+        if batcher is not None:
+            worker_stats["micro_batching"] = batcher.stats()
+
+        return jsonify(worker_stats)
+
     @app.route("/api/recommend/score", methods=["POST"])
     @jwt_required
     def score():
         # Check the parameters are correct
         data = check_score_parameters(request)
 
-        # Log the score via the app logger
-        data_log = "\nREQUEST SCORE LOG\n"
-        data_log += "REQUEST: %s\n" % data["id"]
-        data_log += "MOVIE: %s\n" % data["movie"]
-        data_log += "SCORE: %.2f" % data["score"]
-        app.logger.info(data_log)
+        # Validate the score against its recommendation and add the results of it (only the ones kept by
+        # the server, the scores of unknown recommendations don't have them)
+        recommendation = None
+        history = recommendations_history.get(data["id"])
+        if history is None:
+            if app.config["SCORE_REQUIRE_RECOMMENDATION"]:
+                raise InvalidUsage("The recommendation with id '%s' doesn't exist or has expired" % data["id"],
+                                   status_code=404)
+        elif data["movie"] not in history["scores"]:
+            raise InvalidUsage("The movie '%s' was not recommended in '%s'" % (data["movie"], data["id"]))
+        else:
+            recommendation = dict(history["data"], predicted_score=history["scores"][data["movie"]],
+                                  model_version=history["model_version"])
+
+        # Queue the score to be written by the feedback sink
+        feedback_sink.put(data, recommendation)
 
         return jsonify("Ok"), 200
 
+    def log_recommendation(request_id, model_version, data, recommended_movies, recommendations):
+        """
+        Logs a valid recommendation via the app logger
+        """
+        app.logger.info(LogEvent("recommendation", id=request_id, model_version=model_version, data=data,
+                                 movies=recommended_movies, results=recommendations))
+
+    def add_to_history(request_id, model_version, data, recommended_movies, recommendations):
+        """
+        Keeps the results of a recommendation (or of a page of it) in the history
+        """
+        # The history is only looked up by the scores, so adding to it doesn't count in its hit rate
+        history = recommendations_history.peek(request_id)
+        if history is None:
+            # The pages of an evicted recommendation don't have the data of the user
+            if data is None:
+                return
+            history = {"data": data, "model_version": model_version, "scores": {}}
+            recommendations_history.put(request_id, history)
+        history["scores"].update(zip(recommended_movies, recommendations.tolist()))
+
     @app.route("/api/recommend", methods=["POST"])
     @jwt_required
     def recommend():
-        # Check the parameters are correct
-        data = check_recommend_data_parameters(request)
+        # Requests with the id of a previous recommendation ask for another page of it
+        if request.is_json and "id" in request.get_json():
+            return recommend_page()
 
-        # Get all the movies of the model (this depends on the model)
-        movies = [f.split("=", 1)[1] for f in model.steps[0][1].feature_names_
-                  if f.startswith("movie")]
+        # Check the parameters are correct
+        with stage("validation"):
+            data = check_recommend_data_parameters(request)
 
-        # Generate a dataset with each movie
         max_recs = data.pop("max_recs", 10)
-        X = [{**data, **{"movie": movie}} for movie in movies]
+        offset = data.pop("offset", 0)
+
+        # The same version of the model serves the whole request
+        recommender = serving.recommender
 
         # Predicts over the whole movie dataset and get the top recommendations
         try:
-            recommendations = model.predict(X)
-            sorted_recommendations_indices = np.argsort(recommendations)[::-1][:max_recs]
-            recommended_movies = [movies[i] for i in sorted_recommendations_indices]
+            cache_key = (data["age"], data["gender"], data["occupation"])
+            with stage("cache"):
+                ranking = recommendations_cache.get(cache_key, model=recommender)
+            if ranking is None:
+                if batcher is None or recommender.score_table is not None:
+                    ranking = recommender.rank(data)
+                else:
+                    ranking = batcher.rank(data, recommender.rank_many)
+                recommendations_cache.put(cache_key, ranking, model=recommender)
+            with stage("ranking"):
+                sorted_recommendations_indices, recommendations = ranking.top(max_recs, offset)
+                recommended_movies = [recommender.movies[i] for i in sorted_recommendations_indices]
 
             # Log the valid recommendation and generate an id for it
             request_id = uuid.uuid4()
 
-            data_log = "\nREQUEST RESULT LOG\n"
-            data_log += "REQUEST_ID: %s\n" % request_id
-            data_log += "DATA: Age=%d Gender=%s Occupation=%s\n" %\
-                        (data["age"], data["gender"], data["occupation"])
-            data_log += "MOVIES: %s\n" %\
-                        ";".join('"%s"' % m.replace('"', '\\"') for m in recommended_movies)
-            data_log += "RESULTS: %s" %\
-                        ";".join("%.2f" % r for r in recommendations[sorted_recommendations_indices])
-            app.logger.info(data_log)
-
-            return jsonify({
-                "recommendations": recommended_movies,
-                "id": str(request_id)
-            })
+            with stage("logging"):
+                # Keep the ranking for the requests of the next pages
+                rankings_cache.put(str(request_id), (recommender, ranking))
+
+                log_recommendation(request_id, recommender.version, data, recommended_movies, recommendations)
+                add_to_history(str(request_id), recommender.version, data, recommended_movies, recommendations)
+
+            with stage("serialization"):
+                return jsonify({
+                    "recommendations": recommended_movies,
+                    "id": str(request_id),
+                    "model_version": recommender.version
+                })
         except Exception as e:
             app.logger.error("There was an exception while trying to get recommendations: %s" % e)
             app.logger.error("Traceback of the exception:")
@@ -147,10 +419,89 @@ def create_app(test_config=None, dummy_test_model=None):
 
             return jsonify({"message": "There was a problem processing your request. Please try again later."}), 500
 
+    @app.route("/api/recommend/batch", methods=["POST"])
+    @jwt_required
+    def recommend_batch():
+        # Check the parameters are correct (each user with the same rules of recommend)
+        users = check_recommend_batch_parameters(request, app.config["BATCH_MAX_USERS"])
+
+        pages = [(data.pop("max_recs", 10), data.pop("offset", 0)) for data in users]
+
+        # The same version of the model serves the whole request
+        recommender = serving.recommender
+
+        # Predicts over the whole movie dataset for all the users in a single pass
+        try:
+            cache_keys = [(data["age"], data["gender"], data["occupation"]) for data in users]
+            rankings = [recommendations_cache.get(cache_key, model=recommender) for cache_key in cache_keys]
+
+            # Only the users missing in the cache are scored
+            missing = [i for i, ranking in enumerate(rankings) if ranking is None]
+            for i, ranking in zip(missing, recommender.rank_many([users[i] for i in missing])):
+                rankings[i] = ranking
+                recommendations_cache.put(cache_keys[i], ranking, model=recommender)
+
+            results = []
+
+            for data, ranking, (max_recs, offset) in zip(users, rankings, pages):
+                sorted_recommendations_indices, recommendations = ranking.top(max_recs, offset)
+                recommended_movies = [recommender.movies[i] for i in sorted_recommendations_indices]
+
+                # Log each valid recommendation with its own id
+                request_id = uuid.uuid4()
+                rankings_cache.put(str(request_id), (recommender, ranking))
+                log_recommendation(request_id, recommender.version, data, recommended_movies, recommendations)
+                add_to_history(str(request_id), recommender.version, data, recommended_movies, recommendations)
+
+                results.append({
+                    "recommendations": recommended_movies,
+                    "id": str(request_id)
+                })
+
+            return jsonify({"results": results, "model_version": recommender.version})
+        except Exception as e:
+            app.logger.error("There was an exception while trying to get batch recommendations: %s" % e)
+            app.logger.error("Traceback of the exception:")
+            app.logger.exception(e)
+
+            return jsonify({"message": "There was a problem processing your request. Please try again later."}), 500
+
+    def recommend_page():
+        # Check the parameters are correct
+        data = check_recommend_page_parameters(request)
+
+        # The pages are served by the version of the model of the recommendation
+        recommender, ranking = rankings_cache.get(data["id"], (None, None))
+        if ranking is None:
+            raise InvalidUsage("The recommendation with id '%s' doesn't exist or has expired" % data["id"],
+                               status_code=404)
+
+        sorted_recommendations_indices, recommendations = ranking.top(data.get("max_recs", 10), data["offset"])
+        recommended_movies = [recommender.movies[i] for i in sorted_recommendations_indices]
+
+        app.logger.info(LogEvent("page", id=data["id"], model_version=recommender.version, offset=data["offset"],
+                                 movies=recommended_movies, results=recommendations))
+        add_to_history(data["id"], recommender.version, None, recommended_movies, recommendations)
+
+        return jsonify({
+            "recommendations": recommended_movies,
+            "id": data["id"],
+            "model_version": recommender.version
+        })
+
     @app.errorhandler(InvalidUsage)
     def handle_invalid_usage(error):
         response = jsonify(error.to_dict())
         response.status_code = error.status_code
         return response
 
+    if metrics is not None:
+        routes = sorted({rule.rule for rule in app.url_map.iter_rules()} | {"unmatched"})
+        metrics.add_counter("recommend_requests_total", "Number of requests by route and status class.",
+                            [{"route": route, "status": "%dxx" % status} for route in routes for status in range(1, 6)])
+        metrics.add_histogram("recommend_request_duration_seconds", "Latency of the requests by route.",
+                              [{"route": route} for route in routes])
+        metrics.add_histogram(STAGE_HISTOGRAM, "Latency of the stages of the recommendations.",
+                              [{"stage": name} for name in STAGES])
+
     return app
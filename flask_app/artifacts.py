@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import json
+import os
+
+from sklearn.externals import joblib
+
+from flask_app.forest import FlatForest
+from flask_app.recommender import Recommender
+from flask_app.score_table import ScoreTable
+from flask_app.utils import InvalidConfigurationError
+
+ARTIFACTS_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def is_artifacts_directory(path):
+    """
+    Checks whether a path is a directory of model artifacts.
+    :param path: Path to check.
+    :return: Whether the path has the artifacts manifest.
+    """
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def export_artifacts(path, model, score_table=None, forest=None):
+    """
+    Exports a model as a directory of artifacts: the `DictVectorizer` pickle
+    and the arrays of the trees (and of the score table if given) as `.npy`
+    files, that are loaded as memory-mapped files by `load_artifacts`.
+    Raise ValueError if the regressor of the model is not supported.
+    :param path: Path to the directory of the artifacts.
+    :param model: Fitted scikit-learn pipeline (DictVectorizer + tree based regressor).
+    :param score_table: Score table of the model to export with it.
+    :param forest: Flat forest of the model to export, e.g. a compact one
+        (defaults to the flat forest of the regressor).
+    """
+    recommender = Recommender.from_pipeline(model)
+    if forest is None:
+        forest = FlatForest.from_estimator(recommender.estimator)
+
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(recommender.vectorizer, os.path.join(path, "vectorizer.pkl"))
+    forest.save(os.path.join(path, "forest"))
+    if score_table is not None:
+        score_table.save(os.path.join(path, "score_table"))
+
+    # The manifest is written last, so a partial export is never loaded
+    with open(os.path.join(path, MANIFEST_FILE), "w") as fh:
+        json.dump({
+            "format_version": ARTIFACTS_FORMAT_VERSION,
+            "n_movies": len(recommender.movies),
+            "n_trees": int(forest.n_trees),
+            "n_nodes": int(forest.feature.shape[0]),
+            "dtype": forest.value.dtype.name,
+            "score_table": score_table is not None
+        }, fh, indent=2)
+
+
+def load_artifacts(path, mmap_mode="r"):
+    """
+    Loads a model exported with `export_artifacts`. The arrays are memory-mapped
+    by default, so every process of the server reads the same pages of memory.
+    Raise InvalidConfigurationError if the artifacts are not valid.
+    :param path: Path to the directory of the artifacts.
+    :param mmap_mode: Memory-map mode for the arrays (see `numpy.load`).
+    :return: Recommender of the model.
+    """
+    with open(os.path.join(path, MANIFEST_FILE), "r") as fh:
+        manifest = json.load(fh)
+
+    if manifest.get("format_version") != ARTIFACTS_FORMAT_VERSION:
+        raise InvalidConfigurationError("The model artifacts in \"%s\" have an " % path +
+                                        "unsupported format version.")
+
+    recommender = Recommender(joblib.load(os.path.join(path, "vectorizer.pkl")),
+                              FlatForest.load(os.path.join(path, "forest"), mmap_mode=mmap_mode))
+
+    if manifest["score_table"]:
+        recommender.score_table = ScoreTable.load(os.path.join(path, "score_table"), mmap_mode=mmap_mode)
+
+    return recommender
+
+
+def load_recommender(path):
+    """
+    Loads the model in the given path, which can be a pickled scikit-learn
+    pipeline, a directory of artifacts, or a directory with a `model.pkl` file.
+    :param path: Path to the model.
+    :return: Recommender of the model.
+    """
+    if is_artifacts_directory(path):
+        # The arrays of the artifacts are memory-mapped and shared by the workers
+        return load_artifacts(path)
+    elif os.path.isdir(path):
+        return Recommender.from_pipeline(joblib.load(os.path.join(path, "model.pkl")))
+    else:
+        return Recommender.from_pipeline(joblib.load(path))
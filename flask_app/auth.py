@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import wraps
+
+from flask import current_app, request
+from flask_jwt_extended import verify_jwt_in_request
+from flask_jwt_extended.config import config
+from flask_jwt_extended.default_callbacks import default_claims_verification_callback
+from flask_jwt_extended.utils import has_user_loader
+from passlib.hash import pbkdf2_sha256 as sha256
+
+from flask_app.cache import LRUCache
+from flask_app.utils import InvalidUsage
+
+try:
+    from flask import _app_ctx_stack as ctx_stack
+except ImportError:
+    from flask import _request_ctx_stack as ctx_stack
+
+
+def has_claims_verification_loader():
+    """
+    Returns whether the application set a `claims_verification_loader` of its
+    own (the default one accepts any claims).
+    """
+    jwt_manager = current_app.extensions["flask-jwt-extended"]
+    return jwt_manager._claims_verification_callback is not default_claims_verification_callback
+
+
+class VerifiedTokenCache(LRUCache):
+    """
+    LRU cache of the access tokens already verified, keyed by the secret used
+    to verify them and the raw token, so the requests of a client that reuses
+    its token skip the decoding and the check of its signature. The cached
+    tokens are verified again once they expire, and a change of the secret
+    makes every cached token miss. Only tokens sent in the headers are cached,
+    and the cache is not used with blacklists, user loaders or claims
+    verification loaders (which need to be checked on each request).
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: Maximum number of tokens of the cache.
+        """
+        super(VerifiedTokenCache, self).__init__(max_size)
+        self.verifications = 0
+        self.verification_time = 0.
+
+    def get_request_token(self):
+        """
+        Gets the raw token of the request if it can be served by the cache.
+        :return: The encoded token, or None if the request is not cacheable.
+        """
+        if self.max_size <= 0 or tuple(config.token_location) != ("headers",) or \
+                config.blacklist_enabled or has_user_loader() or has_claims_verification_loader():
+            return None
+
+        parts = request.headers.get(config.header_name, "").split()
+        if config.header_type:
+            return parts[1] if len(parts) == 2 and parts[0] == config.header_type else None
+        else:
+            return parts[0] if len(parts) == 1 else None
+
+    def verify_request(self):
+        """
+        Ensures the request has a valid access token, as `verify_jwt_in_request`
+        does, using the cached verification of the token if there's one.
+        """
+        if request.method in config.exempt_methods:
+            return
+
+        token = self.get_request_token()
+        if token is not None:
+            key = (config.decode_key, token)
+            jwt_data = self.get(key)
+            if jwt_data is not None and ("exp" not in jwt_data or jwt_data["exp"] > time.time()):
+                ctx_stack.top.jwt = jwt_data
+                return
+
+        start = time.perf_counter()
+        verify_jwt_in_request()
+        self.verification_time += time.perf_counter() - start
+        self.verifications += 1
+
+        if token is not None:
+            self.put(key, ctx_stack.top.jwt)
+
+    def jwt_required(self, fn):
+        """
+        Decorator to protect a Flask endpoint, like `flask_jwt_extended.jwt_required`.
+        """
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.verify_request()
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        stats = super(VerifiedTokenCache, self).stats()
+        stats["verifications"] = self.verifications
+        stats["mean_verification_time"] = self.verification_time / self.verifications \
+            if self.verifications > 0 else 0.
+        return stats
+
+
+def get_client_address(request, trusted_proxies=0):
+    """
+    Returns the address of the client of a request. Behind proxies (e.g. a
+    load balancer and nginx), the address is taken from the `X-Forwarded-For`
+    header, where each trusted proxy appends the address it got the request
+    from, so the addresses added before them by the client are ignored.
+    :param request: Flask request object.
+    :param trusted_proxies: Number of proxies in front of the application.
+    :return: Address of the client.
+    """
+    if trusted_proxies > 0:
+        addresses = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",")]
+        if len(addresses) >= trusted_proxies and addresses[-trusted_proxies]:
+            return addresses[-trusted_proxies]
+
+    return request.remote_addr
+
+
+class PasswordVerifier(object):
+    """
+    Verifies the session password of the logins off the request threads, in
+    a small pool of threads, so a burst of logins can't take all the CPU of
+    the worker. The logins are rate limited per client (only the ones that
+    need a verification), and a successful verification is cached for a while
+    so clients logging in again with the right password don't pay for it.
+    """
+
+    def __init__(self, password_hash, max_workers=2, max_pending=16, rate_limit=10, cache_ttl=300.,
+                 timeout=10., max_clients=10000):
+        """
+        :param password_hash: PBKDF2 hash of the session password.
+        :param max_workers: Number of threads of the verification pool.
+        :param max_pending: Maximum number of verifications running or waiting
+            for a thread (the next ones are rejected).
+        :param rate_limit: Maximum number of verifications per minute of a
+            client (0 for no limit).
+        :param cache_ttl: Time (in seconds) a successful verification is cached
+            (0 to not cache them).
+        :param timeout: Maximum time (in seconds) to wait for a verification.
+        :param max_clients: Maximum number of clients tracked by the rate limit.
+        """
+        self.password_hash = password_hash
+        self.max_workers = max_workers
+        self.rate_limit = rate_limit
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.verifications = 0
+        self.cache_hits = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self._verified = LRUCache(1, cache_ttl)
+        self._clients = LRUCache(max_clients)
+        self._key = os.urandom(16)
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _ensure_executor(self):
+        # The threads are started on the first login of each process, since
+        # threads don't survive the fork of the server workers
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.max_workers)
+                    self._pid = os.getpid()
+
+    def _take_rate_token(self, client):
+        # Token bucket per client, refilled at `rate_limit` tokens per minute
+        if self.rate_limit <= 0:
+            return True
+
+        with self._lock:
+            now = time.time()
+            tokens, last = self._clients.get(client, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit / 60.)
+            if tokens < 1:
+                self._clients.put(client, (tokens, now))
+                return False
+            self._clients.put(client, (tokens - 1, now))
+            return True
+
+    def verify(self, password, client):
+        """
+        Verifies a login password.
+        Raise InvalidUsage if the client exceeded its rate limit (429) or the
+        pool is saturated (503).
+        :param password: Password of the login.
+        :param client: Identifier of the client (e.g. its address).
+        :return: Whether the password is valid.
+        """
+        digest = hmac.new(self._key, password.encode("utf-8"), hashlib.sha256).digest()
+        if self.cache_ttl and self._verified.get(digest) is not None:
+            self.cache_hits += 1
+            return True
+
+        if not self._take_rate_token(client):
+            self.rate_limited += 1
+            raise InvalidUsage("Too many login attempts. Please try again later.", status_code=429)
+
+        if not self._pending.acquire(blocking=False):
+            self.rejected += 1
+            raise InvalidUsage("Too many logins in progress. Please try again later.", status_code=503)
+
+        try:
+            self._ensure_executor()
+            future = self._executor.submit(sha256.verify, password, self.password_hash)
+        except Exception:
+            self._pending.release()
+            raise
+
+        # A verification keeps its place in the pool until it finishes, even if its login timed out
+        future.add_done_callback(lambda _: self._pending.release())
+        try:
+            valid = future.result(self.timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise InvalidUsage("Too many logins in progress. Please try again later.", status_code=503)
+
+        self.verifications += 1
+        if valid and self.cache_ttl:
+            self._verified.put(digest, True)
+
+        return valid
+
+    def stats(self):
+        """
+        Returns the statistics of the password verifications.
+        :return: Dictionary with the number of verifications, cache hits, and
+            logins rate limited or rejected.
+        """
+        return {
+            "verifications": self.verifications,
+            "cache_hits": self.cache_hits,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected
+        }
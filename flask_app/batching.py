@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+
+from queue import Empty, Queue
+
+
+class _PendingRequest(object):
+    """
+    Request waiting for its batch to be scored.
+    """
+
+    def __init__(self, data, rank_many):
+        self.data = data
+        self.rank_many = rank_many
+        self.ranking = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """
+    Coalesces the concurrent recommendations of a worker into a single call to
+    the model. The first request of a batch waits at most `window` seconds
+    for other requests (or until `max_batch_size` requests are collected),
+    then the whole batch is scored at once and each request gets its ranking.
+    A request that waits more than `timeout` seconds for its batch (e.g. if
+    the thread of the batches died or is stuck) is scored on its own thread.
+    """
+
+    def __init__(self, rank_many=None, window=0.005, max_batch_size=32, metrics=None, timeout=1.):
+        """
+        :param rank_many: Default function that gets the rankings of a list of users.
+        :param window: Maximum time (in seconds) to wait for the requests of a batch.
+        :param max_batch_size: Maximum number of requests of a batch.
+        :param metrics: Metrics registry to time the stages of the batches with (see flask_app.metrics).
+        :param timeout: Maximum time (in seconds) a request waits for its batch
+            (None to wait until it's scored).
+        """
+        self.rank_many = rank_many
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.metrics = metrics
+        self.timeout = timeout
+        self.timeouts = 0
+        self.batch_sizes = [0] * (max_batch_size + 1)
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # The thread is started on the first request of each process, since
+        # threads don't survive the fork of the server workers, and started
+        # again if it died
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = Queue()
+                    self.batch_sizes = [0] * (self.max_batch_size + 1)
+                    self.timeouts = 0
+                elif self._thread.is_alive():
+                    return
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def rank(self, data, rank_many=None):
+        """
+        Gets the ranking of the movies for the given user, scored in a batch
+        with the other concurrent requests.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :param rank_many: Function to score the request with (defaults to the
+            one of the batcher). Requests with different functions (e.g. of
+            different versions of the model) are scored separately.
+        :return: Ranking of the movies.
+        """
+        self._ensure_worker()
+
+        pending = _PendingRequest(data, rank_many or self.rank_many)
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            self.timeouts += 1
+            return pending.rank_many([data])[0]
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.ranking
+
+    def _run(self):
+        queue = self._queue
+
+        # The stages of the batches (e.g. candidates and predict) are timed on this thread
+        if self.metrics is not None:
+            self.metrics.bind()
+
+        while True:
+            batch = [queue.get()]
+            deadline = time.time() + self.window
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(queue.get(timeout=timeout))
+                except Empty:
+                    break
+
+            groups = {}
+            for pending in batch:
+                groups.setdefault(pending.rank_many, []).append(pending)
+
+            for rank_many, group in groups.items():
+                try:
+                    rankings = rank_many([pending.data for pending in group])
+                    for pending, ranking in zip(group, rankings):
+                        pending.ranking = ranking
+                except Exception as e:
+                    for pending in group:
+                        pending.error = e
+
+            self.batch_sizes[len(batch)] += 1
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self):
+        """
+        Returns the statistics of the achieved batch sizes.
+        :return: Dictionary with the configuration, the number of requests that
+            timed out, the number of batches and requests, and the count of
+            batches of each size.
+        """
+        batch_sizes = list(self.batch_sizes)
+        batches = sum(batch_sizes)
+        requests = sum(size * count for size, count in enumerate(batch_sizes))
+
+        return {
+            "window": self.window,
+            "max_batch_size": self.max_batch_size,
+            "timeouts": self.timeouts,
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": float(requests) / batches if batches > 0 else 0.,
+            "batch_sizes": {str(size): count for size, count in enumerate(batch_sizes) if count > 0}
+        }
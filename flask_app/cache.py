@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread safe in-memory cache with a bounded number of entries. When it is
+    full, the least recently used entry is evicted. Optionally, the entries
+    expire after a given time.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        :param max_size: Maximum number of entries of the cache.
+        :param ttl: Time (in seconds) after which an entry expires (None to never expire).
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Gets the value of a key, and marks it as the most recently used.
+        :param key: Key of the entry.
+        :param default: Value to return if the key is not in the cache.
+        :return: The value of the key.
+        """
+        with self._lock:
+            try:
+                value, expiration = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expiration is not None and expiration <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Adds (or replaces) an entry of the cache.
+        :param key: Key of the entry.
+        :param value: Value of the entry.
+        """
+        if self.max_size <= 0:
+            return
+
+        expiration = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._entries[key] = (value, expiration)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all the entries of the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the statistics of the cache.
+        :return: Dictionary with the size and the counters of the cache.
+        """
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class ModelCache(LRUCache):
+    """
+    LRU cache of the results of a model. All the entries are invalidated when
+    the cache is used with a different model.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        super(ModelCache, self).__init__(max_size, ttl)
+        self.model = None
+        self.invalidations = 0
+
+    def bind(self, model):
+        """
+        Sets the model of the entries of the cache, removing all of them if the
+        model changed.
+        :param model: Model of the results of the cache.
+        """
+        if model is not self.model:
+            with self._lock:
+                if model is not self.model:
+                    if self.model is not None:
+                        self.invalidations += 1
+                    self._entries.clear()
+                    self.model = model
+
+    def get(self, key, default=None, model=None):
+        """
+        Gets the result of the model for a key.
+        :param key: Key of the entry.
+        :param default: Value to return if the key is not in the cache.
+        :param model: Model of the result.
+        :return: The value of the key.
+        """
+        self.bind(model)
+        return super(ModelCache, self).get(key, default)
+
+    def put(self, key, value, model=None):
+        """
+        Adds (or replaces) a result of the model. Results of a model other
+        than the current one are discarded.
+        :param key: Key of the entry.
+        :param value: Value of the entry.
+        :param model: Model of the result.
+        """
+        if self.model is None:
+            self.bind(model)
+        elif model is not self.model:
+            return
+        super(ModelCache, self).put(key, value)
+
+    def stats(self):
+        stats = super(ModelCache, self).stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+class RingBuffer(object):
+    """
+    Thread safe store of the most recent entries, in a fixed number of slots
+    that are reused in insertion order (the oldest entry is overwritten when
+    it is full). A hash index maps each key to its slot, so both adding and
+    getting an entry take constant time, and the memory is strictly bounded.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: Number of slots of the buffer.
+        """
+        self.max_size = max(max_size, 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._keys = [None] * self.max_size
+        self._values = [None] * self.max_size
+        self._index = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key, default=None):
+        """
+        Gets the value of a key.
+        :param key: Key of the entry.
+        :param default: Value to return if the key is not in the buffer.
+        :return: The value of the key.
+        """
+        with self._lock:
+            slot = self._index.get(key)
+            if slot is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return self._values[slot]
+
+    def peek(self, key, default=None):
+        """
+        Gets the value of a key without counting the lookup in the statistics.
+        :param key: Key of the entry.
+        :param default: Value to return if the key is not in the buffer.
+        :return: The value of the key.
+        """
+        with self._lock:
+            slot = self._index.get(key)
+            return default if slot is None else self._values[slot]
+
+    def put(self, key, value):
+        """
+        Adds (or replaces) an entry, overwriting the oldest one if the buffer is full.
+        :param key: Key of the entry.
+        :param value: Value of the entry.
+        """
+        if self.max_size == 0:
+            return
+
+        with self._lock:
+            slot = self._index.get(key)
+            if slot is None:
+                slot = self._next
+                self._next = (self._next + 1) % self.max_size
+                if self._keys[slot] is not None:
+                    del self._index[self._keys[slot]]
+                    self.evictions += 1
+                self._keys[slot] = key
+                self._index[key] = slot
+            self._values[slot] = value
+
+    def stats(self):
+        """
+        Returns the statistics of the buffer.
+        :return: Dictionary with the size, the counters and the hit rate of the buffer.
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._index),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / lookups if lookups > 0 else 0.
+        }
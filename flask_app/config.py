@@ -8,6 +8,7 @@ import os
 
 from passlib.hash import pbkdf2_sha256 as sha256
 
+from flask_app.json_backend import JSON_BACKENDS
 from flask_app.utils import InvalidConfigurationError
 
 
@@ -27,6 +28,84 @@ LOGGING_CONFIG = {
     }
 }
 
+DEFAULT_CONFIG = {
+    "JSON_BACKEND": "flask",
+    "JWT_CACHE_SIZE": 1024,
+    "LOGIN_WORKERS": 2,
+    "LOGIN_MAX_PENDING": 16,
+    "LOGIN_RATE_LIMIT": 10,
+    "LOGIN_CACHE_TTL": 300.,
+    "LOGIN_TIMEOUT": 10.,
+    "TRUSTED_PROXIES": 0,
+    "MODEL_VERSION": None,
+    "MODEL_REGISTRY_PATH": None,
+    "MODEL_REGISTRY_POLL_INTERVAL": 30.,
+    "MODEL_REGISTRY_RETRY_INTERVAL": 300.,
+    "SCORE_TABLE_PATH": None,
+    "PRECOMPUTE_SCORE_TABLE": False,
+    "PREFILTER_CANDIDATES": 0,
+    "INFERENCE_ENGINE": "sklearn",
+    "RANKINGS_CACHE_SIZE": 256,
+    "RECOMMENDATIONS_CACHE_SIZE": 1024,
+    "RECOMMENDATIONS_CACHE_TTL": None,
+    "RECOMMENDATIONS_HISTORY_SIZE": 10000,
+    "SCORE_REQUIRE_RECOMMENDATION": False,
+    "BATCH_MAX_USERS": 1000,
+    "MICRO_BATCHING": False,
+    "MICRO_BATCH_WINDOW": 0.005,
+    "MICRO_BATCH_MAX_SIZE": 32,
+    "MICRO_BATCH_TIMEOUT": 1.,
+    "WARMUP_REQUESTS": 64,
+    "READINESS_P95_BUDGET": None,
+    "READINESS_RETRY_INTERVAL": 10.,
+    "FEEDBACK_PATH": None,
+    "FEEDBACK_FLUSH_INTERVAL": 1.,
+    "FEEDBACK_FLUSH_SIZE": 256,
+    "FEEDBACK_QUEUE_SIZE": 10000,
+    "FEEDBACK_OVERFLOW": "drop",
+    "METRICS_ENABLED": True,
+    "METRICS_DIR": None,
+    "PROFILING_DIR": None,
+    "PROFILING_SAMPLE_RATE": 0.,
+    "PROFILING_WINDOW": 60.,
+    "PROFILING_TOKEN": None,
+    "PROFILING_HEADER": "X-Profile-Token",
+    "LOG_FORMAT": "text",
+    "LOG_QUEUE": False,
+    "LOG_FILE": None,
+    "LOG_FILE_MAX_BYTES": 10 * 1024 * 1024,
+    "LOG_FILE_BACKUP_COUNT": 5
+}
+
+INFERENCE_ENGINES = {"sklearn", "flat"}
+FEEDBACK_OVERFLOW_POLICIES = {"drop", "reject"}
+LOG_FORMATS = {"text", "json"}
+
+
+def get_environment_value(logger, name, value_type=str):
+    """
+    Gets the value of an optional setting from its environment variable.
+    :param logger: Application logger.
+    :param name: Name of the setting (and of the environment variable).
+    :param value_type: Type of the value (str, int, float or bool).
+    :return: The value of the environment variable, or the default value of the
+        setting if it is not set or is not valid.
+    """
+    default = DEFAULT_CONFIG[name]
+    value = os.environ.get(name, None)
+
+    if value is None:
+        return default
+    elif value_type is bool:
+        return value.lower() in {"1", "true", "yes"}
+
+    try:
+        return value_type(value)
+    except ValueError:
+        logger.warn("The %s environment variable is not a valid %s. Setting it to %s." %
+                    (name, value_type.__name__, default))
+        return default
+
 
 def get_config_from_environment(logger):
     config = {}
@@ -64,4 +143,102 @@ def get_config_from_environment(logger):
     else:
         config["SESSION_PASSWORD"] = sha256.hash(session_password)
 
+    # Get the library to decode the requests and encode the responses with
+    if os.environ.get("JSON_BACKEND", None) is not None:
+        if os.environ["JSON_BACKEND"] in JSON_BACKENDS:
+            config["JSON_BACKEND"] = os.environ["JSON_BACKEND"]
+        else:
+            logger.warn("The JSON_BACKEND environment variable is not valid. Setting it to flask.")
+
+    # Get the number of verified tokens to keep
+    config["JWT_CACHE_SIZE"] = get_environment_value(logger, "JWT_CACHE_SIZE", int)
+
+    # Get the verification pool of the logins, their rate limit per client (per minute) and cache
+    config["LOGIN_WORKERS"] = get_environment_value(logger, "LOGIN_WORKERS", int)
+    config["LOGIN_MAX_PENDING"] = get_environment_value(logger, "LOGIN_MAX_PENDING", int)
+    config["LOGIN_RATE_LIMIT"] = get_environment_value(logger, "LOGIN_RATE_LIMIT", int)
+    config["LOGIN_CACHE_TTL"] = get_environment_value(logger, "LOGIN_CACHE_TTL", float)
+    config["LOGIN_TIMEOUT"] = get_environment_value(logger, "LOGIN_TIMEOUT", float)
+
+    # Get the number of proxies in front of the application, to get the address of the clients
+    config["TRUSTED_PROXIES"] = get_environment_value(logger, "TRUSTED_PROXIES", int)
+
+    # Get the version of the model, or the registry with its versions (if any)
+    config["MODEL_VERSION"] = get_environment_value(logger, "MODEL_VERSION")
+    config["MODEL_REGISTRY_PATH"] = get_environment_value(logger, "MODEL_REGISTRY_PATH")
+    config["MODEL_REGISTRY_POLL_INTERVAL"] = get_environment_value(logger, "MODEL_REGISTRY_POLL_INTERVAL", float)
+    config["MODEL_REGISTRY_RETRY_INTERVAL"] = get_environment_value(logger, "MODEL_REGISTRY_RETRY_INTERVAL", float)
+
+    # Get the precomputed score table of the model (if any)
+    config["SCORE_TABLE_PATH"] = get_environment_value(logger, "SCORE_TABLE_PATH")
+    config["PRECOMPUTE_SCORE_TABLE"] = get_environment_value(logger, "PRECOMPUTE_SCORE_TABLE", bool)
+
+    # Get the number of candidates of the first stage of the recommendations (0 to score all the movies)
+    config["PREFILTER_CANDIDATES"] = get_environment_value(logger, "PREFILTER_CANDIDATES", int)
+
+    # Get the number of rankings to keep for the requests of the next pages
+    config["RANKINGS_CACHE_SIZE"] = get_environment_value(logger, "RANKINGS_CACHE_SIZE", int)
+
+    # Get the size and expiration time (in seconds) of the recommendations cache
+    config["RECOMMENDATIONS_CACHE_SIZE"] = get_environment_value(logger, "RECOMMENDATIONS_CACHE_SIZE", int)
+    config["RECOMMENDATIONS_CACHE_TTL"] = get_environment_value(logger, "RECOMMENDATIONS_CACHE_TTL", float)
+
+    # Get the number of recommendations kept to validate their scores, and whether it's required
+    config["RECOMMENDATIONS_HISTORY_SIZE"] = get_environment_value(logger, "RECOMMENDATIONS_HISTORY_SIZE", int)
+    config["SCORE_REQUIRE_RECOMMENDATION"] = get_environment_value(logger, "SCORE_REQUIRE_RECOMMENDATION", bool)
+
+    # Get the maximum number of users of a batch recommendation
+    config["BATCH_MAX_USERS"] = get_environment_value(logger, "BATCH_MAX_USERS", int)
+
+    # Get the micro-batching configuration of the recommendations
+    config["MICRO_BATCHING"] = get_environment_value(logger, "MICRO_BATCHING", bool)
+    config["MICRO_BATCH_WINDOW"] = get_environment_value(logger, "MICRO_BATCH_WINDOW", float)
+    config["MICRO_BATCH_MAX_SIZE"] = get_environment_value(logger, "MICRO_BATCH_MAX_SIZE", int)
+    config["MICRO_BATCH_TIMEOUT"] = get_environment_value(logger, "MICRO_BATCH_TIMEOUT", float)
+
+    # Get the warmup of the model and the latency budget to report the worker as ready
+    config["WARMUP_REQUESTS"] = get_environment_value(logger, "WARMUP_REQUESTS", int)
+    config["READINESS_P95_BUDGET"] = get_environment_value(logger, "READINESS_P95_BUDGET", float)
+    config["READINESS_RETRY_INTERVAL"] = get_environment_value(logger, "READINESS_RETRY_INTERVAL", float)
+
+    # Get the store of the users feedback and how it is written
+    config["FEEDBACK_PATH"] = get_environment_value(logger, "FEEDBACK_PATH")
+    config["FEEDBACK_FLUSH_INTERVAL"] = get_environment_value(logger, "FEEDBACK_FLUSH_INTERVAL", float)
+    config["FEEDBACK_FLUSH_SIZE"] = get_environment_value(logger, "FEEDBACK_FLUSH_SIZE", int)
+    config["FEEDBACK_QUEUE_SIZE"] = get_environment_value(logger, "FEEDBACK_QUEUE_SIZE", int)
+    if os.environ.get("FEEDBACK_OVERFLOW", None) is not None:
+        if os.environ["FEEDBACK_OVERFLOW"] in FEEDBACK_OVERFLOW_POLICIES:
+            config["FEEDBACK_OVERFLOW"] = os.environ["FEEDBACK_OVERFLOW"]
+        else:
+            logger.warn("The FEEDBACK_OVERFLOW environment variable is not valid. Setting it to drop.")
+
+    # Get whether to keep the metrics of the requests, and the directory to share them between workers
+    config["METRICS_ENABLED"] = get_environment_value(logger, "METRICS_ENABLED", bool)
+    config["METRICS_DIR"] = get_environment_value(logger, "METRICS_DIR")
+
+    # Get the directory of the profiles of the requests, and which requests are profiled
+    config["PROFILING_DIR"] = get_environment_value(logger, "PROFILING_DIR")
+    config["PROFILING_SAMPLE_RATE"] = get_environment_value(logger, "PROFILING_SAMPLE_RATE", float)
+    config["PROFILING_WINDOW"] = get_environment_value(logger, "PROFILING_WINDOW", float)
+    config["PROFILING_TOKEN"] = get_environment_value(logger, "PROFILING_TOKEN")
+    config["PROFILING_HEADER"] = get_environment_value(logger, "PROFILING_HEADER")
+
+    # Get the format and handlers of the logs
+    config["LOG_QUEUE"] = get_environment_value(logger, "LOG_QUEUE", bool)
+    config["LOG_FILE"] = get_environment_value(logger, "LOG_FILE")
+    config["LOG_FILE_MAX_BYTES"] = get_environment_value(logger, "LOG_FILE_MAX_BYTES", int)
+    config["LOG_FILE_BACKUP_COUNT"] = get_environment_value(logger, "LOG_FILE_BACKUP_COUNT", int)
+    if os.environ.get("LOG_FORMAT", None) is not None:
+        if os.environ["LOG_FORMAT"] in LOG_FORMATS:
+            config["LOG_FORMAT"] = os.environ["LOG_FORMAT"]
+        else:
+            logger.warn("The LOG_FORMAT environment variable is not valid. Setting it to text.")
+
+    # Get the inference engine for the model
+    if os.environ.get("INFERENCE_ENGINE", None) is not None:
+        if os.environ["INFERENCE_ENGINE"] in INFERENCE_ENGINES:
+            config["INFERENCE_ENGINE"] = os.environ["INFERENCE_ENGINE"]
+        else:
+            logger.warn("The INFERENCE_ENGINE environment variable is not valid. Setting it to sklearn.")
+
     return config
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import numpy as np
+
+
+def get_top_k(scores, k):
+    """
+    Gets the top movies of many users, in the order served by `Ranking.top`
+    (by score, ties broken by the index of the movie).
+    :param scores: Array with the scores of the movies (columns) for each user (rows).
+    :param k: Number of top movies.
+    :return: Array with the indices of the top k movies of each user.
+    """
+    return np.argsort(-scores, axis=1, kind="mergesort")[:, :k]
+
+
+def get_ranking_metrics(top_indices, relevant, k):
+    """
+    Computes the ranking metrics of the top k movies of many users at once.
+    :param top_indices: Array with the indices of (at least) the top k movies of each user.
+    :param relevant: Boolean array with the relevant movies (columns) of each user (rows).
+    :param k: Number of top movies evaluated.
+    :return: Tuple of arrays with the precision@k, recall@k and NDCG@k of
+        each user with relevant movies (the others are skipped).
+    """
+    n_relevant = relevant.sum(axis=1)
+    has_relevant = n_relevant > 0
+    top_indices = top_indices[has_relevant, :k]
+    relevant = relevant[has_relevant]
+    n_relevant = n_relevant[has_relevant]
+
+    hits = relevant[np.arange(relevant.shape[0])[:, np.newaxis], top_indices]
+    n_hits = hits.sum(axis=1)
+
+    discounts = 1. / np.log2(np.arange(2, top_indices.shape[1] + 2))
+    ideal_dcg = np.cumsum(discounts)[np.minimum(n_relevant, top_indices.shape[1]) - 1]
+    ndcg = (hits * discounts).sum(axis=1) / ideal_dcg
+
+    return n_hits / float(k), n_hits / n_relevant.astype(np.float64), ndcg
+
+
+class RankingEvaluation(object):
+    """
+    Precision, recall and NDCG at several values of k, accumulated over
+    blocks of users and averaged over the users with relevant movies.
+    """
+
+    def __init__(self, k_values):
+        """
+        :param k_values: List with the numbers of top movies evaluated.
+        """
+        self.k_values = sorted(k_values)
+        self.n_users = 0
+        self._sums = {k: np.zeros(3) for k in self.k_values}
+
+    def update(self, scores, relevant):
+        """
+        Evaluates the rankings of a block of users.
+        :param scores: Array with the scores of the movies (columns) for each user (rows).
+        :param relevant: Boolean array with the relevant movies of each user.
+        """
+        top_indices = get_top_k(scores, self.k_values[-1])
+        for k in self.k_values:
+            precision, recall, ndcg = get_ranking_metrics(top_indices, relevant, k)
+            self._sums[k] += (precision.sum(), recall.sum(), ndcg.sum())
+        self.n_users += int((relevant.sum(axis=1) > 0).sum())
+
+    def results(self):
+        """
+        Returns the mean metrics over the evaluated users.
+        :return: Dictionary with the precision@k, recall@k and NDCG@k for each k.
+        """
+        results = {}
+        for k in self.k_values:
+            means = self._sums[k] / max(self.n_users, 1)
+            results["precision@%d" % k], results["recall@%d" % k], results["ndcg@%d" % k] = means.tolist()
+
+        return results
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from queue import Empty, Full, Queue
+
+from flask_app.logs import LogEvent
+from flask_app.utils import InvalidUsage
+
+FEEDBACK_FIELDS = ("time", "id", "movie", "score", "predicted_score", "model_version", "age", "gender",
+                   "occupation")
+SQLITE_EXTENSIONS = {".db", ".sqlite", ".sqlite3"}
+
+
+class FeedbackWriter(object):
+    """
+    Writer of the batches of feedback records of a `FeedbackSink`. It is
+    opened by the writer thread when it starts, and closed when it stops.
+    """
+
+    def open(self):
+        pass
+
+    def write(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LogFeedbackWriter(FeedbackWriter):
+    """
+    Writes the feedback records to the application logger.
+    """
+
+    def __init__(self, logger):
+        """
+        :param logger: Application logger.
+        """
+        self.logger = logger
+
+    def write(self, records):
+        for record in records:
+            self.logger.info(LogEvent("score", **record))
+
+
+class JSONLinesFeedbackWriter(FeedbackWriter):
+    """
+    Appends the feedback records to a file, one JSON object per line.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to the feedback file.
+        """
+        self.path = path
+
+    def write(self, records):
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+        # A single append per batch, so the batches of the different workers don't mix
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+class SQLiteFeedbackWriter(FeedbackWriter):
+    """
+    Inserts the feedback records in a table of a SQLite database, with a
+    connection opened (and the table created) when the writer thread starts.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to the database file.
+        """
+        self.path = path
+        self._connection = None
+
+    def open(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS feedback " +
+                               "(time REAL, id TEXT, movie TEXT, score REAL, predicted_score REAL, " +
+                               "model_version TEXT, age INTEGER, gender TEXT, occupation TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS feedback_id ON feedback (id)")
+        self._connection = connection
+
+    def write(self, records):
+        # The connection is opened again if it couldn't be opened when the thread started
+        if self._connection is None:
+            self.open()
+
+        with self._connection:
+            self._connection.executemany("INSERT INTO feedback VALUES (%s)" % ", ".join("?" * len(FEEDBACK_FIELDS)),
+                                         [tuple(record.get(field) for field in FEEDBACK_FIELDS)
+                                          for record in records])
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def get_feedback_writer(path, logger):
+    """
+    Returns the writer for the feedback store of the given path: a SQLite
+    database for the `.db`, `.sqlite` and `.sqlite3` extensions, a JSON lines
+    file otherwise, or the application logger if there's no path.
+    :param path: Path to the feedback store (or None).
+    :param logger: Application logger.
+    :return: Feedback writer.
+    """
+    if path is None:
+        return LogFeedbackWriter(logger)
+    elif os.path.splitext(path)[1] in SQLITE_EXTENSIONS:
+        return SQLiteFeedbackWriter(path)
+    else:
+        return JSONLinesFeedbackWriter(path)
+
+
+def read_feedback(path):
+    """
+    Reads back the records of a feedback store written by a `FeedbackSink`.
+    :param path: Path to the feedback store (JSON lines file or SQLite database).
+    :return: Iterator over the dictionaries of the records, in writing order.
+    """
+    if not os.path.exists(path):
+        return
+    elif os.path.splitext(path)[1] in SQLITE_EXTENSIONS:
+        connection = sqlite3.connect(path)
+        try:
+            for row in connection.execute("SELECT %s FROM feedback ORDER BY rowid" % ", ".join(FEEDBACK_FIELDS)):
+                yield dict(zip(FEEDBACK_FIELDS, row))
+        finally:
+            connection.close()
+    else:
+        with open(path, "r") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class FeedbackSink(object):
+    """
+    Bounded in-memory queue of feedback records, drained by a background
+    thread that writes them in batches: a batch is written when it reaches
+    `flush_size` records or `flush_interval` seconds after its first record.
+    Adding a record never waits for the writer: when the queue is full the
+    record is either dropped or rejected, depending on the overflow policy.
+    """
+
+    def __init__(self, writer, flush_interval=1., flush_size=256, max_queue_size=10000, overflow="drop",
+                 logger=None):
+        """
+        :param writer: Writer of the batches of records (see `get_feedback_writer`).
+        :param flush_interval: Maximum time (in seconds) a record waits to be written.
+        :param flush_size: Maximum number of records of a batch.
+        :param max_queue_size: Maximum number of records waiting to be written.
+        :param overflow: What to do with a record when the queue is full: "drop"
+            it or "reject" the request.
+        :param logger: Application logger.
+        """
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_size = max(flush_size, 1)
+        self.max_queue_size = max(max_queue_size, 1)
+        self.overflow = overflow
+        self.logger = logger
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = Queue(self.max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_writer(self):
+        # The thread is started on the first record of each process, since
+        # threads don't survive the fork of the server workers
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = Queue(self.max_queue_size)
+                    self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+                    atexit.register(self.close)
+
+    def put(self, data, recommendation=None):
+        """
+        Queues a feedback record to be written.
+        Raise InvalidUsage if the queue is full and the overflow policy is "reject".
+        :param data: Dictionary with the feedback data (id, movie, score).
+        :param recommendation: Dictionary with the results of the recommendation
+            of the feedback, as kept by the server (predicted_score,
+            model_version, age, gender, occupation), or None if unknown (the
+            fields of the record are null).
+        :return: Whether the record was queued.
+        """
+        self._ensure_writer()
+
+        record = {field: (recommendation or {}).get(field) for field in FEEDBACK_FIELDS[4:]}
+        record.update(time=time.time(), id=data["id"], movie=data["movie"], score=float(data["score"]))
+
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except Full:
+            if self.overflow == "reject":
+                raise InvalidUsage("The feedback queue is full, try again later", status_code=503)
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=5.):
+        """
+        Writes the queued records and stops the writer thread.
+        :param timeout: Maximum time (in seconds) to wait for the writer.
+        """
+        if self._pid == os.getpid() and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except Full:
+                return
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self.writer.open()
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.error("There was an exception while opening the feedback store: %s" % e)
+
+        try:
+            self._drain()
+        finally:
+            self.writer.close()
+
+    def _drain(self):
+        closed = False
+
+        while not closed:
+            record = self._queue.get()
+            if record is None:
+                break
+
+            batch = [record]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                try:
+                    record = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    break
+                if record is None:
+                    closed = True
+                    break
+                batch.append(record)
+
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.writer.write(batch)
+            self.written += len(batch)
+            self.batches += 1
+            return
+        except Exception as e:
+            error = e
+
+        if len(batch) > 1:
+            # Retry the records one by one, so an invalid record doesn't lose the rest of the batch
+            if self.logger is not None:
+                self.logger.warn("There was an exception while writing %d feedback records, writing them one " %
+                                 len(batch) + "by one: %s" % error)
+            for record in batch:
+                self._write([record])
+        else:
+            self.errors += 1
+            if self.logger is not None:
+                self.logger.error("There was an exception while writing a feedback record: %s" % error)
+
+    def stats(self):
+        """
+        Returns the statistics of the feedback sink.
+        :return: Dictionary with the queued, written and dropped records, the
+            number of batches and the number of records that couldn't be written.
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors
+        }
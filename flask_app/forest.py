@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import os
+import numpy as np
+
+from scipy.sparse import issparse
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestRegressor
+
+TREE_LEAF = -1
+
+
+def get_trees(estimator):
+    """
+    Returns the list of decision trees of a tree based estimator.
+    Raise ValueError if the estimator is not tree based.
+    :param estimator: Fitted scikit-learn estimator (tree or ensemble of trees).
+    :return: List of fitted decision trees.
+    """
+    if hasattr(estimator, "tree_"):
+        return [estimator]
+    elif hasattr(estimator, "estimators_"):
+        estimators = estimator.estimators_
+        if isinstance(estimators, np.ndarray):
+            estimators = estimators.ravel()
+        return [tree for estimator in estimators for tree in get_trees(estimator)]
+    else:
+        raise ValueError("The estimator %s is not tree based" % type(estimator).__name__)
+
+
+def get_sparse_keys(X):
+    """
+    Returns the sorted keys (row * n_features + column) of the non zero
+    features of a sparse matrix with their values, so any feature of any row
+    can be looked up with a binary search.
+    :param X: Sparse matrix.
+    :return: Tuple with the sorted keys and the values of the features.
+    """
+    X = X.tocsr()
+    rows = np.repeat(np.arange(X.shape[0], dtype=np.int64), np.diff(X.indptr))
+    keys = rows * X.shape[1] + X.indices
+    order = np.argsort(keys, kind="mergesort")
+
+    # Trees compare the features as float32 values
+    return keys[order], X.data[order].astype(np.float32)
+
+
+class FlatForest(object):
+    """
+    Tree ensemble regressor stored as flat arrays of nodes (the nodes of all
+    the trees are concatenated one after the other). As it only depends on
+    plain arrays, it can be loaded as memory-mapped files and shared between
+    the processes of the server.
+    """
+
+    ARRAYS = ("feature", "threshold", "children_left", "children_right", "value", "roots")
+
+    # Maximum number of (sample, tree) pairs evaluated at the same time
+    max_block_size = 2 ** 20
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots):
+        """
+        :param feature: Array with the feature of the split of each node.
+        :param threshold: Array with the threshold of the split of each node.
+        :param children_left: Array with the index of the left child of each node
+            (TREE_LEAF for leaves).
+        :param children_right: Array with the index of the right child of each
+            node (TREE_LEAF for leaves).
+        :param value: Array with the value of each node.
+        :param roots: Array with the index of the root node of each tree.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """
+        Builds the flat forest from a scikit-learn regression tree or forest.
+        Raise ValueError if the estimator is not supported.
+        :param estimator: Fitted scikit-learn estimator.
+        :return: The flat forest.
+        """
+        if not (hasattr(estimator, "tree_") or isinstance(estimator, (RandomForestRegressor,
+                                                                      ExtraTreesRegressor))):
+            raise ValueError("The estimator %s is not supported" % type(estimator).__name__)
+
+        trees = [tree.tree_ for tree in get_trees(estimator)]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("Only single output estimators are supported")
+
+        roots = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        children_left = [np.where(tree.children_left == TREE_LEAF, TREE_LEAF, tree.children_left + root)
+                         for tree, root in zip(trees, roots)]
+        children_right = [np.where(tree.children_right == TREE_LEAF, TREE_LEAF, tree.children_right + root)
+                          for tree, root in zip(trees, roots)]
+
+        return cls(np.concatenate([tree.feature for tree in trees]).astype(np.int32),
+                   np.concatenate([tree.threshold for tree in trees]).astype(np.float64),
+                   np.concatenate(children_left).astype(np.int32),
+                   np.concatenate(children_right).astype(np.int32),
+                   np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64),
+                   roots.astype(np.int32))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Loads a flat forest saved with `FlatForest.save`.
+        :param path: Path to the directory of the forest.
+        :param mmap_mode: Memory-map mode for the arrays (see `numpy.load`).
+        :return: The flat forest.
+        """
+        return cls(*[np.load(os.path.join(path, "%s.npy" % name), mmap_mode=mmap_mode)
+                     for name in cls.ARRAYS])
+
+    def save(self, path):
+        """
+        Saves the arrays of the flat forest in a directory.
+        :param path: Path to the directory of the forest.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, "%s.npy" % name), getattr(self, name))
+
+    @property
+    def n_trees(self):
+        return self.roots.shape[0]
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def get_depths(self):
+        """
+        Returns the depth of each node in its tree.
+        :return: Array with the depth of each node (the roots have depth 0).
+        """
+        depths = np.zeros(self.feature.shape[0], dtype=np.int32)
+        nodes = self.roots.astype(np.intp)
+        depth = 0
+
+        while nodes.shape[0] > 0:
+            depths[nodes] = depth
+            nodes = nodes[self.children_left[nodes] != TREE_LEAF]
+            nodes = np.concatenate([self.children_left[nodes], self.children_right[nodes]]).astype(np.intp)
+            depth += 1
+
+        return depths
+
+    def compact(self, max_depth=None, merge_tolerance=None, dtype=np.float32):
+        """
+        Builds a compact copy of the forest: the trees are cut at a maximum
+        depth (the nodes at that depth become leaves with the value of the node,
+        i.e. the mean of their training samples), the subtrees whose leaves have
+        values closer than the tolerance are merged in a single leaf, and the
+        thresholds and values are stored with the given type. The thresholds
+        are rounded down, so every split takes the same decisions (the features
+        are compared as float32 values), and only the values lose precision.
+        :param max_depth: Maximum depth of the trees (None to keep every level).
+        :param merge_tolerance: Maximum difference between the values of the
+            leaves of a merged subtree (None to not merge the leaves).
+        :param dtype: Type of the thresholds and values (float32 or float64).
+        :return: The compact flat forest.
+        """
+        children_left = self.children_left.astype(np.intp)
+        children_right = self.children_right.astype(np.intp)
+
+        if max_depth is not None:
+            cut = self.get_depths() >= max_depth
+            children_left[cut] = TREE_LEAF
+            children_right[cut] = TREE_LEAF
+
+        if merge_tolerance is not None:
+            # Merge the subtrees bottom up, tracking the range of the values of their leaves
+            min_value = self.value.astype(np.float64)
+            max_value = min_value.copy()
+            while True:
+                internal = np.flatnonzero(children_left != TREE_LEAF)
+                left = children_left[internal]
+                right = children_right[internal]
+                mergeable = (children_left[left] == TREE_LEAF) & (children_left[right] == TREE_LEAF)
+                internal, left, right = internal[mergeable], left[mergeable], right[mergeable]
+                subtree_min = np.minimum(min_value[left], min_value[right])
+                subtree_max = np.maximum(max_value[left], max_value[right])
+                merged = subtree_max - subtree_min <= merge_tolerance
+                if not merged.any():
+                    break
+                internal = internal[merged]
+                min_value[internal] = subtree_min[merged]
+                max_value[internal] = subtree_max[merged]
+                children_left[internal] = TREE_LEAF
+                children_right[internal] = TREE_LEAF
+
+        # Keep the nodes still reachable from the roots (in the same order)
+        reachable = np.zeros(self.feature.shape[0], dtype=np.bool_)
+        nodes = self.roots.astype(np.intp)
+        while nodes.shape[0] > 0:
+            reachable[nodes] = True
+            nodes = nodes[children_left[nodes] != TREE_LEAF]
+            nodes = np.concatenate([children_left[nodes], children_right[nodes]])
+        new_index = np.cumsum(reachable) - 1
+
+        children_left = children_left[reachable]
+        children_right = children_right[reachable]
+        leaves = children_left == TREE_LEAF
+        children_left = np.where(leaves, TREE_LEAF, new_index[children_left]).astype(np.int32)
+        children_right = np.where(leaves, TREE_LEAF, new_index[children_right]).astype(np.int32)
+
+        threshold = self.threshold[reachable]
+        compact_threshold = threshold.astype(dtype)
+        rounded_up = compact_threshold > threshold
+        compact_threshold[rounded_up] = np.nextafter(compact_threshold[rounded_up], -np.inf)
+
+        feature = self.feature[reachable]
+        feature_dtype = np.int16 if feature.max(initial=0) <= np.iinfo(np.int16).max else np.int32
+
+        return FlatForest(feature.astype(feature_dtype), compact_threshold, children_left, children_right,
+                          self.value[reachable].astype(dtype), new_index[self.roots].astype(np.int32))
+
+    def predict(self, X):
+        """
+        Predicts the values of the given samples as the mean of the
+        predictions of every tree. All the trees are evaluated at the same
+        time, moving every (sample, tree) pair one level down per iteration,
+        without any of the input validation done by scikit-learn.
+        :param X: Dense array or sparse matrix with the samples.
+        :return: Array with the predicted value of each sample.
+        """
+        if issparse(X):
+            keys, values = get_sparse_keys(X)
+            n_features = X.shape[1]
+
+            def get_values(rows, features):
+                queries = rows * n_features + features
+                positions = np.minimum(np.searchsorted(keys, queries), keys.shape[0] - 1)
+                return np.where(keys[positions] == queries, values[positions], 0)
+        else:
+            # Trees compare the features as float32 values
+            X = np.asarray(X, dtype=np.float32)
+
+            def get_values(rows, features):
+                return X[rows, features]
+
+        n_samples = X.shape[0]
+        block_size = max(self.max_block_size // self.n_trees, 1)
+        predictions = np.empty(n_samples, dtype=np.float64)
+
+        # Bound the memory by evaluating the samples in blocks
+        for start in range(0, n_samples, block_size):
+            end = min(start + block_size, n_samples)
+            rows = np.repeat(np.arange(start, end), self.n_trees)
+            nodes = np.tile(self.roots.astype(np.intp), end - start)
+            active = np.flatnonzero(self.children_left[nodes] != TREE_LEAF)
+
+            while active.shape[0] > 0:
+                node = nodes[active]
+                go_left = get_values(rows[active], self.feature[node]) <= self.threshold[node]
+                nodes[active] = np.where(go_left, self.children_left[node], self.children_right[node])
+                active = active[self.children_left[nodes[active]] != TREE_LEAF]
+
+            leaf_values = self.value[nodes].reshape(end - start, self.n_trees)
+            predictions[start:end] = leaf_values.mean(axis=1, dtype=np.float64)
+
+        return predictions
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import json
+
+from flask import Request, current_app, jsonify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+JSON_BACKENDS = {"flask", "json", "orjson", "ujson"}
+
+
+def get_json_functions(name):
+    """
+    Returns the functions to decode and encode JSON of a backend.
+    Raise ValueError if the backend is not available.
+    :param name: Name of the backend ("json", "orjson" or "ujson").
+    :return: Tuple with the loads and dumps functions.
+    """
+    if name == "orjson" and orjson is not None:
+        return orjson.loads, orjson.dumps
+    elif name == "ujson" and ujson is not None:
+        return ujson.loads, ujson.dumps
+    elif name == "json":
+        return json.loads, lambda data: json.dumps(data, separators=(",", ":"))
+    else:
+        raise ValueError("The JSON backend %s is not available" % name)
+
+
+class JSONBackend(object):
+    """
+    Decoding of the JSON requests and encoding of the JSON responses. The
+    "flask" backend is the one of Flask (`request.get_json` and `jsonify`);
+    the others parse the body of the requests and serialize the responses
+    directly with the given library, skipping the extra work done by Flask.
+    """
+
+    def __init__(self, name="flask"):
+        """
+        :param name: Name of the backend (see `JSON_BACKENDS`).
+        """
+        self.name = name
+        if name == "flask":
+            self.loads = self.dumps = None
+        else:
+            self.loads, self.dumps = get_json_functions(name)
+
+    def init_app(self, app):
+        """
+        Sets the request class of the application to decode the requests with the backend.
+        :param app: Flask application.
+        """
+        if self.loads is not None:
+            app.request_class = type("JSONRequest", (JSONRequest,), {"json_loads": staticmethod(self.loads)})
+
+    def jsonify(self, data):
+        """
+        Builds the JSON response of the data with the backend.
+        :param data: Data to serialize.
+        :return: Response object.
+        """
+        if self.dumps is None:
+            return jsonify(data)
+
+        return current_app.response_class(self.dumps(data), mimetype="application/json")
+
+
+class JSONRequest(Request):
+    """
+    Request that decodes its JSON body with the `json_loads` function.
+    """
+
+    json_loads = staticmethod(json.loads)
+
+    def get_json(self, force=False, silent=False, cache=True):
+        if not (force or self.is_json):
+            return None
+
+        cached_json = getattr(self, "_decoded_json", None)
+        if cached_json is not None:
+            return cached_json
+
+        try:
+            data = self.json_loads(self.get_data(cache=cache))
+        except ValueError as e:
+            if silent:
+                return None
+            return self.on_json_loading_failed(e)
+
+        if cache:
+            self._decoded_json = data
+
+        return data
+
+    @property
+    def json(self):
+        return self.get_json()
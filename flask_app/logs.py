@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import atexit
+import json
+import logging
+import os
+import threading
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Queue
+
+
+def format_movies(movies):
+    return ";".join('"%s"' % m.replace('"', '\\"') for m in movies)
+
+
+def format_results(results):
+    return ";".join("%.2f" % r for r in results)
+
+
+def format_recommendation_event(fields):
+    data = fields["data"]
+    data_log = "\nREQUEST RESULT LOG\n"
+    data_log += "REQUEST_ID: %s\n" % fields["id"]
+    data_log += "MODEL_VERSION: %s\n" % fields["model_version"]
+    data_log += "DATA: Age=%d Gender=%s Occupation=%s\n" % (data["age"], data["gender"], data["occupation"])
+    data_log += "MOVIES: %s\n" % format_movies(fields["movies"])
+    data_log += "RESULTS: %s" % format_results(fields["results"])
+
+    return data_log
+
+
+def format_page_event(fields):
+    data_log = "\nREQUEST PAGE LOG\n"
+    data_log += "REQUEST_ID: %s\n" % fields["id"]
+    data_log += "MODEL_VERSION: %s\n" % fields["model_version"]
+    data_log += "OFFSET: %d\n" % fields["offset"]
+    data_log += "MOVIES: %s\n" % format_movies(fields["movies"])
+    data_log += "RESULTS: %s" % format_results(fields["results"])
+
+    return data_log
+
+
+def format_score_event(fields):
+    data_log = "\nREQUEST SCORE LOG\n"
+    data_log += "REQUEST: %s\n" % fields["id"]
+    data_log += "MOVIE: %s\n" % fields["movie"]
+    data_log += "SCORE: %.2f" % fields["score"]
+
+    return data_log
+
+
+EVENT_FORMATTERS = {
+    "recommendation": format_recommendation_event,
+    "page": format_page_event,
+    "score": format_score_event
+}
+
+
+class LogEvent(object):
+    """
+    Message of a structured log record: the name of the event and its fields.
+    The message is only rendered when the record is formatted (by the
+    listener thread if the logs are queued): as the text of the event for the
+    text format, or as the fields themselves for the JSON format.
+    """
+
+    def __init__(self, event, **fields):
+        """
+        :param event: Name of the event (see `EVENT_FORMATTERS`).
+        :param fields: Fields of the event.
+        """
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        return EVENT_FORMATTERS[self.event](self.fields)
+
+
+def get_json_value(value):
+    # Arrays and scalars of numpy, and ids, as plain JSON values
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats each log record as a compact JSON object in a single line, with
+    the fields of the structured events as typed values.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name
+        }
+        if isinstance(record.msg, LogEvent):
+            entry["event"] = record.msg.event
+            entry.update(record.msg.fields)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, separators=(",", ":"), default=get_json_value)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Handler that only enqueues the records, to be formatted and written by a
+    listener thread with the given handlers. Unlike `QueueHandler`, the
+    records are not formatted before being enqueued, so the request thread
+    doesn't pay for it.
+    """
+
+    def __init__(self, handlers):
+        """
+        :param handlers: Handlers to write the records with.
+        """
+        super(LogQueueHandler, self).__init__(Queue())
+        self.handlers = handlers
+        self.listener = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_listener(self):
+        # The thread is started on the first record of each process, since
+        # threads don't survive the fork of the server workers
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.queue = Queue()
+                    self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+                    self.listener.start()
+                    self._pid = os.getpid()
+                    atexit.register(self.stop)
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        self.queue.put_nowait(record)
+
+    def stop(self):
+        """
+        Writes the queued records and stops the listener thread.
+        """
+        if self._pid == os.getpid() and self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
+def setup_logging(config):
+    """
+    Sets the handlers of the root logger from the logging settings of the
+    application configuration: the format of the records, the rotating log file
+    (if any) and whether the records are written by a background thread.
+    :param config: Application configuration.
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+
+    if config["LOG_FILE"] is not None:
+        file_handler = RotatingFileHandler(config["LOG_FILE"], maxBytes=config["LOG_FILE_MAX_BYTES"],
+                                           backupCount=config["LOG_FILE_BACKUP_COUNT"])
+        file_handler.setFormatter(handlers[0].formatter if handlers else None)
+        handlers.append(file_handler)
+
+    if config["LOG_FORMAT"] == "json":
+        for handler in handlers:
+            handler.setFormatter(JSONFormatter())
+
+    if config["LOG_QUEUE"]:
+        handlers = [LogQueueHandler(handlers)]
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
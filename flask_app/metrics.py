@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import glob
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+# Stages of the recommendations timed with `stage`
+STAGES = ("validation", "cache", "candidates", "predict", "ranking", "logging", "serialization")
+STAGE_HISTOGRAM = "recommend_stage_duration_seconds"
+
+_local = threading.local()
+
+
+def is_process_alive(pid):
+    """
+    Checks whether a process is running.
+    :param pid: Id of the process.
+    :return: Whether the process exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_labels_text(labels):
+    return ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for name, value in labels)
+
+
+class MetricsRegistry(object):
+    """
+    Counters and histograms stored in a flat array of values, one per process.
+    All the series are declared before the registry is used (before the fork
+    of the server workers), so every process has the same layout. If a
+    directory is given, the array of each process is a memory-mapped file in
+    it and the metrics are aggregated over the files of all the processes,
+    otherwise they are only kept in memory. The files of the processes that
+    are no longer running are removed when the registry is created.
+    """
+
+    def __init__(self, path=None, buckets=DEFAULT_BUCKETS):
+        """
+        :param path: Directory of the files of the processes (None to keep the
+            metrics in memory).
+        :param buckets: Upper bounds (in seconds) of the buckets of the histograms.
+        """
+        self.path = path
+        self.buckets = list(buckets)
+        self.metrics = []
+        self._offsets = {}
+        self._descriptions = {}
+        self._size = 0
+        self._layout = None
+        self._values = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+        if self.path is not None:
+            self.remove_dead_processes()
+
+    def remove_dead_processes(self):
+        """
+        Removes the files of the processes that are no longer running, so the
+        metrics of the previous runs of the server are not aggregated.
+        """
+        for path in glob.glob(os.path.join(self.path, "metrics-*-*.npy")):
+            pid = os.path.splitext(os.path.basename(path))[0].rsplit("-", 1)[1]
+            if pid.isdigit() and not is_process_alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _add(self, metric_type, name, description, labels_list):
+        if name not in self._descriptions:
+            self._descriptions[name] = (metric_type, description)
+            self.metrics.append(name)
+
+        width = 1 if metric_type == "counter" else len(self.buckets) + 2
+        for labels in labels_list:
+            labels = tuple(sorted(labels.items()))
+            if (name, labels) not in self._offsets:
+                self._offsets[name, labels] = self._size
+                self._size += width
+
+        self._layout = None
+
+    def add_counter(self, name, description, labels_list=({},)):
+        """
+        Declares a counter with a series for each set of labels.
+        :param name: Name of the counter.
+        :param description: Help text of the counter.
+        :param labels_list: List of dictionaries with the labels of each series.
+        """
+        self._add("counter", name, description, labels_list)
+
+    def add_histogram(self, name, description, labels_list=({},)):
+        """
+        Declares a histogram with a series for each set of labels.
+        :param name: Name of the histogram.
+        :param description: Help text of the histogram.
+        :param labels_list: List of dictionaries with the labels of each series.
+        """
+        self._add("histogram", name, description, labels_list)
+
+    @property
+    def layout(self):
+        # Identifies the layout, so the files of other layouts are not aggregated
+        if self._layout is None:
+            layout = repr((sorted(self._offsets.items()), self.buckets)).encode("utf-8")
+            self._layout = hashlib.sha1(layout).hexdigest()[:12]
+        return self._layout
+
+    def _ensure_values(self):
+        # The array is created on the first use of each process, since the
+        # server workers are forked after the series are declared
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self.path is None:
+                        self._values = np.zeros(self._size, dtype=np.float64)
+                    else:
+                        os.makedirs(self.path, exist_ok=True)
+                        path = os.path.join(self.path, "metrics-%s-%d.npy" % (self.layout, os.getpid()))
+                        self._values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64,
+                                                                 shape=(self._size,))
+                    self._pid = os.getpid()
+        return self._values
+
+    def inc(self, name, labels=(), value=1):
+        """
+        Increments a series of a counter.
+        :param name: Name of the counter.
+        :param labels: Tuple with the (sorted) label pairs of the series.
+        :param value: Value to add to the counter.
+        """
+        offset = self._offsets.get((name, labels))
+        if offset is None:
+            return
+
+        values = self._ensure_values()
+        with self._lock:
+            values[offset] += value
+
+    def observe(self, name, labels, value):
+        """
+        Adds an observation to a series of a histogram.
+        :param name: Name of the histogram.
+        :param labels: Tuple with the (sorted) label pairs of the series.
+        :param value: Observed value.
+        """
+        offset = self._offsets.get((name, labels))
+        if offset is None:
+            return
+
+        values = self._ensure_values()
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            values[offset + bucket] += 1
+            values[offset + len(self.buckets) + 1] += value
+
+    def collect(self):
+        """
+        Returns the values of the metrics aggregated over all the processes.
+        :return: Array with the values of the series.
+        """
+        if self.path is None:
+            return self._ensure_values().copy()
+
+        values = np.zeros(self._size, dtype=np.float64)
+        for path in glob.glob(os.path.join(self.path, "metrics-%s-*.npy" % self.layout)):
+            try:
+                process_values = np.load(path, mmap_mode="r")
+            except (IOError, ValueError):
+                continue
+            if process_values.shape == values.shape:
+                values += process_values
+
+        return values
+
+    def render(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        :return: Text with the metrics.
+        """
+        values = self.collect()
+        series = {}
+        for (name, labels), offset in sorted(self._offsets.items(), key=lambda item: item[1]):
+            series.setdefault(name, []).append((labels, offset))
+
+        lines = []
+        for name in self.metrics:
+            metric_type, description = self._descriptions[name]
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+
+            for labels, offset in series.get(name, []):
+                labels_text = get_labels_text(labels)
+                suffix = "{%s}" % labels_text if labels_text else ""
+                if metric_type == "counter":
+                    lines.append("%s%s %r" % (name, suffix, float(values[offset])))
+                    continue
+
+                counts = np.cumsum(values[offset:offset + len(self.buckets) + 1])
+                prefix = labels_text + "," if labels_text else ""
+                for bound, count in zip(self.buckets + ["+Inf"], counts):
+                    lines.append('%s_bucket{%sle="%s"} %r' % (name, prefix, bound, float(count)))
+                lines.append("%s_sum%s %r" % (name, suffix, float(values[offset + len(self.buckets) + 1])))
+                lines.append("%s_count%s %r" % (name, suffix, float(counts[-1])))
+
+        return "\n".join(lines) + "\n"
+
+    def bind(self):
+        """
+        Binds the registry to the current thread, to record the stages timed with `stage`.
+        """
+        _local.registry = self
+
+    def unbind(self):
+        """
+        Unbinds the registry of the current thread.
+        """
+        _local.registry = None
+
+
+class _Stage(object):
+    __slots__ = ("registry", "labels", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.labels = (("stage", name),)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.registry.observe(STAGE_HISTOGRAM, self.labels, time.perf_counter() - self.start)
+
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """
+    Times a stage of the request with the registry bound to the current thread
+    (if any), e.g. `with stage("predict"): ...`.
+    :param name: Name of the stage.
+    :return: Context manager that times the stage.
+    """
+    registry = getattr(_local, "registry", None)
+    if registry is None:
+        return _NO_STAGE
+
+    return _Stage(registry, name)
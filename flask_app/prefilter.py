@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import numpy as np
+
+from flask_app.evaluation import get_top_k
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS
+
+# Ages of the representative users of the age bands
+DEFAULT_AGES = tuple(range(10, 71, 5))
+
+
+class DemographicPrefilter(object):
+    """
+    First stage of the two-stage recommendations: the top movies of each
+    demographic group (gender, occupation and age band), as scored by the
+    model for a representative user of the group when the prefilter is built.
+    On each request only the candidates of the group of the user are scored
+    by the model, so the rankings have just those movies.
+    """
+
+    def __init__(self, ages, genders, occupations, candidates):
+        """
+        :param ages: Sorted list of ages of the representative users of the age bands.
+        :param genders: List of genders of the prefilter.
+        :param occupations: List of occupations of the prefilter.
+        :param candidates: Array (ages x genders x occupations x candidates)
+            with the sorted indices of the candidate movies of each group.
+        """
+        self.ages = np.asarray(ages, dtype=np.float64)
+        self.genders = list(genders)
+        self.occupations = list(occupations)
+        self.candidates = candidates
+        self._age_bounds = (self.ages[:-1] + self.ages[1:]) / 2
+        self._genders_index = {g: i for i, g in enumerate(self.genders)}
+        self._occupations_index = {o: i for i, o in enumerate(self.occupations)}
+
+    @property
+    def n_candidates(self):
+        return self.candidates.shape[-1]
+
+    @classmethod
+    def build(cls, recommender, n_candidates, ages=DEFAULT_AGES, genders=VALID_GENDERS,
+              occupations=VALID_OCCUPATIONS):
+        """
+        Builds the prefilter scoring the representative user of every group against all the movies.
+        :param recommender: Recommender with the model to build the prefilter for.
+        :param n_candidates: Number of candidate movies of each group.
+        :param ages: Ages of the representative users of the age bands.
+        :param genders: Genders to add to the prefilter.
+        :param occupations: Occupations to add to the prefilter.
+        :return: The prefilter.
+        """
+        ages = sorted(ages)
+        genders = sorted(genders)
+        occupations = sorted(occupations)
+
+        users = [{"age": age, "gender": gender, "occupation": occupation}
+                 for age in ages for gender in genders for occupation in occupations]
+        top_indices = get_top_k(recommender.predict_many(users), n_candidates)
+        candidates = np.sort(top_indices, axis=1).astype(np.int32)
+
+        return cls(ages, genders, occupations,
+                   candidates.reshape(len(ages), len(genders), len(occupations), candidates.shape[-1]))
+
+    def lookup(self, data):
+        """
+        Gets the candidate movies for the given user.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :return: Sorted array with the indices of the candidate movies, or None
+            if the user is not in the prefilter.
+        """
+        gender = self._genders_index.get(data["gender"])
+        occupation = self._occupations_index.get(data["occupation"])
+        if gender is None or occupation is None:
+            return None
+
+        age = np.searchsorted(self._age_bounds, data["age"], side="left")
+
+        return self.candidates[age, gender, occupation]
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import atexit
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+
+def get_route_slug(route):
+    return re.sub(r"[^A-Za-z0-9]+", "-", route).strip("-") or "index"
+
+
+class RequestProfiler(object):
+    """
+    Profiles a sample of the requests with cProfile: a fraction of them chosen
+    at random, and the ones with the debug token in the profiling header. The
+    profiles are aggregated per route and dumped every `window` seconds as
+    pstats files (loadable by `pstats`, snakeviz, etc.) by a background thread,
+    so the requests only collect their profiles. A single request is profiled
+    at a time in each process, so the overhead is bounded.
+    """
+
+    def __init__(self, path, sample_rate=0., window=60., token=None, header="X-Profile-Token", logger=None):
+        """
+        :param path: Directory to dump the profiles to.
+        :param sample_rate: Fraction of the requests to profile.
+        :param window: Time (in seconds) the profiles are aggregated before dumping them.
+        :param token: Token that requests the profile of a request in the header
+            (None to only profile the sampled requests).
+        :param header: Name of the header with the debug token.
+        :param logger: Application logger.
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.window = window
+        self.token = token
+        self.header = header
+        self.logger = logger
+        self.profiled = 0
+        self.dumps = 0
+        self._profiles = {}
+        self._window_start = time.time()
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def should_profile(self, request):
+        """
+        Decides whether to profile a request.
+        :param request: Flask request object.
+        :return: Whether the request is sampled or has the debug token.
+        """
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+
+        # The tokens are compared as bytes, since the strings can only be compared if they are ASCII
+        token = request.headers.get(self.header)
+        return token is not None and self.token is not None and \
+            hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def start(self):
+        """
+        Starts profiling the current request.
+        :return: The profile, or None if another request is being profiled.
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in the process
+            self._busy.release()
+            return None
+
+        return profile
+
+    def stop(self, profile, route):
+        """
+        Stops profiling the current request and adds its profile to the ones of
+        its route (they are aggregated and dumped by the background thread).
+        :param profile: Profile of the request.
+        :param route: Route of the request.
+        """
+        profile.disable()
+        self._busy.release()
+
+        with self._lock:
+            # The thread is started on the first profile of each process, since
+            # threads don't survive the fork of the server workers
+            if self._pid != os.getpid():
+                self._profiles = {}
+                self._window_start = time.time()
+                self._wake = threading.Event()
+                threading.Thread(target=self._run, name="profile-dumper", daemon=True).start()
+                self._pid = os.getpid()
+                atexit.register(self.dump)
+
+            self._profiles.setdefault(route, []).append(profile)
+            self.profiled += 1
+
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            # Wait for the end of the window, or for the first profile of an empty one
+            self._wake.wait(max(self._window_start + self.window - time.time(), 0) if self._profiles else None)
+            self._wake.clear()
+            if self._profiles and time.time() - self._window_start >= self.window:
+                try:
+                    self.dump()
+                except Exception as e:
+                    if self.logger is not None:
+                        self.logger.error("There was an exception while dumping the profiles: %s" % e)
+
+    def dump(self):
+        """
+        Dumps the aggregated profiles of each route, and starts a new window.
+        :return: List with the paths of the dumped profiles.
+        """
+        with self._lock:
+            profiles, self._profiles = self._profiles, {}
+            window_start, self._window_start = self._window_start, time.time()
+
+        paths = []
+        if profiles:
+            os.makedirs(self.path, exist_ok=True)
+        for route, route_profiles in profiles.items():
+            path = os.path.join(self.path, "%s-%d-%d.prof" % (get_route_slug(route), int(window_start), os.getpid()))
+            try:
+                pstats.Stats(*route_profiles).dump_stats(path)
+                paths.append(path)
+                self.dumps += 1
+            except (IOError, OSError) as e:
+                if self.logger is not None:
+                    self.logger.error("The profile of the route %s can't be dumped: %s" % (route, e))
+
+        return paths
+
+    def stats(self):
+        """
+        Returns the statistics of the profiler.
+        :return: Dictionary with the number of profiled requests, the routes of
+            the current window and the number of dumped profiles.
+        """
+        return {
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled,
+            "routes": sorted(self._profiles),
+            "dumps": self.dumps
+        }
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import numpy as np
+import threading
+
+from functools import partial
+from scipy.sparse import csr_matrix, vstack
+from sklearn.pipeline import Pipeline
+
+from flask_app.metrics import stage
+
+
+class Recommender(object):
+    """
+    Wrapper over the fitted `DictVectorizer` and regressor of the model. The
+    movie block of the candidate matrix (one row per movie) is built once, so
+    each request only needs to patch the user columns (age, gender and
+    occupation) before calling the regressor.
+    """
+
+    # Maximum number of candidate rows scored by a single call to the regressor
+    max_block_size = 2 ** 20
+
+    def __init__(self, vectorizer, estimator):
+        """
+        :param vectorizer: Fitted `DictVectorizer` of the model.
+        :param estimator: Fitted regressor over the vectorized data.
+        """
+        self.vectorizer = vectorizer
+        self.estimator = estimator
+
+        # Get all the movies of the model (this depends on the model)
+        movies = [(f.split("=", 1)[1], i) for i, f in enumerate(self.vectorizer.feature_names_)
+                  if f.startswith("movie")]
+        self.movies = [movie for movie, _ in movies]
+        self.n_features = len(self.vectorizer.feature_names_)
+        self._movie_columns = np.array([column for _, column in movies], dtype=np.int32)
+        self._indptr = {}
+
+        # Optional table with the precomputed rankings (see flask_app.score_table)
+        self.score_table = None
+
+        # Optional first stage with the candidate movies of each user (see flask_app.prefilter)
+        self.prefilter = None
+
+        # Version of the model (see flask_app.registry)
+        self.version = None
+
+        # Latency of the model measured while warming it (see flask_app.warmup)
+        self.warmup_stats = None
+
+    @classmethod
+    def from_pipeline(cls, model):
+        """
+        Builds the recommender from a scikit-learn pipeline.
+        :param model: Fitted scikit-learn pipeline (DictVectorizer + regressor).
+        :return: The recommender.
+        """
+        # The rest of the pipeline is used directly over the vectorized data
+        if len(model.steps) == 2:
+            return cls(model.steps[0][1], model.steps[1][1])
+        else:
+            return cls(model.steps[0][1], Pipeline(model.steps[1:]))
+
+    def user_features(self, data):
+        """
+        Returns the columns and values of the features of a user, following
+        the same rules as `DictVectorizer` (unknown features are ignored).
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :return: Tuple with the list of columns and the list of values.
+        """
+        columns = []
+        values = []
+
+        for feature, value in data.items():
+            if isinstance(value, str):
+                feature = "%s%s%s" % (feature, self.vectorizer.separator, value)
+                value = 1
+            column = self.vectorizer.vocabulary_.get(feature)
+            if column is not None:
+                columns.append(column)
+                values.append(value)
+
+        return columns, values
+
+    def candidates(self, data, movies=None):
+        """
+        Returns the candidate matrix for a user: the user features patched on
+        each of the rows of the movies. Equivalent to vectorizing one
+        dictionary per movie with the model's `DictVectorizer`.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :param movies: Array with the indices of the movies of the rows (defaults to all the movies).
+        :return: Sparse matrix with one row per movie.
+        """
+        columns, values = self.user_features(data)
+        movie_columns = self._movie_columns if movies is None else self._movie_columns[movies]
+        n_movies = movie_columns.shape[0]
+        row_size = len(columns) + 1
+
+        indices = np.empty((n_movies, row_size), dtype=np.int32)
+        indices[:, :-1] = columns
+        indices[:, -1] = movie_columns
+
+        X_data = np.ones((n_movies, row_size), dtype=self.vectorizer.dtype)
+        X_data[:, :-1] = values
+
+        if (n_movies, row_size) not in self._indptr:
+            self._indptr[n_movies, row_size] = np.arange(0, n_movies * row_size + 1, row_size, dtype=np.int32)
+
+        return csr_matrix((X_data.ravel(), indices.ravel(), self._indptr[n_movies, row_size]),
+                          shape=(n_movies, self.n_features))
+
+    def predict(self, data):
+        """
+        Predicts the scores of all the movies for a given user.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :return: Array with the predicted score for each movie.
+        """
+        with stage("candidates"):
+            X = self.candidates(data)
+
+        with stage("predict"):
+            return self.estimator.predict(X)
+
+    def rank(self, data):
+        """
+        Gets the ranking of the movies for the given user.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :return: Ranking of the movies.
+        """
+        if self.score_table is not None:
+            ranking = self.score_table.lookup(data)
+            if ranking is not None:
+                return ranking
+
+        if self.prefilter is not None:
+            movies = self.prefilter.lookup(data)
+            if movies is not None:
+                return self.rank_candidates([data], [movies])[0]
+
+        return Ranking(self.predict(data))
+
+    def rank_many(self, users):
+        """
+        Gets the rankings of the movies for many users. The candidates of all
+        the users are stacked and scored at once by the regressor.
+        :param users: List of dictionaries with the user data (age, gender, occupation).
+        :return: List with the ranking of the movies for each user.
+        """
+        rankings = [None] * len(users)
+
+        if self.score_table is not None:
+            rankings = [self.score_table.lookup(data) for data in users]
+
+        pending = [i for i, ranking in enumerate(rankings) if ranking is None]
+
+        if self.prefilter is not None:
+            candidates = [self.prefilter.lookup(users[i]) for i in pending]
+            prefiltered = [(i, movies) for i, movies in zip(pending, candidates) if movies is not None]
+            if prefiltered:
+                indices, movies = zip(*prefiltered)
+                for i, ranking in zip(indices, self.rank_candidates([users[i] for i in indices], movies)):
+                    rankings[i] = ranking
+                pending = [i for i in pending if rankings[i] is None]
+
+        for i, user_scores in zip(pending, self.predict_many([users[i] for i in pending])):
+            rankings[i] = Ranking(user_scores)
+
+        return rankings
+
+    def rank_candidates(self, users, candidates):
+        """
+        Gets the rankings of the candidate movies of many users. The candidates
+        of all the users are scored at once by the regressor (in blocks of at
+        most `max_block_size` rows). The rankings start with the candidates,
+        and the rest of the movies are only scored (and ranked after them) if
+        a page goes past the candidates.
+        :param users: List of dictionaries with the user data (age, gender, occupation).
+        :param candidates: List with the sorted array of the candidate movies of each user.
+        :return: List with the ranking of the candidate movies for each user.
+        """
+        rankings = []
+        n_candidates = max([movies.shape[0] for movies in candidates] + [1])
+        block_size = max(self.max_block_size // n_candidates, 1)
+
+        for start in range(0, len(users), block_size):
+            block = range(start, min(start + block_size, len(users)))
+            with stage("candidates"):
+                X = [self.candidates(users[i], candidates[i]) for i in block]
+                X = X[0] if len(X) == 1 else vstack(X, format="csr")
+            with stage("predict"):
+                scores = self.estimator.predict(X)
+
+            offset = 0
+            for i in block:
+                movies = candidates[i]
+                user_scores = scores[offset:offset + movies.shape[0]]
+                offset += movies.shape[0]
+                # The candidates are sorted, so the ties are broken by the index of the movie
+                order = np.argsort(-user_scores, kind="mergesort")
+                rankings.append(Ranking(None, movies[order], user_scores[order],
+                                        partial(self.rank_remaining, users[i], movies)))
+
+        return rankings
+
+    def rank_remaining(self, data, movies):
+        """
+        Gets the ranking of the movies of a user other than the given ones.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :param movies: Sorted array with the indices of the movies to leave out.
+        :return: Tuple with the indices of the rest of the movies sorted by score, and their scores.
+        """
+        remaining = np.setdiff1d(np.arange(len(self.movies)), movies, assume_unique=True)
+        if remaining.shape[0] == 0:
+            return remaining, np.empty(0)
+
+        with stage("candidates"):
+            X = self.candidates(data, remaining)
+        with stage("predict"):
+            scores = self.estimator.predict(X)
+        order = np.argsort(-scores, kind="mergesort")
+
+        return remaining[order], scores[order]
+
+    def predict_many(self, users):
+        """
+        Predicts the scores of all the movies for many users. The candidates of
+        all the users are stacked and scored at once by the regressor (in blocks
+        of at most `max_block_size` rows).
+        :param users: List of dictionaries with the user data (age, gender, occupation).
+        :return: Array with the predicted score of each movie (columns) for each user (rows).
+        """
+        n_movies = len(self.movies)
+        block_size = max(self.max_block_size // max(n_movies, 1), 1)
+        scores = []
+
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            with stage("candidates"):
+                X = vstack([self.candidates(data) for data in block], format="csr")
+            with stage("predict"):
+                scores.append(self.estimator.predict(X).reshape(len(block), n_movies))
+
+        if len(scores) == 1:
+            return scores[0]
+
+        return np.concatenate(scores) if scores else np.empty((0, n_movies))
+
+    def recommend(self, data, max_recs=10, offset=0):
+        """
+        Gets the top recommendations for the given user.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :param max_recs: Maximum number of recommendations to return.
+        :param offset: Number of top recommendations to skip.
+        :return: Tuple with the indices of the recommended movies and their scores.
+        """
+        return self.rank(data).top(max_recs, offset)
+
+
+class Ranking(object):
+    """
+    Ranking of the movies by score (ties are broken by the index of the
+    movie). The full sort of the movies is only done when needed: the top
+    movies of the first pages are obtained with a partial selection.
+    """
+
+    def __init__(self, scores, indices=None, sorted_scores=None, remaining=None):
+        """
+        :param scores: Array with the score of each movie (None if the ranking is
+            already sorted).
+        :param indices: Array with the indices of the movies sorted by score.
+        :param sorted_scores: Array with the scores of the sorted movies.
+        :param remaining: Function that ranks the movies missing from the
+            ranking (e.g. the ones that are not candidates of the user), which
+            are added after the ranked ones when a page goes past them.
+        """
+        self.scores = scores
+        self.indices = indices
+        self.sorted_scores = sorted_scores
+        self.remaining = remaining
+        self.extend_lock = threading.Lock()
+
+    def __len__(self):
+        return (self.scores if self.indices is None else self.indices).shape[0]
+
+    def sort(self):
+        """
+        Sorts all the movies of the ranking (only done once). The rankings are
+        shared between threads by the caches, so the sorted scores are set
+        before the indices, which mark the ranking as sorted.
+        """
+        if self.indices is None:
+            indices = np.argsort(-self.scores, kind="mergesort")
+            self.sorted_scores = self.scores[indices]
+            self.indices = indices
+
+    def extend(self):
+        """
+        Adds the ranking of the missing movies after the ranked ones (only done
+        once, even if many threads page past the ranked movies at the same time).
+        """
+        with self.extend_lock:
+            remaining = self.remaining
+            if remaining is not None:
+                self.sort()
+                remaining_indices, remaining_scores = remaining()
+                indices = np.concatenate([self.indices, remaining_indices])
+                sorted_scores = np.concatenate([self.sorted_scores, remaining_scores])
+                self.sorted_scores = sorted_scores
+                self.indices = indices
+                self.remaining = None
+
+    def top(self, max_recs=10, offset=0):
+        """
+        Gets the top movies of the ranking.
+        :param max_recs: Maximum number of movies to return.
+        :param offset: Number of top movies to skip.
+        :return: Tuple with the indices of the movies and their scores.
+        """
+        k = offset + max_recs
+
+        if self.indices is None and 0 <= max_recs and k < len(self):
+            if k == 0:
+                return np.array([], dtype=np.intp), self.scores[:0]
+
+            # Select the movies with a score greater than the k-th score and,
+            # among the ones tied to it, the ones with the lowest indices
+            kth_score = -np.partition(-self.scores, k - 1)[k - 1]
+            greater = np.flatnonzero(self.scores > kth_score)
+            tied = np.flatnonzero(self.scores == kth_score)[:k - greater.shape[0]]
+            indices = np.concatenate([greater, tied])
+            indices = indices[np.argsort(-self.scores[indices], kind="mergesort")][offset:]
+
+            return indices, self.scores[indices]
+
+        if self.remaining is not None and k > len(self):
+            self.extend()
+        else:
+            self.sort()
+
+        # The ranking may be extended by another thread between both reads, but
+        # the sorted scores are always set first and keep the same prefix
+        indices = self.indices
+        sorted_scores = self.sorted_scores[:indices.shape[0]]
+
+        return indices[offset:][:max_recs], sorted_scores[offset:][:max_recs]
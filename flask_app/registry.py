@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import os
+import re
+import threading
+import time
+
+from flask_app.artifacts import load_recommender
+from flask_app.utils import InvalidConfigurationError
+
+CURRENT_VERSION_FILE = "CURRENT"
+
+
+def get_version_key(version):
+    """
+    Returns the sorting key of a version, comparing its numeric parts as
+    numbers (e.g. "1.10.0" is greater than "1.9.0").
+    :param version: Version name.
+    :return: Tuple to sort the versions by.
+    """
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part)
+                 for part in re.split(r"[.\-_]", version))
+
+
+def get_version_stamp(path):
+    """
+    Returns a stamp of the files of a version, which changes when any of them
+    is added, removed or modified (e.g. while the version is being copied).
+    :param path: Path to the version (file or directory).
+    :return: Tuple with the name, size and modification time of each file.
+    """
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return (("", stat.st_size, stat.st_mtime_ns),)
+
+    stamp = []
+    for directory, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(directory, file_name)
+            stat = os.stat(file_path)
+            stamp.append((os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns))
+
+    return tuple(sorted(stamp))
+
+
+class ServingModel(object):
+    """
+    Holder of the recommender that serves the requests. The views read the
+    recommender once per request, so swapping it is atomic for them.
+    """
+
+    def __init__(self, recommender=None):
+        """
+        :param recommender: Recommender to serve.
+        """
+        self.recommender = recommender
+
+    def swap(self, recommender):
+        """
+        Replaces the served recommender.
+        :param recommender: New recommender to serve.
+        """
+        self.recommender = recommender
+
+    def ensure_watcher(self):
+        """
+        Starts the background tasks of the serving model (if any).
+        """
+        pass
+
+
+class ModelRegistry(ServingModel):
+    """
+    Serves the models of a registry directory, with one entry per version of
+    the model (an artifacts directory, a directory with a `model.pkl` file, or
+    a pickle file). The version to serve is the one named in the `CURRENT`
+    file of the registry or, if there's no such file, the greatest version.
+    A background thread checks the registry periodically, loads and prepares
+    new versions off the request path, and then swaps them in.
+    """
+
+    def __init__(self, path, prepare=None, poll_interval=30, logger=None, retry_interval=300):
+        """
+        :param path: Path to the registry directory.
+        :param prepare: Function to prepare (and warm) a loaded recommender
+            before serving it.
+        :param poll_interval: Time (in seconds) between checks of the registry.
+        :param logger: Application logger.
+        :param retry_interval: Time (in seconds) to wait before loading again a
+            version that failed to load, unless its files change.
+        """
+        super(ModelRegistry, self).__init__()
+        self.path = path
+        self.prepare = prepare
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.retry_interval = retry_interval
+        self.failed_version = None
+        self._failed_stamp = None
+        self._failed_time = None
+        self._load_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._pid = None
+
+    def versions(self):
+        """
+        Returns the versions of the registry.
+        :return: List of the versions sorted from oldest to newest.
+        """
+        return sorted((name for name in os.listdir(self.path)
+                       if name != CURRENT_VERSION_FILE and not name.startswith(".")), key=get_version_key)
+
+    def target_version(self):
+        """
+        Returns the version of the registry that should be served.
+        :return: Name of the version (None if the registry is empty).
+        """
+        current_version_path = os.path.join(self.path, CURRENT_VERSION_FILE)
+        if os.path.isfile(current_version_path):
+            with open(current_version_path, "r") as fh:
+                return fh.read().strip()
+
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def load(self, version):
+        """
+        Loads and prepares a version of the model, and serves it.
+        :param version: Name of the version.
+        """
+        recommender = load_recommender(os.path.join(self.path, version))
+        recommender.version = version
+        if self.prepare is not None:
+            recommender = self.prepare(recommender)
+        self.swap(recommender)
+
+    def get_stamp(self, version):
+        """
+        Returns the stamp of the files of a version (None if it doesn't exist).
+        :param version: Name of the version.
+        :return: Stamp of the version (see `get_version_stamp`).
+        """
+        try:
+            return get_version_stamp(os.path.join(self.path, version))
+        except OSError:
+            return None
+
+    def should_retry(self, version):
+        """
+        Checks whether a version that failed to load should be loaded again:
+        when its files changed since the failure (e.g. it was still being
+        copied), or after `retry_interval` seconds.
+        :param version: Name of the failed version.
+        :return: Whether to load the version again.
+        """
+        return self.get_stamp(version) != self._failed_stamp or \
+            time.time() - self._failed_time >= self.retry_interval
+
+    def check(self):
+        """
+        Checks the registry and serves its target version if it's not already
+        served. If a version fails to load, the current one is kept, and the
+        failed version is only loaded again when its files change or after
+        `retry_interval` seconds.
+        :return: Whether a new version is served.
+        """
+        version = self.target_version()
+        current_version = self.recommender.version if self.recommender is not None else None
+        if version is None or version == current_version or \
+                (version == self.failed_version and not self.should_retry(version)):
+            return False
+
+        with self._load_lock:
+            stamp = self.get_stamp(version)
+            try:
+                if self.logger is not None:
+                    self.logger.info("Loading version %s of the model from the registry" % version)
+                self.load(version)
+            except Exception as e:
+                self.failed_version = version
+                self._failed_stamp = stamp
+                self._failed_time = time.time()
+                if self.recommender is None:
+                    raise InvalidConfigurationError("The version %s of the model in the " % version +
+                                                    "registry \"%s\" can't be loaded: %s" % (self.path, e))
+                if self.logger is not None:
+                    self.logger.error("The version %s of the model can't be loaded: %s" % (version, e))
+                    self.logger.exception(e)
+                return False
+
+        self.failed_version = None
+        if self.logger is not None:
+            self.logger.info("Serving version %s of the model" % version)
+        return True
+
+    def ensure_watcher(self):
+        # The thread is started on the first request of each process, since
+        # threads don't survive the fork of the server workers
+        if self.poll_interval > 0 and self._pid != os.getpid():
+            with self._watcher_lock:
+                if self._pid != os.getpid():
+                    thread = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+                    thread.start()
+                    self._pid = os.getpid()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.check()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error("There was an exception while checking the model registry: %s" % e)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import json
+import os
+import numpy as np
+
+from scipy.sparse import vstack
+
+from flask_app.forest import FlatForest, get_trees
+from flask_app.recommender import Ranking
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS
+
+
+def get_split_thresholds(estimator, column):
+    """
+    Returns the sorted unique thresholds of all the splits done over a column.
+    :param estimator: Fitted tree based estimator or flat forest.
+    :param column: Index of the feature column.
+    :return: Sorted array of thresholds.
+    """
+    if column is None:
+        return np.array([], dtype=np.float64)
+    elif isinstance(estimator, FlatForest):
+        return np.unique(estimator.threshold[estimator.feature == column])
+
+    thresholds = [tree.tree_.threshold[tree.tree_.feature == column] for tree in get_trees(estimator)]
+
+    return np.unique(np.concatenate(thresholds))
+
+
+def get_age_representatives(thresholds):
+    """
+    Returns one age per interval induced by the thresholds. Every age of the
+    same interval follows the same path in every tree of the model, so it
+    gets exactly the same scores.
+    :param thresholds: Sorted array of age thresholds.
+    :return: Array with one representative age per interval.
+    """
+    if thresholds.shape[0] == 0:
+        return np.zeros(1)
+
+    return np.concatenate([[thresholds[0] - 1],
+                           (thresholds[:-1] + thresholds[1:]) / 2,
+                           [thresholds[-1] + 1]])
+
+
+class ScoreTable(object):
+    """
+    Precomputed ranking of the movies for every possible user of the API: each
+    gender, each occupation and each age interval induced by the split
+    thresholds of the model over the age. Serving a recommendation from it is
+    a lookup and gives exactly the same results as the model.
+    """
+
+    def __init__(self, thresholds, genders, occupations, rankings, scores):
+        """
+        :param thresholds: Sorted array of the age thresholds of the model.
+        :param genders: List of genders of the table.
+        :param occupations: List of occupations of the table.
+        :param rankings: Array (ages x genders x occupations x movies) with the
+            indices of the movies sorted by score.
+        :param scores: Array, with the same shape of rankings, with the scores
+            of the sorted movies.
+        """
+        self.thresholds = thresholds
+        self.genders = list(genders)
+        self.occupations = list(occupations)
+        self.rankings = rankings
+        self.scores = scores
+        self._genders_index = {g: i for i, g in enumerate(self.genders)}
+        self._occupations_index = {o: i for i, o in enumerate(self.occupations)}
+
+    @classmethod
+    def build(cls, recommender, genders=VALID_GENDERS, occupations=VALID_OCCUPATIONS):
+        """
+        Builds the table scoring every possible user against all the movies.
+        Raise ValueError if the model is not tree based.
+        :param recommender: Recommender with the model to build the table for.
+        :param genders: Genders to add to the table.
+        :param occupations: Occupations to add to the table.
+        :return: The score table.
+        """
+        genders = sorted(genders)
+        occupations = sorted(occupations)
+        thresholds = get_split_thresholds(recommender.estimator,
+                                          recommender.vectorizer.vocabulary_.get("age"))
+        ages = get_age_representatives(thresholds)
+        n_movies = len(recommender.movies)
+
+        shape = (ages.shape[0], len(genders), len(occupations), n_movies)
+        rankings = np.empty(shape, dtype=np.uint16 if n_movies <= np.iinfo(np.uint16).max else np.uint32)
+        scores = np.empty(shape, dtype=np.float32)
+
+        for i, age in enumerate(ages):
+            # Score all the users of the same age interval in a single call
+            X = vstack([recommender.candidates({"age": age, "gender": gender, "occupation": occupation})
+                        for gender in genders for occupation in occupations], format="csr")
+            predictions = recommender.estimator.predict(X).reshape(len(genders), len(occupations), n_movies)
+            rankings[i] = np.argsort(-predictions, axis=-1, kind="mergesort")
+            scores[i] = np.take_along_axis(predictions, rankings[i].astype(np.intp), axis=-1)
+
+        return cls(thresholds, genders, occupations, rankings, scores)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """
+        Loads a score table saved with `ScoreTable.save`.
+        :param path: Path to the directory of the table.
+        :param mmap_mode: Memory-map mode for the arrays (see `numpy.load`).
+        :return: The score table.
+        """
+        with open(os.path.join(path, "labels.json"), "r") as fh:
+            labels = json.load(fh)
+
+        return cls(np.load(os.path.join(path, "thresholds.npy")), labels["genders"], labels["occupations"],
+                   np.load(os.path.join(path, "rankings.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, "scores.npy"), mmap_mode=mmap_mode))
+
+    def save(self, path):
+        """
+        Saves the arrays of the score table in a directory.
+        :param path: Path to the directory of the table.
+        """
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "labels.json"), "w") as fh:
+            json.dump({"genders": self.genders, "occupations": self.occupations}, fh)
+        np.save(os.path.join(path, "thresholds.npy"), self.thresholds)
+        np.save(os.path.join(path, "rankings.npy"), self.rankings)
+        np.save(os.path.join(path, "scores.npy"), self.scores)
+
+    def check_model(self, recommender):
+        """
+        Checks the table was built for the model of the given recommender.
+        :param recommender: Recommender with the model to check.
+        :return: Whether the table matches the model.
+        """
+        try:
+            thresholds = get_split_thresholds(recommender.estimator,
+                                              recommender.vectorizer.vocabulary_.get("age"))
+        except ValueError:
+            return False
+
+        return (self.rankings.shape[-1] == len(recommender.movies) and
+                np.array_equal(self.thresholds, thresholds))
+
+    def lookup(self, data):
+        """
+        Gets the ranking of the movies for the given user from the table.
+        :param data: Dictionary with the user data (age, gender, occupation).
+        :return: Ranking of the movies, or None if the user is not in the table.
+        """
+        gender = self._genders_index.get(data["gender"])
+        occupation = self._occupations_index.get(data["occupation"])
+        if gender is None or occupation is None:
+            return None
+
+        # Trees compare the features as float32 values
+        age = np.searchsorted(self.thresholds, np.float32(data["age"]), side="left")
+
+        return Ranking(None, self.rankings[age, gender, occupation], self.scores[age, gender, occupation])
@@ -3,6 +3,22 @@
 
 from __future__ import absolute_import
 
+VALID_GENDERS = frozenset({"M", "F", "O"})
+VALID_OCCUPATIONS = frozenset({"administrator", "artist", "doctor", "educator",
+                               "engineer", "entertainment", "executive", "healthcare",
+                               "homemaker", "lawyer", "librarian", "marketing", "none",
+                               "other", "programmer", "retired", "salesman",
+                               "scientist", "student", "technician", "writer"})
+
+# Valid parameters of each resource, and the error messages built from them (computed once)
+RECOMMEND_PARAMETERS = frozenset({"age", "gender", "occupation", "max_recs", "offset"})
+RECOMMEND_PAGE_PARAMETERS = frozenset({"id", "offset", "max_recs"})
+RECOMMEND_BATCH_PARAMETERS = frozenset({"users"})
+SCORE_PARAMETERS = frozenset({"id", "movie", "score"})
+INVALID_GENDER_MESSAGE = "The parameter 'gender' must be one of the following: 'M', 'F', 'O'"
+INVALID_OCCUPATION_MESSAGE = "The parameter 'occupation' must be one of the following: %s" %\
+                             ", ".join("'%s'" % o for o in sorted(VALID_OCCUPATIONS))
+
 
 class InvalidConfigurationError(Exception):
     pass
@@ -34,8 +50,10 @@ def check_login_parameters(request):
         raise InvalidUsage("Missing JSON request")
 
     data = request.get_json()
-    if "session_password" not in data.keys():
+    if "session_password" not in data:
         raise InvalidUsage("Missing parameter: 'session_password'")
+    elif not isinstance(data["session_password"], str):
+        raise InvalidUsage("The parameter 'session_password' must be a string")
 
     return data
 
@@ -44,26 +62,28 @@ def check_score_parameters(request):
     """
     Checks the parameters sent for recommend score are correct. Raise InvalidUsage if not.
     :param request: Flask request object.
-    :return: Validated data dictionary.
+    :return: Validated data dictionary (any other parameter sent is left out).
     """
     if not request.is_json:
         raise InvalidUsage("Missing JSON request")
 
     data = request.get_json()
-    if "id" not in data.keys():
+    if "id" not in data:
         raise InvalidUsage("Missing parameter: 'id'")
-    elif len(data["id"]) != 36 or len(data["id"].split("-")) != 5:
+    elif not isinstance(data["id"], str) or len(data["id"]) != 36 or len(data["id"].split("-")) != 5:
         raise InvalidUsage("Invalid parameter 'id'")
     elif "movie" not in data:
         raise InvalidUsage("Missing parameter: 'movie'")
+    elif not isinstance(data["movie"], str):
+        raise InvalidUsage("The parameter 'movie' must be a string")
     elif "score" not in data:
         raise InvalidUsage("Missing parameter: 'score'")
-    elif not (isinstance(data["score"], int) or isinstance(data["score"], float)):
+    elif not isinstance(data["score"], (int, float)):
         raise InvalidUsage("Parameter 'score' must be a valid number")
     elif not (1 <= data["score"] <= 5):
         raise InvalidUsage("Parameter 'score' must be in the [1,5] interval")
 
-    return data
+    return {key: data[key] for key in SCORE_PARAMETERS}
 
 
 def check_recommend_data_parameters(request):
@@ -75,30 +95,93 @@ def check_recommend_data_parameters(request):
     if not request.is_json:
         raise InvalidUsage("Missing JSON request")
 
+    return check_recommend_data(request.get_json())
+
+
+def check_recommend_batch_parameters(request, max_users):
+    """
+    Checks the parameters sent for batch recommend are correct. Each user is
+    checked with the same rules of recommend. Raise InvalidUsage if not.
+    :param request: Flask request object.
+    :param max_users: Maximum number of users of a batch.
+    :return: List of validated data dictionaries.
+    """
+    if not request.is_json:
+        raise InvalidUsage("Missing JSON request")
+
     data = request.get_json()
-    valid_genders = {"M", "F", "O"}
-    valid_occupations = {"administrator", "artist", "doctor", "educator",
-                         "engineer", "entertainment", "executive", "healthcare",
-                         "homemaker", "lawyer", "librarian", "marketing", "none",
-                         "other", "programmer", "retired", "salesman",
-                         "scientist", "student", "technician", "writer"}
-
-    if "age" not in data.keys():
+    if "users" not in data:
+        raise InvalidUsage("Missing parameter: 'users'")
+    elif not isinstance(data["users"], list) or len(data["users"]) == 0:
+        raise InvalidUsage("The parameter 'users' must be a non empty list")
+    elif len(data["users"]) > max_users:
+        raise InvalidUsage("The parameter 'users' must have at most %d users" % max_users)
+    elif not data.keys() <= RECOMMEND_BATCH_PARAMETERS:
+        raise InvalidUsage("The only valid parameter is: 'users'")
+
+    for i, user_data in enumerate(data["users"]):
+        if not isinstance(user_data, dict):
+            raise InvalidUsage("Invalid user %d: the user must be an object" % i, payload={"user": i})
+        try:
+            check_recommend_data(user_data)
+        except InvalidUsage as e:
+            raise InvalidUsage("Invalid user %d: %s" % (i, e.message), payload={"user": i})
+
+    return data["users"]
+
+
+def check_recommend_data(data):
+    """
+    Checks the data of a user for recommend is correct. Raise InvalidUsage if not.
+    :param data: Dictionary with the user data.
+    :return: Validated data dictionary.
+    """
+    if "age" not in data:
         raise InvalidUsage("Missing parameter: 'age'")
     elif not isinstance(data["age"], int):
         raise InvalidUsage("The parameter 'age' must be an integer")
-    elif "gender" not in data.keys():
+    elif "gender" not in data:
         raise InvalidUsage("Missing parameter: 'gender'")
-    elif data['gender'] not in valid_genders:
-        raise InvalidUsage("The parameter 'gender' must be one of the following: 'M', 'F', 'O'")
-    elif "occupation" not in data.keys():
+    elif data["gender"] not in VALID_GENDERS:
+        raise InvalidUsage(INVALID_GENDER_MESSAGE)
+    elif "occupation" not in data:
         raise InvalidUsage("Missing parameter: 'occupation'")
-    elif data["occupation"] not in valid_occupations:
-        raise InvalidUsage("The parameter 'occupation' must be one of the following: %s" %
-                           ", ".join("'%s'" % o for o in sorted(valid_occupations)))
+    elif data["occupation"] not in VALID_OCCUPATIONS:
+        raise InvalidUsage(INVALID_OCCUPATION_MESSAGE)
+    elif not isinstance(data.get("max_recs", 0), int):
+        raise InvalidUsage("The parameter 'max_recs' must be an integer.")
+    elif not isinstance(data.get("offset", 0), int) or data.get("offset", 0) < 0:
+        raise InvalidUsage("The parameter 'offset' must be a non negative integer.")
+    elif not data.keys() <= RECOMMEND_PARAMETERS:
+        raise InvalidUsage("The only valid parameters are: 'age', 'gender', 'occupation', 'max_recs', " +
+                           "and 'offset'")
+
+    return data
+
+
+def check_recommend_page_parameters(request):
+    """
+    Checks the parameters sent for a page of a previous recommendation are correct.
+    Raise InvalidUsage if not.
+    :param request: Flask request object.
+    :return: Validated data dictionary.
+    """
+    if not request.is_json:
+        raise InvalidUsage("Missing JSON request")
+
+    data = request.get_json()
+    if "id" not in data:
+        raise InvalidUsage("Missing parameter: 'id'")
+    elif not isinstance(data["id"], str) or len(data["id"]) != 36 or len(data["id"].split("-")) != 5:
+        raise InvalidUsage("Invalid parameter 'id'")
+    elif "offset" not in data:
+        raise InvalidUsage("Missing parameter: 'offset'")
+    elif not isinstance(data["offset"], int) or data["offset"] < 0:
+        raise InvalidUsage("The parameter 'offset' must be a non negative integer.")
     elif not isinstance(data.get("max_recs", 0), int):
         raise InvalidUsage("The parameter 'max_recs' must be an integer.")
-    elif not set(data.keys()).issubset({"age", "gender", "occupation", "max_recs"}):
-        raise InvalidUsage("The only valid parameters are: 'age', 'gender', 'occupation', and 'max_recs'")
+    elif not data.keys() <= RECOMMEND_PAGE_PARAMETERS:
+        raise InvalidUsage("The only valid parameters to get a page of a previous recommendation are: " +
+                           "'id', 'offset', and 'max_recs'")
 
     return data
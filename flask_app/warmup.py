@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Creator: Cristian Cardellino
+
+from __future__ import absolute_import
+
+import time
+import numpy as np
+
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS
+
+
+def get_warmup_profiles(n_profiles):
+    """
+    Returns synthetic users that cover every gender and occupation, with ages
+    spread over the range of the users of the service.
+    :param n_profiles: Number of users to return.
+    :return: List of dictionaries with the user data (age, gender, occupation).
+    """
+    genders = sorted(VALID_GENDERS)
+    occupations = sorted(VALID_OCCUPATIONS)
+
+    return [{
+        "age": 10 + (i * 7) % 70,
+        "gender": genders[i % len(genders)],
+        "occupation": occupations[i % len(occupations)]
+    } for i in range(n_profiles)]
+
+
+def warm_up(recommender, n_requests=64):
+    """
+    Warms a recommender with synthetic recommendations, so the first real
+    requests don't pay for the first call costs (page faults on memory-mapped
+    arrays, allocations, lazy imports). Every profile is recommended twice:
+    the first round warms the model and the second one measures its latency.
+    The measures are kept in the `warmup_stats` attribute of the recommender.
+    :param recommender: Recommender to warm.
+    :param n_requests: Number of synthetic recommendations per round.
+    :return: Dictionary with the latency (in seconds) of the recommendations.
+    """
+    profiles = get_warmup_profiles(n_requests)
+
+    for data in profiles:
+        recommender.recommend(data)
+
+    latencies = []
+    for data in profiles:
+        start = time.perf_counter()
+        recommender.recommend(data)
+        latencies.append(time.perf_counter() - start)
+
+    recommender.warmup_stats = {
+        "requests": n_requests,
+        "p50": float(np.percentile(latencies, 50)) if latencies else 0.,
+        "p95": float(np.percentile(latencies, 95)) if latencies else 0.,
+        "max": float(np.max(latencies)) if latencies else 0.,
+        "measured_at": time.time()
+    }
+
+    return recommender.warmup_stats
+
+
+def is_ready(recommender, p95_budget=None):
+    """
+    Checks whether a recommender is warm and fast enough to serve requests.
+    :param recommender: Recommender to check.
+    :param p95_budget: Maximum 95th percentile of the latency (in seconds) of the
+        warmup recommendations (None for no limit).
+    :return: Whether the recommender is ready.
+    """
+    if recommender.warmup_stats is None:
+        return False
+
+    return p95_budget is None or recommender.warmup_stats["p95"] <= p95_budget
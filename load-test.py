@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import numpy as np
+
+from urllib.parse import urlparse
+
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS
+
+# Frequencies of the genders and occupations of the users of MovieLens 100k,
+# to draw realistic profiles (the missing values have a frequency of 1)
+GENDER_WEIGHTS = {"M": 670, "F": 273, "O": 10}
+OCCUPATION_WEIGHTS = {"administrator": 79, "artist": 28, "doctor": 7, "educator": 95, "engineer": 67,
+                      "entertainment": 18, "executive": 32, "healthcare": 16, "homemaker": 7, "lawyer": 12,
+                      "librarian": 51, "marketing": 26, "none": 9, "other": 105, "programmer": 66,
+                      "retired": 14, "salesman": 12, "scientist": 31, "student": 196, "technician": 27,
+                      "writer": 45}
+
+
+class ProfileGenerator(object):
+    """
+    Draws random user profiles: the ages from a normal distribution clipped
+    to the range of the ages of the users, and the genders and occupations
+    with the frequencies of the users of MovieLens.
+    """
+
+    def __init__(self, seed=None, age_mean=34., age_std=12., min_age=7, max_age=73):
+        self.random = random.Random(seed)
+        self.age_mean = age_mean
+        self.age_std = age_std
+        self.min_age = min_age
+        self.max_age = max_age
+        self.genders = sorted(VALID_GENDERS)
+        self.gender_weights = [GENDER_WEIGHTS.get(gender, 1) for gender in self.genders]
+        self.occupations = sorted(VALID_OCCUPATIONS)
+        self.occupation_weights = [OCCUPATION_WEIGHTS.get(occupation, 1) for occupation in self.occupations]
+
+    def __call__(self):
+        age = int(round(self.random.gauss(self.age_mean, self.age_std)))
+        return {
+            "age": min(max(age, self.min_age), self.max_age),
+            "gender": self.random.choices(self.genders, self.gender_weights)[0],
+            "occupation": self.random.choices(self.occupations, self.occupation_weights)[0]
+        }
+
+
+class Client(object):
+    """
+    HTTP client of the API keeping a persistent connection to the server.
+    """
+
+    def __init__(self, url, token=None, timeout=10.):
+        url = urlparse(url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"Content-type": "application/json"}
+        if token is not None:
+            self.headers["Authorization"] = "Bearer %s" % token
+        self.connection = None
+
+    def post(self, path, data):
+        """
+        Sends a POST request to the API.
+        :param path: Path of the resource.
+        :param data: Data of the request.
+        :return: Tuple with the status code and the decoded response (None if
+            the request failed).
+        """
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, timeout=self.timeout)
+
+        try:
+            self.connection.request("POST", self.prefix + path, json.dumps(data), self.headers)
+            response = self.connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = None
+            return 0, None
+
+        try:
+            return response.status, json.loads(body.decode("utf-8"))
+        except ValueError:
+            return response.status, None
+
+
+def run_session(client, profiles, max_recs, score_ratio, rng):
+    """
+    Runs a session of a user: a recommendation and, for a fraction of them, the score of a recommended movie.
+    :return: List of tuples with the resource, status code and latency of each request.
+    """
+    start = time.perf_counter()
+    status, response = client.post("/api/recommend", dict(profiles(), max_recs=max_recs))
+    results = [("recommend", status, time.perf_counter() - start)]
+
+    if status == 200 and response and response.get("recommendations") and rng.random() < score_ratio:
+        score_data = {"id": response["id"], "movie": rng.choice(response["recommendations"]),
+                      "score": float(rng.randint(1, 5))}
+        start = time.perf_counter()
+        status, _ = client.post("/api/recommend/score", score_data)
+        results.append(("score", status, time.perf_counter() - start))
+
+    return results
+
+
+def run_worker(args):
+    """
+    Sends the requests of a thread until the end of the test. In the
+    open-loop mode the sessions are sent at a fixed rate (at a random time of
+    each interval, so the clients are not synchronized) and their latency
+    counts from the time they were due, so the time waiting for a slow server
+    is not hidden. In the closed-loop mode each session is sent as soon as
+    the previous one finishes.
+    """
+    url, token, seed, rate, duration, max_recs, score_ratio, timeout, results = args
+    rng = random.Random(seed)
+    profiles = ProfileGenerator(seed)
+    client = Client(url, token, timeout)
+
+    start = time.perf_counter()
+    end = start + duration
+    sent = 0
+    while True:
+        if rate is not None:
+            due = start + sent / rate + rng.random() / rate
+            now = time.perf_counter()
+            if due >= end:
+                break
+            if due > now:
+                time.sleep(due - now)
+            delay = time.perf_counter() - due
+        elif time.perf_counter() >= end:
+            break
+        else:
+            delay = 0.
+
+        for resource, status, latency in run_session(client, profiles, max_recs, score_ratio, rng):
+            results.append((resource, status, latency + delay))
+            delay = 0.
+        sent += 1
+
+
+def run_process(args):
+    url, token, seed, concurrency, rate, duration, max_recs, score_ratio, timeout = args
+    results = []
+    threads = [threading.Thread(target=run_worker,
+                                args=((url, token, seed * concurrency + i, rate, duration, max_recs, score_ratio,
+                                       timeout, results),))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+def get_summary(results, duration):
+    """
+    Summarizes the results of the requests.
+    :param results: List of tuples with the resource, status code and latency of each request.
+    :param duration: Duration (in seconds) of the test.
+    :return: Dictionary with the number of requests, errors, error rate,
+        throughput and latency percentiles (in milliseconds).
+    """
+    if not results:
+        return {"requests": 0, "errors": 0, "error_rate": 0., "throughput": 0.}
+
+    statuses = np.array([status for _, status, _ in results])
+    latencies = np.array([latency for _, _, latency in results]) * 1000
+    errors = int(((statuses == 0) | (statuses >= 400)).sum())
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": errors / len(results),
+        "throughput": len(results) / duration,
+        "latency_ms": {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(latencies.max())},
+        "status_codes": {str(status): int(count) for status, count in zip(*np.unique(statuses, return_counts=True))}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the recommendations API of a server.")
+    parser.add_argument("url",
+                        help="Base URL of the server (e.g. http://localhost:5000).",
+                        metavar="URL")
+    parser.add_argument("session_password",
+                        help="Session password to log in to the server.",
+                        metavar="SESSION_PASSWORD")
+    parser.add_argument("--mode",
+                        choices=["closed", "open"],
+                        default="closed",
+                        help="Closed-loop mode (each client sends a request as soon as the previous " +
+                             "one finishes) or open-loop mode (the requests are sent at a fixed rate).")
+    parser.add_argument("--rate",
+                        type=float,
+                        default=100.,
+                        help="Total number of sessions per second of the open-loop mode.")
+    parser.add_argument("--processes",
+                        type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="Number of processes sending requests.")
+    parser.add_argument("--concurrency",
+                        type=int,
+                        default=4,
+                        help="Number of clients (threads) of each process.")
+    parser.add_argument("--duration",
+                        type=float,
+                        default=30.,
+                        help="Duration (in seconds) of the test.")
+    parser.add_argument("--max-recs",
+                        type=int,
+                        default=10,
+                        help="Number of recommendations of each request.")
+    parser.add_argument("--score-ratio",
+                        type=float,
+                        default=0.1,
+                        help="Fraction of the recommendations followed by the score of a movie.")
+    parser.add_argument("--timeout",
+                        type=float,
+                        default=10.,
+                        help="Timeout (in seconds) of each request.")
+    parser.add_argument("--seed",
+                        type=int,
+                        default=0,
+                        help="Seed of the random profiles.")
+    parser.add_argument("--output",
+                        default=None,
+                        help="Path to write the results (in JSON format). Defaults to STDOUT.")
+
+    args = parser.parse_args()
+
+    # Log in once, all the clients share the token
+    status, response = Client(args.url, timeout=args.timeout).post("/api/login",
+                                                                   {"session_password": args.session_password})
+    if status != 200 or not response or "access_token" not in response:
+        print("Can't log in to the server (status code %d)" % status, file=sys.stderr)
+        sys.exit(1)
+
+    n_clients = args.processes * args.concurrency
+    rate = args.rate / n_clients if args.mode == "open" else None
+    processes_args = [(args.url, response["access_token"], args.seed + i, args.concurrency, rate, args.duration,
+                       args.max_recs, args.score_ratio, args.timeout) for i in range(args.processes)]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = [result for process_results in pool.map(run_process, processes_args)
+                   for result in process_results]
+    duration = time.perf_counter() - start
+
+    summary = {
+        "mode": args.mode,
+        "processes": args.processes,
+        "concurrency": args.concurrency,
+        "rate": args.rate if args.mode == "open" else None,
+        "duration": duration,
+        "total": get_summary(results, duration),
+        "recommend": get_summary([result for result in results if result[0] == "recommend"], duration),
+        "score": get_summary([result for result in results if result[0] == "score"], duration)
+    }
+
+    if args.output is None:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        with open(args.output, "w") as fh:
+            json.dump(summary, fh, indent=2, sort_keys=True)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from collections import deque
+from itertools import islice
+
+from flask_app.artifacts import load_recommender
+from flask_app.forest import FlatForest
+from flask_app.score_table import ScoreTable
+from flask_app.utils import InvalidUsage, check_recommend_data
+
+# Columns of the CSV files with integer values
+INTEGER_COLUMNS = ("age", "max_recs", "offset")
+
+# Recommender shared with the worker processes, which are forked after loading it
+_recommender = None
+
+
+def read_profiles(path):
+    """
+    Reads the user profiles of a CSV file (with a header) or a JSON lines file
+    (with a `.jsonl` extension, or "-" to read them from STDIN). The lines of
+    the JSON lines files are decoded by the processes that score them.
+    :param path: Path of the input file.
+    :return: Generator of profiles (dictionaries or JSON lines).
+    """
+    if path.endswith(".csv"):
+        with open(path, "r", newline="") as fh:
+            for row in csv.DictReader(fh):
+                profile = {column: value for column, value in row.items() if value != ""}
+                for column in INTEGER_COLUMNS:
+                    if column in profile and profile[column].lstrip("-").isdigit():
+                        profile[column] = int(profile[column])
+                yield profile
+    else:
+        with (sys.stdin if path == "-" else open(path, "r")) as fh:
+            for line in fh:
+                if line.strip():
+                    yield line
+
+
+def recommend_block(block, max_recs):
+    """
+    Recommends the top movies for a block of profiles with a single call to the model.
+    :param block: List of profiles (dictionaries or JSON lines).
+    :param max_recs: Default number of recommendations of each profile.
+    :return: Text with a JSON line with the recommendations (or the error) of each profile.
+    """
+    results = [None] * len(block)
+    valid = []
+    for i, profile in enumerate(block):
+        try:
+            if not isinstance(profile, dict):
+                try:
+                    profile = json.loads(profile)
+                except ValueError:
+                    raise InvalidUsage("Invalid JSON line")
+            if not isinstance(profile, dict):
+                raise InvalidUsage("Invalid JSON line")
+            profile_id = profile.pop("id", None)
+            results[i] = {"id": profile_id} if profile_id is not None else {}
+            valid.append((i, check_recommend_data(profile)))
+        except InvalidUsage as e:
+            results[i] = dict(results[i] or {}, error=e.message)
+
+    users = [{key: data[key] for key in ("age", "gender", "occupation")} for _, data in valid]
+    for (i, data), ranking in zip(valid, _recommender.rank_many(users)):
+        indices, scores = ranking.top(data.get("max_recs", max_recs), data.get("offset", 0))
+        results[i]["recommendations"] = [_recommender.movies[index] for index in indices]
+        results[i]["scores"] = [float(score) for score in scores]
+
+    return "".join(json.dumps(result) + "\n" for result in results)
+
+
+def recommend_blocks(blocks, max_recs, n_processes):
+    """
+    Recommends the blocks in a pool of processes, keeping a bounded number of
+    blocks in flight, in the order of the input.
+    :return: Generator of the output of each block and its number of profiles.
+    """
+    if n_processes <= 1:
+        for block in blocks:
+            yield recommend_block(block, max_recs), len(block)
+        return
+
+    with multiprocessing.get_context("fork").Pool(n_processes) as pool:
+        pending = deque()
+        for block in blocks:
+            pending.append((pool.apply_async(recommend_block, (block, max_recs)), len(block)))
+            if len(pending) >= 2 * n_processes:
+                result, n_profiles = pending.popleft()
+                yield result.get(), n_profiles
+        while pending:
+            result, n_profiles = pending.popleft()
+            yield result.get(), n_profiles
+
+
+def get_done_profiles(path):
+    """
+    Counts the profiles already written to an output file, removing the last
+    line if it was not completely written.
+    :param path: Path of the output file.
+    :return: Number of complete lines of the file.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    n_lines = 0
+    end = 0
+    with open(path, "rb+") as fh:
+        offset = 0
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            n_lines += chunk.count(b"\n")
+            if b"\n" in chunk:
+                end = offset + chunk.rfind(b"\n") + 1
+            offset += len(chunk)
+        if end < offset:
+            fh.truncate(end)
+
+    return n_lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the recommendations of many user profiles " +
+                                                 "offline, without going through the API")
+    parser.add_argument("model_path",
+                        help="Path to the model (a model file or a directory of artifacts).",
+                        metavar="MODEL_PATH")
+    parser.add_argument("input_file",
+                        help="Path to the profiles: a CSV file with a header, or a JSON lines file " +
+                             "(\"-\" to read JSON lines from STDIN). Each profile has the parameters " +
+                             "of the /api/recommend resource and optionally an id.",
+                        metavar="INPUT_FILE")
+    parser.add_argument("output_file",
+                        help="Path to the output JSON lines file, with the recommendations of each " +
+                             "profile (in the order of the input).",
+                        metavar="OUTPUT_FILE")
+    parser.add_argument("--max-recs",
+                        type=int,
+                        default=10,
+                        help="Number of recommendations of the profiles without max_recs.")
+    parser.add_argument("--block-size",
+                        type=int,
+                        default=256,
+                        help="Number of profiles scored at once.")
+    parser.add_argument("--processes",
+                        type=int,
+                        default=1,
+                        help="Number of processes scoring the profiles.")
+    parser.add_argument("--inference-engine",
+                        choices=["sklearn", "flat"],
+                        default="sklearn",
+                        help="Inference engine to score the model with.")
+    parser.add_argument("--score-table",
+                        default=None,
+                        help="Path to a score table of the model to look up the rankings.")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="Skip the profiles already in the output file of an interrupted run, " +
+                             "instead of overwriting it.")
+    parser.add_argument("--report-interval",
+                        type=float,
+                        default=10.,
+                        help="Time (in seconds) between the reports of the throughput.")
+
+    args = parser.parse_args()
+
+    print("Loading model from %s" % args.model_path, file=sys.stderr)
+    _recommender = load_recommender(args.model_path)
+    if args.inference_engine == "flat" and not isinstance(_recommender.estimator, FlatForest):
+        _recommender.estimator = FlatForest.from_estimator(_recommender.estimator)
+    if args.score_table is not None:
+        score_table = ScoreTable.load(args.score_table, mmap_mode="r")
+        if not score_table.check_model(_recommender):
+            print("The score table in %s was not built for the model" % args.score_table, file=sys.stderr)
+            sys.exit(1)
+        _recommender.score_table = score_table
+
+    done = get_done_profiles(args.output_file) if args.resume else 0
+    if done > 0:
+        print("Resuming after %d profiles" % done, file=sys.stderr)
+
+    profiles = islice(read_profiles(args.input_file), done, None)
+    blocks = iter(lambda: list(islice(profiles, args.block_size)), [])
+
+    start = last_report = time.time()
+    n_profiles = 0
+    with open(args.output_file, "a" if args.resume else "w") as fh:
+        for output, n_block_profiles in recommend_blocks(blocks, args.max_recs, args.processes):
+            fh.write(output)
+            fh.flush()
+            n_profiles += n_block_profiles
+
+            if time.time() - last_report >= args.report_interval:
+                last_report = time.time()
+                print("%d profiles (%.0f profiles/s)" % (done + n_profiles, n_profiles / (last_report - start)),
+                      file=sys.stderr)
+
+    elapsed_time = time.time() - start
+    print("%d profiles recommended in %.2f seconds (%.0f profiles/s)" %
+          (n_profiles, elapsed_time, n_profiles / elapsed_time if elapsed_time > 0 else 0.), file=sys.stderr)
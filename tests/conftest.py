@@ -4,7 +4,7 @@ from __future__ import absolute_import, unicode_literals
 
 import pytest
 
-from tests.utils import get_test_client
+from tests.utils import get_dummy_forest_model, get_test_client
 
 
 @pytest.fixture
@@ -13,3 +13,9 @@ def client():
 
     yield client
 
+
+@pytest.fixture
+def forest_client():
+    client = get_test_client(model=get_dummy_forest_model())
+
+    yield client
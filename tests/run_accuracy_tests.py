@@ -3,23 +3,251 @@
 from __future__ import absolute_import, unicode_literals
 
 import argparse
+import csv
 import json
 import logging
+import multiprocessing
+import numpy as np
+import os
 import sys
+import time
 
-from sklearn.externals import joblib
+from collections import deque
+from itertools import islice
+
+# Make the application package importable when running the script directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask_app.artifacts import load_recommender  # noqa: E402
+from flask_app.forest import FlatForest  # noqa: E402
+
+# Models (and flat engine) shared with the worker processes, which are forked after loading them
+_recommender = None
+_forest = None
+_baseline = None
+
+
+class RegressionScore(object):
+    """
+    Mean squared error and R^2 score accumulated chunk by chunk. The mean and
+    sum of squared deviations of the targets of the chunks are merged with
+    the parallel algorithm of Chan et al., so the score matches the one of
+    the whole data without keeping it in memory.
+    """
+
+    def __init__(self, n=0, mean=0., m2=0., sse=0.):
+        """
+        :param n: Number of rows.
+        :param mean: Mean of the targets.
+        :param m2: Sum of the squared deviations of the targets from their mean.
+        :param sse: Sum of the squared errors of the predictions.
+        """
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.sse = sse
+
+    @classmethod
+    def from_predictions(cls, target, predictions):
+        target = np.asarray(target, dtype=np.float64)
+        if target.shape[0] == 0:
+            return cls()
+        mean = target.mean()
+        return cls(target.shape[0], mean, ((target - mean) ** 2).sum(), ((target - predictions) ** 2).sum())
+
+    def update(self, other):
+        """
+        Merges the score of other rows.
+        :param other: RegressionScore of the other rows.
+        """
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.sse += other.sse
+        self.n = n
+
+    @property
+    def mse(self):
+        return self.sse / self.n if self.n > 0 else 0.
+
+    @property
+    def r2(self):
+        # Same conventions as scikit-learn's r2_score for constant targets
+        if self.m2 == 0:
+            return 1. if self.sse == 0 else 0.
+        return 1 - self.sse / self.m2
+
+
+def get_numeric_features(vectorizer):
+    """
+    Returns the numeric features of a `DictVectorizer` (the ones that are not
+    one-hot encoded from a string value).
+    :param vectorizer: Fitted `DictVectorizer`.
+    :return: Set with the names of the numeric features.
+    """
+    return {feature for feature in vectorizer.feature_names_ if vectorizer.separator not in feature}
+
+
+class TestData(object):
+    """
+    Test data read in chunks. The file is either a JSON object with the
+    `data`, `target` and `expected_score` keys, a JSON lines file (with a
+    `.jsonl` extension) with an object with the `data` and `target` of a row
+    per line and optionally a line with the `expected_score`, or a CSV file
+    (with a `.csv` extension) with a header, a column per field of the data
+    and a `target` column. JSON lines and CSV files are streamed.
+    """
+
+    def __init__(self, path, chunk_size, numeric_columns=()):
+        """
+        :param path: Path of the test file.
+        :param chunk_size: Number of rows of each chunk.
+        :param numeric_columns: Columns of the CSV files with numeric values
+            (the values of the rest are strings, and empty values are missing).
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.numeric_columns = set(numeric_columns)
+        self.expected_score = None
+
+    def rows(self):
+        if self.path.endswith(".csv"):
+            with open(self.path, "r", newline="") as fh:
+                for row in csv.DictReader(fh):
+                    target = float(row.pop("target"))
+                    yield {column: float(value) if column in self.numeric_columns else value
+                           for column, value in row.items() if value != ""}, target
+            return
+
+        if not self.path.endswith(".jsonl"):
+            with open(self.path, "r") as fh:
+                test_data = json.load(fh)
+            self.expected_score = test_data["expected_score"]
+            for row in zip(test_data["data"], test_data["target"]):
+                yield row
+            return
+
+        # The lines of the rows are decoded by the processes that score them
+        with open(self.path, "r") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                if "expected_score" in line:
+                    line = json.loads(line)
+                    if "expected_score" in line:
+                        self.expected_score = line["expected_score"]
+                        continue
+                yield line
+
+    def __iter__(self):
+        rows = self.rows()
+        return iter(lambda: list(islice(rows, self.chunk_size)), [])
+
+
+def get_row(row):
+    if isinstance(row, tuple):
+        return row
+    if not isinstance(row, dict):
+        row = json.loads(row)
+    return row["data"], row["target"]
+
+
+def score_chunk(chunk):
+    """
+    Scores a chunk of the test data with the shared model.
+    :param chunk: List of data and target pairs (or of JSON lines with them).
+    :return: Tuple with the RegressionScore of the chunk, the maximum
+        difference between the flat engine and the model predictions (if the
+        flat engine is checked), the RegressionScore of the baseline model (if
+        any) and the maximum difference between the predictions of the model
+        and the baseline model.
+    """
+    data, target = zip(*map(get_row, chunk))
+    X = _recommender.vectorizer.transform(list(data))
+    predictions = _recommender.estimator.predict(X)
+
+    engine_error = 0.
+    if _forest is not None:
+        engine_predictions = _forest.predict(X)
+        engine_error = np.abs(engine_predictions - predictions).max()
+        predictions = engine_predictions
+
+    if _baseline is None:
+        return RegressionScore.from_predictions(target, predictions), engine_error, None, 0.
+
+    baseline_predictions = _baseline.estimator.predict(_baseline.vectorizer.transform(list(data)))
+    return (RegressionScore.from_predictions(target, predictions), engine_error,
+            RegressionScore.from_predictions(target, baseline_predictions),
+            np.abs(predictions - baseline_predictions).max())
+
+
+def score_chunks(chunks, n_processes):
+    """
+    Scores the chunks in a pool of processes, keeping a bounded number of
+    chunks in flight so the test data is never fully in memory.
+    :param chunks: Iterable of chunks.
+    :param n_processes: Number of processes (1 to score them in this process).
+    :return: Generator of the results of `score_chunk` for each chunk.
+    """
+    if n_processes <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk)
+        return
+
+    with multiprocessing.get_context("fork").Pool(n_processes) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(score_chunk, (chunk,)))
+            if len(pending) >= 2 * n_processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script to run accuracy tests over the model.")
     parser.add_argument("model_file",
-                        help="Path to the model file.")
+                        help="Path to the model file (or directory of artifacts).")
     parser.add_argument("test_file",
-                        help="Path to test file.")
+                        help="Path to test file (JSON, JSON lines with a .jsonl extension, or CSV " +
+                             "with a .csv extension).")
     parser.add_argument("--error-tolerance",
                         type=float,
                         default=1e-5,
                         help="Error tolerance for the model score.")
+    parser.add_argument("--inference-engine",
+                        choices=["sklearn", "flat"],
+                        default="sklearn",
+                        help="Inference engine to score the model with. The flat engine is also " +
+                             "checked to give the same predictions as scikit-learn.")
+    parser.add_argument("--engine-tolerance",
+                        type=float,
+                        default=1e-6,
+                        help="Maximum difference between the predictions of the flat engine " +
+                             "and the scikit-learn model.")
+    parser.add_argument("--expected-score",
+                        type=float,
+                        default=None,
+                        help="Expected score of the model (overrides the one of the test file).")
+    parser.add_argument("--chunk-size",
+                        type=int,
+                        default=10000,
+                        help="Number of rows of test data scored at once.")
+    parser.add_argument("--processes",
+                        type=int,
+                        default=1,
+                        help="Number of processes scoring the chunks of test data.")
+    parser.add_argument("--baseline-model",
+                        default=None,
+                        help="Path to a model (e.g. the original of a compact model) to report the " +
+                             "difference of the scores with.")
+    parser.add_argument("--max-score-loss",
+                        type=float,
+                        default=None,
+                        help="Maximum decrease of the model score with respect to the baseline model.")
 
     args = parser.parse_args()
 
@@ -32,17 +260,58 @@ if __name__ == "__main__":
     logger.addHandler(consoleHandler)
 
     logger.info("Loading model from %s" % args.model_file)
-    model = joblib.load(args.model_file)
+    _recommender = load_recommender(args.model_file)
+    if args.inference_engine == "flat" and isinstance(_recommender.estimator, FlatForest):
+        logger.info("The model is already a flat forest")
+    elif args.inference_engine == "flat":
+        logger.info("Checking the predictions of the flat inference engine")
+        _forest = FlatForest.from_estimator(_recommender.estimator)
+
+    if args.baseline_model is not None:
+        logger.info("Loading baseline model from %s" % args.baseline_model)
+        _baseline = load_recommender(args.baseline_model)
+
+    logger.info("Scoring test data from %s" % args.test_file)
+    test_data = TestData(args.test_file, args.chunk_size, get_numeric_features(_recommender.vectorizer))
+
+    start = time.perf_counter()
+    score = RegressionScore()
+    baseline_score = RegressionScore()
+    engine_error = baseline_difference = 0.
+    for chunk_score, chunk_engine_error, chunk_baseline_score, chunk_baseline_difference in \
+            score_chunks(test_data, args.processes):
+        score.update(chunk_score)
+        engine_error = max(engine_error, chunk_engine_error)
+        if chunk_baseline_score is not None:
+            baseline_score.update(chunk_baseline_score)
+            baseline_difference = max(baseline_difference, chunk_baseline_difference)
+    elapsed_time = time.perf_counter() - start
 
-    logger.info("Loading test data from %s" % args.test_file)
-    with open(args.test_file, "r") as fh:
-        test_data = json.load(fh)
+    logger.info("Scored %d rows in %.2fs (%.0f rows/s)" % (score.n, elapsed_time, score.n / elapsed_time))
+    logger.info("Model scores: R^2 %.6f, MSE %.6f" % (score.r2, score.mse))
+
+    if args.baseline_model is not None:
+        logger.info("Baseline model scores: R^2 %.6f, MSE %.6f" % (baseline_score.r2, baseline_score.mse))
+        logger.info("Difference with the baseline model: R^2 %+.6f, MSE %+.6f, maximum prediction difference %g" %
+                    (score.r2 - baseline_score.r2, score.mse - baseline_score.mse, baseline_difference))
+        if args.max_score_loss is not None and baseline_score.r2 - score.r2 > args.max_score_loss:
+            logger.error("The model score is less than the baseline model score beyond the maximum loss")
+            sys.exit(1)
+
+    if args.inference_engine == "flat":
+        logger.info("Maximum difference with the scikit-learn predictions: %g" % engine_error)
+        if engine_error > args.engine_tolerance:
+            logger.error("The flat inference engine predictions differ from the model predictions")
+            sys.exit(1)
 
     logger.info("Checking scores")
-    model_score = model.score(test_data["data"], test_data["target"])
-    if model_score < (test_data["expected_score"] - args.error_tolerance):
+    expected_score = args.expected_score if args.expected_score is not None else test_data.expected_score
+    if expected_score is None:
+        logger.error("The test data has no expected score")
+        sys.exit(1)
+
+    if score.r2 < (expected_score - args.error_tolerance):
         logger.error("The model score is less than the expected score")
         sys.exit(1)
 
     logger.info("Accuracy test finished successfully")
-
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import json
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+from sklearn.externals import joblib
+
+# Make the application package importable when running the script directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask_app.json_backend import JSON_BACKENDS, get_json_functions  # noqa: E402
+from flask_app.recommender import Recommender  # noqa: E402
+from flask_app.utils import InvalidUsage, check_recommend_data  # noqa: E402
+from tests.utils import get_authentication_headers, get_dummy_forest_model, get_test_client  # noqa: E402
+
+RECOMMEND_DATA = {"age": 30, "gender": "F", "occupation": "engineer", "max_recs": 10}
+INVALID_RECOMMEND_DATA = {"age": 30, "gender": "F", "occupation": "astronaut"}
+RECOMMEND_RESPONSE = {"recommendations": ["Movie %d (1995)" % i for i in range(10)],
+                      "id": "b0fa1f5e-9f4a-4a8e-8d57-6a0c3e3c1a6e", "model_version": "1.0.0"}
+MAX_RECS = (1, 10, 100)
+
+# Statistic of the benchmarks compared against the baseline
+BASELINE_STATISTIC = "p50"
+
+
+def measure(fn, n_iterations):
+    """
+    Measures the latency of the calls to a function.
+    :param fn: Function to measure (without arguments).
+    :param n_iterations: Number of calls to the function.
+    :return: Dictionary with the mean and percentiles of the latency (in
+        microseconds) and the throughput (in calls per second).
+    """
+    fn()
+    times = np.empty(n_iterations)
+    start = time.perf_counter()
+    for i in range(n_iterations):
+        call_start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - call_start
+    total_time = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1e6
+    return {
+        "mean": float(times.mean() * 1e6),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "throughput": n_iterations / total_time
+    }
+
+
+def check_invalid_data():
+    try:
+        check_recommend_data(INVALID_RECOMMEND_DATA)
+    except InvalidUsage:
+        pass
+
+
+def run_validation_benchmarks(n_iterations):
+    return {
+        "validation.valid": measure(lambda: check_recommend_data(dict(RECOMMEND_DATA)), n_iterations),
+        "validation.invalid": measure(check_invalid_data, n_iterations)
+    }
+
+
+def run_json_benchmarks(n_iterations):
+    results = {}
+    request_body = json.dumps(RECOMMEND_DATA).encode("utf-8")
+
+    for backend in sorted(JSON_BACKENDS - {"flask"}):
+        try:
+            loads, dumps = get_json_functions(backend)
+        except ValueError:
+            continue
+        results["json.%s.decode" % backend] = measure(lambda: loads(request_body), n_iterations)
+        results["json.%s.encode" % backend] = measure(lambda: dumps(RECOMMEND_RESPONSE), n_iterations)
+
+    return results
+
+
+def run_model_benchmarks(n_iterations, model):
+    recommender = Recommender.from_pipeline(model)
+    user = {key: RECOMMEND_DATA[key] for key in ("age", "gender", "occupation")}
+    catalogue = [dict(user, movie=movie) for movie in recommender.movies]
+
+    return {
+        "model.pipeline.predict": measure(lambda: model.predict(catalogue), n_iterations),
+        "model.recommender.predict": measure(lambda: recommender.predict(user), n_iterations)
+    }
+
+
+def run_startup_benchmarks(n_iterations, model):
+    return {
+        "startup.create_app": measure(lambda: get_test_client(model=model), n_iterations)
+    }
+
+
+def run_login_benchmarks(n_iterations, model):
+    # Without the cache and the rate limit, so every login verifies the password
+    client = get_test_client(model=model, extra_config={"LOGIN_CACHE_TTL": 0, "LOGIN_RATE_LIMIT": 0})
+
+    return {
+        "request.login": measure(lambda: client.post("/api/login", json={"session_password": "test-password"}),
+                                 n_iterations)
+    }
+
+
+def run_request_benchmarks(n_iterations, model):
+    results = {}
+
+    for backend in sorted(JSON_BACKENDS):
+        try:
+            client = get_test_client(model=model, extra_config={"JSON_BACKEND": backend,
+                                                                "RECOMMENDATIONS_CACHE_SIZE": 0})
+        except Exception:
+            continue
+        headers = get_authentication_headers(client)
+        results["request.%s.recommend" % backend] = measure(
+            lambda: client.post("/api/recommend", json=RECOMMEND_DATA, headers=headers), n_iterations)
+
+    client = get_test_client(model=model, extra_config={"RECOMMENDATIONS_CACHE_SIZE": 0})
+    headers = get_authentication_headers(client)
+    for max_recs in MAX_RECS:
+        data = dict(RECOMMEND_DATA, max_recs=max_recs)
+        results["request.recommend.max_recs_%d" % max_recs] = measure(
+            lambda: client.post("/api/recommend", json=data, headers=headers), n_iterations)
+
+    recommendation = client.post("/api/recommend", json=RECOMMEND_DATA, headers=headers).get_json()
+    score_data = {"id": recommendation["id"], "movie": recommendation["recommendations"][0], "score": 4.}
+    results["request.score"] = measure(
+        lambda: client.post("/api/recommend/score", json=score_data, headers=headers), n_iterations)
+
+    return results
+
+
+def get_regressions(results, baseline, max_regression):
+    """
+    Compares the results of the benchmarks with the ones of a baseline.
+    :param results: Dictionary with the results of the benchmarks.
+    :param baseline: Dictionary with the results of the baseline.
+    :param max_regression: Maximum relative increase of the latency over the baseline.
+    :return: List of tuples with the name, baseline latency and latency of the
+        benchmarks slower than the baseline beyond the maximum regression.
+    """
+    regressions = []
+
+    for name in sorted(set(results) & set(baseline)):
+        baseline_value = baseline[name][BASELINE_STATISTIC]
+        value = results[name][BASELINE_STATISTIC]
+        if value > baseline_value * (1 + max_regression):
+            regressions.append((name, baseline_value, value))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Script to run the benchmarks of the application.")
+    parser.add_argument("--model-file",
+                        default=None,
+                        help="Path to the model file (defaults to a small random forest).")
+    parser.add_argument("--iterations",
+                        type=int,
+                        default=10000,
+                        help="Number of iterations of the micro benchmarks.")
+    parser.add_argument("--request-iterations",
+                        type=int,
+                        default=500,
+                        help="Number of requests (and predictions) of the request benchmarks.")
+    parser.add_argument("--login-iterations",
+                        type=int,
+                        default=20,
+                        help="Number of requests of the login benchmark.")
+    parser.add_argument("--startup-iterations",
+                        type=int,
+                        default=5,
+                        help="Number of applications created by the startup benchmark.")
+    parser.add_argument("--output",
+                        default=None,
+                        help="Path to write the results (in JSON format), which can be used as baseline.")
+    parser.add_argument("--baseline",
+                        default=None,
+                        help="Path to the results of a previous run to compare with.")
+    parser.add_argument("--max-regression",
+                        type=float,
+                        default=0.25,
+                        help="Maximum relative increase of the median latency of a benchmark over " +
+                             "the baseline. The script fails if a benchmark exceeds it.")
+
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    model = joblib.load(args.model_file) if args.model_file is not None else get_dummy_forest_model()
+
+    results = {}
+    results.update(run_validation_benchmarks(args.iterations))
+    results.update(run_json_benchmarks(args.iterations))
+    results.update(run_model_benchmarks(args.request_iterations, model))
+    results.update(run_startup_benchmarks(args.startup_iterations, model))
+    results.update(run_login_benchmarks(args.login_iterations, model))
+    results.update(run_request_benchmarks(args.request_iterations, model))
+
+    print("%-40s %12s %12s %12s %12s %12s" % ("benchmark", "mean (us)", "p50 (us)", "p95 (us)", "p99 (us)",
+                                              "calls/s"))
+    for name in sorted(results):
+        print("%-40s %12.2f %12.2f %12.2f %12.2f %12.2f" % (name, results[name]["mean"], results[name]["p50"],
+                                                            results[name]["p95"], results[name]["p99"],
+                                                            results[name]["throughput"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as fh:
+            regressions = get_regressions(results, json.load(fh), args.max_regression)
+
+        for name, baseline_value, value in regressions:
+            print("Regression in %s: %.2fus (baseline %.2fus)" % (name, value, baseline_value))
+
+        if regressions:
+            sys.exit("%d benchmarks regressed more than %.0f%% over the baseline" %
+                     (len(regressions), args.max_regression * 100))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import json
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+from sklearn.externals import joblib
+
+# Make the application package importable when running the script directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask_app.evaluation import get_top_k  # noqa: E402
+from flask_app.forest import FlatForest  # noqa: E402
+from flask_app.prefilter import DemographicPrefilter  # noqa: E402
+from flask_app.recommender import Recommender  # noqa: E402
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS  # noqa: E402
+
+
+def get_users(min_age, max_age):
+    """
+    Returns every user of the given range of ages.
+    :return: List of dictionaries with the user data (age, gender, occupation).
+    """
+    return [{"age": age, "gender": gender, "occupation": occupation}
+            for age in range(min_age, max_age + 1)
+            for gender in sorted(VALID_GENDERS) for occupation in sorted(VALID_OCCUPATIONS)]
+
+
+def get_recall(recommender, users, full_top_indices, k, block_size):
+    """
+    Computes the recall of the top k movies of the recommender with respect to the ones of the full scoring.
+    :return: Tuple with the mean and the minimum recall over the users.
+    """
+    recalls = np.empty(len(users))
+    for start in range(0, len(users), block_size):
+        rankings = recommender.rank_many(users[start:start + block_size])
+        for i, ranking in enumerate(rankings, start):
+            recalls[i] = np.intersect1d(ranking.top(k)[0], full_top_indices[i]).shape[0] / float(k)
+
+    return float(recalls.mean()), float(recalls.min())
+
+
+def measure_latency(recommender, users, k, n_samples):
+    """
+    Measures the latency of the recommendations of a sample of the users.
+    :return: Dictionary with the p50 and p95 latencies (in milliseconds).
+    """
+    sample = users[::max(len(users) // n_samples, 1)][:n_samples]
+    times = []
+    for data in sample:
+        start = time.perf_counter()
+        recommender.recommend(data, k)
+        times.append(time.perf_counter() - start)
+
+    p50, p95 = np.percentile(times, [50, 95]) * 1000
+    return {"p50": float(p50), "p95": float(p95)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Script to measure the recall of the two-stage " +
+                                                 "recommendations with respect to scoring all the movies.")
+    parser.add_argument("model_file",
+                        help="Path to the model file.")
+    parser.add_argument("--candidates",
+                        type=int,
+                        nargs="+",
+                        default=[50, 100, 200, 400],
+                        help="Numbers of candidates of the prefilter to evaluate.")
+    parser.add_argument("--k",
+                        type=int,
+                        default=10,
+                        help="Number of top recommendations compared.")
+    parser.add_argument("--min-recall",
+                        type=float,
+                        default=0.95,
+                        help="Minimum mean recall to suggest a number of candidates.")
+    parser.add_argument("--min-age",
+                        type=int,
+                        default=7,
+                        help="Minimum age of the evaluated users.")
+    parser.add_argument("--max-age",
+                        type=int,
+                        default=73,
+                        help="Maximum age of the evaluated users.")
+    parser.add_argument("--inference-engine",
+                        choices=["sklearn", "flat"],
+                        default="sklearn",
+                        help="Inference engine to score the model with.")
+    parser.add_argument("--block-size",
+                        type=int,
+                        default=256,
+                        help="Number of users scored at once.")
+    parser.add_argument("--latency-samples",
+                        type=int,
+                        default=200,
+                        help="Number of users whose recommendations are timed.")
+    parser.add_argument("--output",
+                        default=None,
+                        help="Path to write the results (in JSON format).")
+
+    args = parser.parse_args()
+
+    logFormatter = logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s")
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setFormatter(logFormatter)
+    logger.addHandler(consoleHandler)
+
+    logger.info("Loading model from %s" % args.model_file)
+    recommender = Recommender.from_pipeline(joblib.load(args.model_file))
+    if args.inference_engine == "flat":
+        recommender.estimator = FlatForest.from_estimator(recommender.estimator)
+
+    # Every user of the API in the range of ages is evaluated
+    users = get_users(args.min_age, args.max_age)
+    logger.info("Scoring all the movies for %d users" % len(users))
+    full_top_indices = np.concatenate([get_top_k(recommender.predict_many(users[start:start + args.block_size]),
+                                                 args.k)
+                                       for start in range(0, len(users), args.block_size)])
+
+    results = {"full": {"latency_ms": measure_latency(recommender, users, args.k, args.latency_samples)}}
+    logger.info("Full scoring of %d movies: latency %s" % (len(recommender.movies), results["full"]["latency_ms"]))
+
+    suggested = None
+    for n_candidates in sorted(args.candidates):
+        recommender.prefilter = DemographicPrefilter.build(recommender, n_candidates)
+        mean_recall, min_recall = get_recall(recommender, users, full_top_indices, args.k, args.block_size)
+        latency = measure_latency(recommender, users, args.k, args.latency_samples)
+        results[n_candidates] = {"recall@%d" % args.k: mean_recall, "min_recall@%d" % args.k: min_recall,
+                                 "latency_ms": latency}
+        logger.info("%d candidates: recall@%d %.4f (min %.4f), latency %s" %
+                    (n_candidates, args.k, mean_recall, min_recall, latency))
+
+        if suggested is None and mean_recall >= args.min_recall:
+            suggested = n_candidates
+
+    if suggested is not None:
+        logger.info("Smallest number of candidates with a recall@%d of at least %g: %d" %
+                    (args.k, args.min_recall, suggested))
+    else:
+        logger.warn("No number of candidates has a recall@%d of at least %g" % (args.k, args.min_recall))
+
+    if args.output is not None:
+        with open(args.output, "w") as fh:
+            json.dump({str(name): result for name, result in results.items()}, fh, indent=2, sort_keys=True)
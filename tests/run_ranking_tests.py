@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import argparse
+import json
+import logging
+import numpy as np
+import os
+import sys
+import time
+
+from collections import OrderedDict
+
+# Make the application package importable when running the script directly
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask_app.artifacts import load_recommender  # noqa: E402
+from flask_app.evaluation import RankingEvaluation  # noqa: E402
+from flask_app.forest import FlatForest  # noqa: E402
+
+USER_FIELDS = ("age", "gender", "occupation")
+
+
+def read_ratings(path):
+    """
+    Reads the held-out ratings, in the format of the accuracy test data (a
+    JSON object with the `data` and `target` lists, or a JSON lines file with
+    an object with the `data` and `target` of a rating per line). The ratings
+    are grouped by the `user` of the rows (a `users` list in the JSON object,
+    or a `user` key in the lines), or by the user profile if there's none.
+    :param path: Path of the test file.
+    :return: Generator of tuples with the user profile, movie and rating.
+    """
+    if not path.endswith(".jsonl"):
+        with open(path, "r") as fh:
+            test_data = json.load(fh)
+        users = test_data.get("users", [None] * len(test_data["data"]))
+        for user, data, target in zip(users, test_data["data"], test_data["target"]):
+            yield user, data, target
+        return
+
+    with open(path, "r") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            line = json.loads(line)
+            if "data" in line:
+                yield line.get("user"), line["data"], line["target"]
+
+
+def get_users(path, movie_indices):
+    """
+    Groups the held-out ratings by user.
+    :param path: Path of the test file.
+    :param movie_indices: Dictionary with the index of each movie of the model.
+    :return: Tuple with the list of user profiles, the list of dictionaries
+        with the rating of the movies of each user, and the number of ratings
+        of movies unknown to the model.
+    """
+    users = OrderedDict()
+    unknown = 0
+
+    for user, data, target in read_ratings(path):
+        profile = tuple(data[field] for field in USER_FIELDS)
+        ratings = users.setdefault(user if user is not None else profile, (profile, {}))[1]
+        if data["movie"] in movie_indices:
+            ratings[movie_indices[data["movie"]]] = target
+        else:
+            unknown += 1
+
+    return [dict(zip(USER_FIELDS, profile)) for profile, _ in users.values()], \
+        [ratings for _, ratings in users.values()], unknown
+
+
+def measure_latency(recommender, profiles, max_recs, n_samples):
+    """
+    Measures the latency of the recommendations served to a sample of the users.
+    :return: Dictionary with the p50, p95 and p99 latencies (in milliseconds).
+    """
+    times = []
+    for data in profiles[:n_samples]:
+        start = time.perf_counter()
+        recommender.recommend(data, max_recs)
+        times.append(time.perf_counter() - start)
+
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000 if times else (0., 0., 0.)
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Script to evaluate the rankings of the recommendations " +
+                                                 "of the model over held-out ratings.")
+    parser.add_argument("model_file",
+                        help="Path to the model file (or directory of artifacts).")
+    parser.add_argument("test_file",
+                        help="Path to test file (JSON, or JSON lines with a .jsonl extension).")
+    parser.add_argument("--k",
+                        type=int,
+                        nargs="+",
+                        default=[5, 10, 20],
+                        help="Numbers of top recommendations to evaluate.")
+    parser.add_argument("--relevance-threshold",
+                        type=float,
+                        default=4.,
+                        help="Minimum rating of a movie to be relevant to a user.")
+    parser.add_argument("--block-size",
+                        type=int,
+                        default=256,
+                        help="Number of users scored at once.")
+    parser.add_argument("--inference-engine",
+                        choices=["sklearn", "flat"],
+                        default="sklearn",
+                        help="Inference engine to score the model with.")
+    parser.add_argument("--latency-samples",
+                        type=int,
+                        default=200,
+                        help="Number of users whose recommendations are timed one by one.")
+    parser.add_argument("--output",
+                        default=None,
+                        help="Path to write the results (in JSON format).")
+
+    args = parser.parse_args()
+
+    logFormatter = logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s")
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    consoleHandler = logging.StreamHandler()
+    consoleHandler.setFormatter(logFormatter)
+    logger.addHandler(consoleHandler)
+
+    logger.info("Loading model from %s" % args.model_file)
+    recommender = load_recommender(args.model_file)
+    if args.inference_engine == "flat" and not isinstance(recommender.estimator, FlatForest):
+        recommender.estimator = FlatForest.from_estimator(recommender.estimator)
+
+    logger.info("Loading held-out ratings from %s" % args.test_file)
+    movie_indices = {movie: i for i, movie in enumerate(recommender.movies)}
+    profiles, ratings, unknown = get_users(args.test_file, movie_indices)
+    if unknown > 0:
+        logger.warn("%d ratings of movies unknown to the model were skipped" % unknown)
+
+    logger.info("Evaluating the rankings of %d users" % len(profiles))
+    evaluation = RankingEvaluation(args.k)
+    scoring_time = 0.
+    for start in range(0, len(profiles), args.block_size):
+        block_start = time.perf_counter()
+        scores = recommender.predict_many(profiles[start:start + args.block_size])
+        scoring_time += time.perf_counter() - block_start
+
+        relevant = np.zeros(scores.shape, dtype=np.bool_)
+        for row, user_ratings in enumerate(ratings[start:start + args.block_size]):
+            movies = [movie for movie, rating in user_ratings.items() if rating >= args.relevance_threshold]
+            relevant[row, movies] = True
+        evaluation.update(scores, relevant)
+
+    results = evaluation.results()
+    results["users"] = evaluation.n_users
+    results["users_per_second"] = len(profiles) / scoring_time if scoring_time > 0 else 0.
+    results["latency_ms"] = measure_latency(recommender, profiles, max(args.k), args.latency_samples)
+
+    for name in sorted(results):
+        logger.info("%s: %s" % (name, results[name]))
+
+    if args.output is not None:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+
+    logger.info("Ranking evaluation finished successfully")
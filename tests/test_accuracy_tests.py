@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import csv
+import json
+import numpy as np
+import pytest
+
+from sklearn.metrics import mean_squared_error, r2_score
+
+from flask_app.recommender import Recommender
+from tests import run_accuracy_tests as accuracy_tests
+from tests.utils import get_dummy_forest_model
+
+
+def get_test_rows(n_rows):
+    rng = np.random.RandomState(0)
+    return [({"age": int(rng.randint(1, 80)), "gender": "F" if i % 2 else "M", "movie": "Movie %d" % (i % 7)},
+             float(rng.randint(1, 6))) for i in range(n_rows)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 50, 1000])
+def test_regression_score_chunks(chunk_size):
+    """ Tests the scores accumulated chunk by chunk are the scores of the whole data """
+    rng = np.random.RandomState(0)
+    target = rng.randint(1, 6, size=200).astype(np.float64)
+    predictions = target + rng.normal(scale=0.8, size=200)
+
+    score = accuracy_tests.RegressionScore()
+    for start in range(0, target.shape[0], chunk_size):
+        score.update(accuracy_tests.RegressionScore.from_predictions(target[start:start + chunk_size],
+                                                                     predictions[start:start + chunk_size]))
+
+    assert score.n == 200
+    assert np.isclose(score.r2, r2_score(target, predictions))
+    assert np.isclose(score.mse, mean_squared_error(target, predictions))
+
+
+def test_regression_score_constant():
+    """ Tests the score of constant targets follows the conventions of scikit-learn """
+    score = accuracy_tests.RegressionScore.from_predictions([3., 3.], np.array([3., 3.]))
+    assert score.r2 == r2_score([3., 3.], [3., 3.])
+
+    score.update(accuracy_tests.RegressionScore.from_predictions([3.], np.array([2.])))
+    assert score.r2 == 0.
+    assert np.isclose(score.mse, mean_squared_error([3.] * 3, [3., 3., 2.]))
+
+
+@pytest.mark.parametrize("extension", ["json", "jsonl", "csv"])
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+def test_test_data_formats(tmpdir, extension, chunk_size):
+    """ Tests the rows of the test data are read in chunks in every format """
+    rows = get_test_rows(10)
+    path = str(tmpdir.join("test_data.%s" % extension))
+
+    with open(path, "w") as fh:
+        if extension == "json":
+            json.dump({"data": [data for data, _ in rows], "target": [target for _, target in rows],
+                       "expected_score": 0.5}, fh)
+        elif extension == "jsonl":
+            fh.write(json.dumps({"expected_score": 0.5}) + "\n\n")
+            for data, target in rows:
+                fh.write(json.dumps({"data": data, "target": target}) + "\n")
+        else:
+            writer = csv.DictWriter(fh, ["age", "gender", "movie", "target"])
+            writer.writeheader()
+            for data, target in rows:
+                writer.writerow(dict(data, target=target))
+
+    test_data = accuracy_tests.TestData(path, chunk_size, numeric_columns=["age"])
+    chunks = list(test_data)
+
+    assert [len(chunk) for chunk in chunks[:-1]] == [chunk_size] * (len(chunks) - 1)
+    assert [accuracy_tests.get_row(row) for chunk in chunks for row in chunk] == rows
+    if extension != "csv":
+        assert test_data.expected_score == 0.5
+
+
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_score_chunks(monkeypatch, n_processes):
+    """ Tests the chunks scored by many processes give the scores of the whole data """
+    model = get_dummy_forest_model()
+    monkeypatch.setattr(accuracy_tests, "_recommender", Recommender.from_pipeline(model))
+    rows = [(dict(data, movie="Movie %d" % (i % 20)), target) for i, (data, target) in enumerate(get_test_rows(50))]
+    chunks = [rows[start:start + 8] for start in range(0, len(rows), 8)]
+
+    score = accuracy_tests.RegressionScore()
+    for chunk_score, _, _, _ in accuracy_tests.score_chunks(chunks, n_processes):
+        score.update(chunk_score)
+
+    predictions = model.predict([data for data, _ in rows])
+    assert np.isclose(score.r2, r2_score([target for _, target in rows], predictions))
@@ -2,6 +2,10 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import pytest
+
+from tests.utils import get_authentication_headers, get_test_client
+
 
 def test_index(client):
     """ Tests the basic application """
@@ -15,3 +19,25 @@ def test_index(client):
     assert "hello" in response_message
     assert "world" in response_message
 
+
+@pytest.mark.parametrize("json_backend", ["flask", "json", "orjson", "ujson"])
+def test_json_backend(json_backend):
+    """ Tests the application decodes and encodes the JSON with each backend """
+    if json_backend in {"orjson", "ujson"}:
+        pytest.importorskip(json_backend)
+
+    client = get_test_client(extra_config={"JSON_BACKEND": json_backend})
+    headers = get_authentication_headers(client)
+
+    response = client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer"},
+                           headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["recommendations"] == ["Test"]
+
+    response = client.post("/api/recommend", data="{invalid", content_type="application/json", headers=headers)
+    assert response.status_code == 400
+
+    response = client.post("/api/recommend", json={"age": 30, "gender": "X", "occupation": "engineer"},
+                           headers=headers)
+    assert response.status_code == 400
+    assert "gender" in response.get_json()["message"]
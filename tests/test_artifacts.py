@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import pytest
+
+from flask_app.artifacts import export_artifacts, is_artifacts_directory, load_artifacts
+from flask_app.forest import FlatForest
+from flask_app.recommender import Recommender
+from flask_app.score_table import ScoreTable
+from tests.utils import get_dummy_forest_model, get_dummy_test_model,\
+    get_authentication_headers, get_test_client
+
+
+@pytest.fixture(scope="module")
+def model():
+    yield get_dummy_forest_model()
+
+
+@pytest.mark.parametrize("data", [
+    {"age": 25, "gender": "M", "occupation": "engineer"},
+    {"age": 70, "gender": "O", "occupation": "none"}
+])
+def test_flat_forest(model, data):
+    """ Tests the flat forest gives the same predictions as the model """
+    recommender = Recommender.from_pipeline(model)
+    forest = FlatForest.from_estimator(recommender.estimator)
+    X = recommender.candidates(data)
+
+    assert np.allclose(forest.predict(X), recommender.estimator.predict(X))
+    assert np.allclose(forest.predict(X.toarray()), recommender.estimator.predict(X))
+
+
+def test_flat_forest_not_supported():
+    """ Tests only tree based models are exported """
+    with pytest.raises(ValueError):
+        FlatForest.from_estimator(Recommender.from_pipeline(get_dummy_test_model()).estimator)
+
+
+def test_export_load(model, tmpdir):
+    """ Tests the exported artifacts are memory-mapped and give the same results as the model """
+    path = str(tmpdir.join("model"))
+    recommender = Recommender.from_pipeline(model)
+    export_artifacts(path, model, ScoreTable.build(recommender))
+
+    assert is_artifacts_directory(path)
+    assert not is_artifacts_directory(str(tmpdir))
+
+    loaded_recommender = load_artifacts(path)
+    assert isinstance(loaded_recommender.estimator.threshold, np.memmap)
+    assert isinstance(loaded_recommender.score_table.rankings, np.memmap)
+    assert loaded_recommender.score_table.check_model(loaded_recommender)
+    assert loaded_recommender.movies == recommender.movies
+
+    data = {"age": 40, "gender": "F", "occupation": "writer"}
+    indices, scores = recommender.recommend(data)
+    loaded_indices, loaded_scores = loaded_recommender.recommend(data)
+    assert np.array_equal(indices, loaded_indices)
+    assert np.allclose(scores, loaded_scores)
+
+
+def test_flat_forest_blocks(model):
+    """ Tests the flat forest gives the same predictions when evaluated in blocks """
+    recommender = Recommender.from_pipeline(model)
+    forest = FlatForest.from_estimator(recommender.estimator)
+    X = recommender.candidates({"age": 33, "gender": "F", "occupation": "student"})
+
+    forest.max_block_size = 7
+    assert np.allclose(forest.predict(X), recommender.estimator.predict(X))
+
+
+def test_flat_inference_engine(model):
+    """ Tests the application serves the same recommendations with the flat inference engine """
+    request_data = {"age": 30, "gender": "M", "occupation": "engineer", "max_recs": 5}
+    recommendations = []
+
+    for engine in ["sklearn", "flat"]:
+        client = get_test_client(model=model, extra_config={"INFERENCE_ENGINE": engine})
+        headers = get_authentication_headers(client)
+        response = client.post("/api/recommend", json=request_data, headers=headers)
+
+        assert response.status_code == 200
+        recommendations.append(response.get_json()["recommendations"])
+
+    assert recommendations[0] == recommendations[1]
+
+
+def test_compact_forest(model):
+    """ Tests the float32 thresholds of the compact forest take exactly the same splits """
+    recommender = Recommender.from_pipeline(model)
+    forest = FlatForest.from_estimator(recommender.estimator)
+    X = recommender.candidates({"age": 37, "gender": "M", "occupation": "none"})
+
+    compact_forest = forest.compact()
+    assert compact_forest.threshold.dtype == np.float32
+    assert compact_forest.value.dtype == np.float32
+    assert compact_forest.nbytes < forest.nbytes
+    assert np.allclose(compact_forest.predict(X), forest.predict(X), rtol=1e-6)
+
+    compact_forest.value = forest.value
+    assert np.array_equal(compact_forest.predict(X), forest.predict(X))
+
+
+def test_compact_forest_pruning(model):
+    """ Tests the trees of the compact forest are cut at the maximum depth and merged within the tolerance """
+    recommender = Recommender.from_pipeline(model)
+    forest = FlatForest.from_estimator(recommender.estimator)
+    X = recommender.candidates({"age": 52, "gender": "F", "occupation": "student"})
+
+    cut_forest = forest.compact(max_depth=3, dtype=np.float64)
+    assert cut_forest.get_depths().max() == 3
+    assert cut_forest.n_trees == forest.n_trees
+
+    merged_forest = forest.compact(merge_tolerance=0.5, dtype=np.float64)
+    assert merged_forest.feature.shape[0] < forest.feature.shape[0]
+    assert np.all(np.abs(merged_forest.predict(X) - forest.predict(X)) <= 0.5)
+
+    assert np.array_equal(forest.compact(merge_tolerance=0, dtype=np.float64).predict(X), forest.predict(X))
+
+
+def test_export_load_compact(model, tmpdir):
+    """ Tests a compact forest is exported and loaded with its types """
+    path = str(tmpdir.join("model"))
+    recommender = Recommender.from_pipeline(model)
+    export_artifacts(path, model, forest=FlatForest.from_estimator(recommender.estimator).compact())
+
+    loaded_recommender = load_artifacts(path)
+    assert loaded_recommender.estimator.value.dtype == np.float32
+
+    data = {"age": 21, "gender": "O", "occupation": "engineer"}
+    assert np.allclose(loaded_recommender.predict(data), recommender.predict(data), rtol=1e-6)
@@ -6,7 +6,7 @@ import jwt
 
 from time import sleep
 
-from tests.utils import get_test_client
+from tests.utils import get_authentication_headers, get_test_client
 
 
 def test_authentication(client):
@@ -121,3 +121,102 @@ def test_token_expiration():
     response_message = response_data["msg"].lower()
     assert "token" in response_message
     assert "expired" in response_message
+
+
+def test_authentication_invalid_password(client):
+    """ Tests the error of a password that is not a string """
+    response = client.post("/api/login", json={"session_password": 123})
+
+    assert response.status_code == 400
+    assert "session_password" in response.get_json()["message"]
+
+
+def test_verified_token_cache():
+    """ Test the tokens are only verified on their first request """
+    client = get_test_client()
+    headers = get_authentication_headers(client)
+
+    for _ in range(3):
+        assert client.get("/api/protected", headers=headers).status_code == 200
+
+    stats = client.get("/api/stats", headers=headers).get_json()["verified_tokens"]
+    assert stats["verifications"] == 1
+    assert stats["hits"] == 3
+
+
+def test_verified_token_cache_expiration():
+    """ Test the cached tokens are verified again when they expire """
+    client = get_test_client(1)
+    headers = get_authentication_headers(client)
+    assert client.get("/api/protected", headers=headers).status_code == 200
+
+    sleep(2)
+    response = client.get("/api/protected", headers=headers)
+    assert response.status_code == 401
+    assert "expired" in response.get_json()["msg"].lower()
+
+
+def test_verified_token_cache_secret():
+    """ Test the cached tokens are not valid when the secret changes """
+    client = get_test_client()
+    headers = get_authentication_headers(client)
+    assert client.get("/api/protected", headers=headers).status_code == 200
+
+    client.application.config["JWT_SECRET_KEY"] = "other-secret-key"
+    assert client.get("/api/protected", headers=headers).status_code == 422
+
+
+def test_verified_token_cache_claims_verification():
+    """ Test the tokens are verified on each request if the claims are verified """
+    client = get_test_client()
+    headers = get_authentication_headers(client)
+    valid_claims = [True]
+    client.application.extensions["flask-jwt-extended"].claims_verification_loader(lambda claims: valid_claims[0])
+
+    assert client.get("/api/protected", headers=headers).status_code == 200
+    valid_claims[0] = False
+    assert client.get("/api/protected", headers=headers).status_code == 400
+
+    valid_claims[0] = True
+    stats = client.get("/api/stats", headers=headers).get_json()["verified_tokens"]
+    assert stats["hits"] == 0
+
+
+def test_login_cache():
+    """ Test the password of a successful login is not verified again """
+    client = get_test_client()
+    headers = get_authentication_headers(client)
+    get_authentication_headers(client)
+
+    stats = client.get("/api/stats", headers=headers).get_json()["login"]
+    assert stats["verifications"] == 1
+    assert stats["cache_hits"] == 1
+
+
+def test_login_rate_limit():
+    """ Test the logins of a client over its rate limit are rejected """
+    client = get_test_client(extra_config={"LOGIN_RATE_LIMIT": 2})
+    request_data = {"session_password": "wrong-password"}
+
+    assert client.post("/api/login", json=request_data).status_code == 401
+    assert client.post("/api/login", json=request_data).status_code == 401
+
+    response = client.post("/api/login", json=request_data)
+    assert response.status_code == 429
+    assert "too many" in response.get_json()["message"].lower()
+
+
+def test_login_rate_limit_proxies():
+    """ Test the clients behind the trusted proxies have their own rate limit """
+    client = get_test_client(extra_config={"LOGIN_RATE_LIMIT": 1, "TRUSTED_PROXIES": 1})
+    request_data = {"session_password": "wrong-password"}
+
+    def login(forwarded_for):
+        return client.post("/api/login", json=request_data, headers={"X-Forwarded-For": forwarded_for})
+
+    assert login("10.0.0.1").status_code == 401
+    assert login("10.0.0.2").status_code == 401
+    assert login("10.0.0.1").status_code == 429
+
+    # The addresses added by the client before the trusted proxy are ignored
+    assert login("10.0.0.3, 10.0.0.2").status_code == 429
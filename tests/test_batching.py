@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+import threading
+
+from flask_app.batching import MicroBatcher
+from tests.utils import get_authentication_headers, get_dummy_forest_model, get_test_client
+
+
+def test_micro_batching():
+    """ Tests concurrent requests are scored in batches and get their own results """
+    batches = []
+
+    def rank_many(users):
+        batches.append(len(users))
+        return [data["age"] * 2 for data in users]
+
+    batcher = MicroBatcher(rank_many, window=0.2, max_batch_size=4)
+    results = {}
+
+    def rank(age):
+        results[age] = batcher.rank({"age": age})
+
+    threads = [threading.Thread(target=rank, args=(age,)) for age in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {age: age * 2 for age in range(8)}
+    assert max(batches) <= 4
+    assert len(batches) < 8
+
+    stats = batcher.stats()
+    assert stats["requests"] == 8
+    assert stats["batches"] == len(batches)
+
+
+def test_micro_batching_error():
+    """ Tests the errors of a batch are raised in each request """
+    def rank_many(users):
+        raise ValueError("Invalid batch")
+
+    batcher = MicroBatcher(rank_many, window=0.01, max_batch_size=4)
+
+    with pytest.raises(ValueError):
+        batcher.rank({"age": 1})
+
+
+def test_micro_batching_timeout():
+    """ Tests the requests of a stuck batch are scored on their own after the timeout """
+    unblock = threading.Event()
+
+    def rank_many(users):
+        if threading.current_thread().name == "micro-batcher":
+            unblock.wait()
+        return [data["age"] * 2 for data in users]
+
+    batcher = MicroBatcher(rank_many, window=0.01, max_batch_size=4, timeout=0.05)
+    try:
+        assert batcher.rank({"age": 1}) == 2
+        assert batcher.rank({"age": 2}) == 4
+        assert batcher.stats()["timeouts"] == 2
+    finally:
+        unblock.set()
+
+
+def test_micro_batching_dead_thread():
+    """ Tests the thread of the batches is started again if it died """
+    class Metrics(object):
+        binds = 0
+
+        def bind(self):
+            self.binds += 1
+            if self.binds == 1:
+                raise RuntimeError("Invalid metrics")
+
+    batcher = MicroBatcher(lambda users: [data["age"] * 2 for data in users], window=0.01, max_batch_size=4,
+                           metrics=Metrics(), timeout=0.5)
+
+    assert batcher.rank({"age": 1}) == 2
+    assert batcher.stats()["timeouts"] == 1
+
+    assert batcher.rank({"age": 2}) == 4
+    assert batcher.stats()["timeouts"] == 1
+    assert batcher.stats()["batches"] >= 1
+
+
+def test_micro_batching_app():
+    """ Tests the recommendations and statistics of the application with micro-batching """
+    extra_config = {"MICRO_BATCHING": True, "MICRO_BATCH_WINDOW": 0.001}
+    client = get_test_client(model=get_dummy_forest_model(), extra_config=extra_config)
+    headers = get_authentication_headers(client)
+
+    request_data = {"age": 30, "gender": "M", "occupation": "engineer"}
+    response = client.post("/api/recommend", json=request_data, headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()["recommendations"]) == 10
+
+    response = client.get("/api/stats", headers=headers)
+    response_data = response.get_json()
+    assert response.status_code == 200
+    assert response_data["micro_batching"]["requests"] == 1
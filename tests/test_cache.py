@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+from time import sleep
+
+from flask_app.cache import LRUCache, ModelCache, RingBuffer
+from tests.utils import get_authentication_headers, get_test_client
+
+
+def test_lru_cache():
+    """ Tests the least recently used entries are evicted """
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_lru_cache_ttl():
+    """ Tests the entries expire after the given time """
+    cache = LRUCache(2, ttl=0.1)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+
+    sleep(0.2)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_model_cache():
+    """ Tests the entries are invalidated when the model changes """
+    model, new_model = object(), object()
+    cache = ModelCache(2)
+    cache.put("a", 1, model=model)
+    assert cache.get("a", model=model) == 1
+    assert cache.get("a", model=new_model) is None
+
+    # Results of the old model are discarded
+    cache.put("a", 1, model=model)
+    assert cache.get("a", model=new_model) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_recommendations_cache(client):
+    """ Tests cached recommendations still get a new id """
+    headers = get_authentication_headers(client)
+    request_data = {"age": 1, "gender": "O", "occupation": "none"}
+    responses = [client.post("/api/recommend", json=request_data, headers=headers).get_json()
+                 for _ in range(2)]
+
+    assert responses[0]["recommendations"] == responses[1]["recommendations"]
+    assert responses[0]["id"] != responses[1]["id"]
+
+    stats = client.get("/api/stats", headers=headers).get_json()["recommendations_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_recommendations_cache_disabled():
+    """ Tests the recommendations cache can be disabled """
+    client = get_test_client(extra_config={"RECOMMENDATIONS_CACHE_SIZE": 0})
+    headers = get_authentication_headers(client)
+    request_data = {"age": 1, "gender": "O", "occupation": "none"}
+    for _ in range(2):
+        client.post("/api/recommend", json=request_data, headers=headers)
+
+    stats = client.get("/api/stats", headers=headers).get_json()["recommendations_cache"]
+    assert stats["hits"] == 0
+    assert stats["size"] == 0
+
+
+def test_ring_buffer():
+    """ Tests the oldest entries are overwritten when the ring buffer is full """
+    buffer = RingBuffer(2)
+    buffer.put("a", 1)
+    buffer.put("b", 2)
+    buffer.put("a", 3)
+    assert buffer.get("a") == 3
+
+    buffer.put("c", 4)
+    assert buffer.get("a") is None
+    assert buffer.get("b") == 2
+    assert buffer.get("c") == 4
+
+    stats = buffer.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["hit_rate"] == 0.75
+
+    assert buffer.peek("c") == 4
+    assert buffer.peek("a") is None
+    assert buffer.stats() == stats
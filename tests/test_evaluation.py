@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+
+from flask_app.evaluation import RankingEvaluation, get_ranking_metrics, get_top_k
+from flask_app.recommender import Ranking
+
+
+def test_top_k():
+    """ Tests the top movies of many users are the ones served by their rankings """
+    scores = np.array([[1., 3., 3., 0., 2.], [0., 0., 1., 0., 0.]])
+    top_indices = get_top_k(scores, 3)
+
+    for user_scores, user_top in zip(scores, top_indices):
+        assert np.array_equal(user_top, Ranking(user_scores).top(3)[0])
+
+
+def test_ranking_metrics():
+    """ Tests the precision, recall and NDCG of the top movies """
+    top_indices = np.array([[0, 1, 2], [3, 2, 1], [0, 1, 2]])
+    relevant = np.zeros((3, 5), dtype=np.bool_)
+    relevant[0, [1, 4]] = True
+    relevant[1, [3, 2, 1]] = True
+
+    precision, recall, ndcg = get_ranking_metrics(top_indices, relevant, 2)
+
+    # The last user has no relevant movies, so it is skipped
+    assert np.allclose(precision, [0.5, 1.])
+    assert np.allclose(recall, [0.5, 2. / 3])
+    assert np.allclose(ndcg, [(1 / np.log2(3)) / (1 + 1 / np.log2(3)), 1.])
+
+
+def test_ranking_evaluation():
+    """ Tests the metrics are averaged over the users of all the blocks """
+    evaluation = RankingEvaluation([1, 2])
+    evaluation.update(np.array([[2., 1., 0.]]), np.array([[True, False, False]]))
+    evaluation.update(np.array([[2., 1., 0.], [0., 1., 2.]]), np.array([[False, True, False], [False] * 3]))
+
+    results = evaluation.results()
+    assert evaluation.n_users == 2
+    assert np.isclose(results["precision@1"], 0.5)
+    assert np.isclose(results["recall@2"], 1.)
+    assert np.isclose(results["ndcg@2"], (1 + 1 / np.log2(3)) / 2)
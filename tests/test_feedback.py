@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+import uuid
+import pytest
+
+from flask_app.feedback import FeedbackSink, FeedbackWriter, get_feedback_writer, read_feedback
+from flask_app.utils import InvalidUsage
+from tests.utils import get_authentication_headers, get_test_client
+
+
+class BlockedWriter(FeedbackWriter):
+    """
+    Feedback writer that waits until it's released
+    """
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.batches = []
+
+    def write(self, records):
+        self.released.wait()
+        self.batches.append(records)
+
+
+def get_feedback(n_records):
+    return [{"id": str(uuid.uuid4()), "movie": "Movie %d" % i, "score": 1 + i % 5} for i in range(n_records)]
+
+
+@pytest.mark.parametrize("file_name", ["feedback.jsonl", "feedback.db"])
+def test_feedback_store(tmpdir, file_name):
+    """ Tests the feedback is written in batches and read back in order """
+    path = str(tmpdir.join(file_name))
+    sink = FeedbackSink(get_feedback_writer(path, None), flush_interval=10, flush_size=4)
+    feedback = get_feedback(10)
+
+    for data in feedback:
+        assert sink.put(data)
+    sink.close()
+
+    records = list(read_feedback(path))
+    assert [(r["id"], r["movie"], r["score"]) for r in records] == \
+        [(data["id"], data["movie"], data["score"]) for data in feedback]
+    assert sink.stats()["written"] == 10
+    assert sink.stats()["batches"] == 3
+
+
+@pytest.mark.parametrize("file_name", ["feedback.jsonl", "feedback.db"])
+def test_feedback_invalid_record(tmpdir, file_name):
+    """ Tests an invalid record of a batch doesn't lose the other records """
+    path = str(tmpdir.join(file_name))
+    sink = FeedbackSink(get_feedback_writer(path, None), flush_interval=10, flush_size=10)
+    feedback = get_feedback(5)
+    feedback[2]["movie"] = {"invalid": object()}
+
+    for data in feedback:
+        assert sink.put(data)
+    sink.close()
+
+    assert [r["id"] for r in read_feedback(path)] == [data["id"] for data in feedback if data is not feedback[2]]
+    assert sink.stats()["written"] == 4
+    assert sink.stats()["errors"] == 1
+
+
+def test_feedback_overflow():
+    """ Tests the records are dropped or rejected when the queue is full """
+    writer = BlockedWriter()
+    sink = FeedbackSink(writer, flush_interval=0, flush_size=1, max_queue_size=2)
+    feedback = get_feedback(5)
+
+    # The first record is taken by the blocked writer
+    assert sink.put(feedback[0])
+    while sink.stats()["queued"] > 0:
+        time.sleep(0.01)
+    assert sink.put(feedback[1])
+    assert sink.put(feedback[2])
+    assert not sink.put(feedback[3])
+    assert sink.stats()["dropped"] == 1
+
+    sink.overflow = "reject"
+    with pytest.raises(InvalidUsage):
+        sink.put(feedback[4])
+
+    writer.released.set()
+    sink.close()
+    assert [record["id"] for batch in writer.batches for record in batch] == \
+        [data["id"] for data in feedback[:3]]
+
+
+def test_score_feedback(tmpdir):
+    """ Tests the scores of the API are written to the feedback store """
+    path = str(tmpdir.join("feedback.jsonl"))
+    client = get_test_client(extra_config={"FEEDBACK_PATH": path, "FEEDBACK_FLUSH_INTERVAL": 0})
+    headers = get_authentication_headers(client)
+    request_data = {"id": str(uuid.uuid4()), "movie": "Test", "score": 4}
+
+    response = client.post("/api/recommend/score", json=request_data, headers=headers)
+    assert response.status_code == 200
+
+    while client.get("/api/stats", headers=headers).get_json()["feedback"]["written"] < 1:
+        time.sleep(0.01)
+
+    records = list(read_feedback(path))
+    assert len(records) == 1
+    assert records[0]["id"] == request_data["id"]
+    assert records[0]["score"] == 4
+
+
+def test_score_history(tmpdir):
+    """ Tests the scores are validated and enriched with the results of their recommendation """
+    path = str(tmpdir.join("feedback.jsonl"))
+    client = get_test_client(extra_config={"FEEDBACK_PATH": path, "FEEDBACK_FLUSH_INTERVAL": 0,
+                                           "SCORE_REQUIRE_RECOMMENDATION": True})
+    headers = get_authentication_headers(client)
+    response = client.post("/api/recommend", json={"age": 30, "gender": "F", "occupation": "writer"},
+                           headers=headers)
+    request_id = response.get_json()["id"]
+
+    response = client.post("/api/recommend/score", json={"id": str(uuid.uuid4()), "movie": "Test", "score": 4},
+                           headers=headers)
+    assert response.status_code == 404
+
+    response = client.post("/api/recommend/score", json={"id": request_id, "movie": "Other", "score": 4},
+                           headers=headers)
+    assert response.status_code == 400
+
+    response = client.post("/api/recommend/score", json={"id": request_id, "movie": "Test", "score": 4},
+                           headers=headers)
+    assert response.status_code == 200
+
+    while client.get("/api/stats", headers=headers).get_json()["feedback"]["written"] < 1:
+        time.sleep(0.01)
+
+    record, = read_feedback(path)
+    assert record["id"] == request_id
+    assert record["model_version"] is None
+    assert (record["age"], record["gender"], record["occupation"]) == (30, "F", "writer")
+    assert "predicted_score" in record
+
+    # Only the scores count in the hit rate of the history
+    history_stats = client.get("/api/stats", headers=headers).get_json()["recommendations_history"]
+    assert (history_stats["hits"], history_stats["misses"]) == (2, 1)
+
+
+def test_score_unknown_recommendation(tmpdir):
+    """ Tests the scores of unknown recommendations don't take the results of the client """
+    path = str(tmpdir.join("feedback.jsonl"))
+    client = get_test_client(extra_config={"FEEDBACK_PATH": path, "FEEDBACK_FLUSH_INTERVAL": 0})
+    headers = get_authentication_headers(client)
+    request_data = {"id": str(uuid.uuid4()), "movie": "Test", "score": 4, "predicted_score": 5, "age": 30}
+
+    response = client.post("/api/recommend/score", json=request_data, headers=headers)
+    assert response.status_code == 200
+
+    while client.get("/api/stats", headers=headers).get_json()["feedback"]["written"] < 1:
+        time.sleep(0.01)
+
+    record, = read_feedback(path)
+    assert [record[field] for field in ("predicted_score", "model_version", "age", "gender", "occupation")] == \
+        [None] * 5
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import json
+import logging
+import numpy as np
+
+from flask_app.logs import JSONFormatter, LogEvent, LogQueueHandler
+from tests.utils import get_authentication_headers, get_test_client
+
+
+def get_event_record(event):
+    return logging.LogRecord("test", logging.INFO, __file__, 0, event, None, None)
+
+
+def test_text_event():
+    """ Tests the text of the events keeps the format of the request logs """
+    event = LogEvent("page", id="id", model_version="1", offset=10, movies=['A "B"', "C"],
+                     results=np.array([4.5, 3.25]))
+
+    assert str(event) == '\nREQUEST PAGE LOG\nREQUEST_ID: id\nMODEL_VERSION: 1\nOFFSET: 10\n' +\
+        'MOVIES: "A \\"B\\"";"C"\nRESULTS: 4.50;3.25'
+
+
+def test_json_event():
+    """ Tests the events are formatted as a single JSON object with typed fields """
+    event = LogEvent("score", id="id", movie="Test", score=np.float32(4))
+    entry = json.loads(JSONFormatter().format(get_event_record(event)))
+
+    assert entry["event"] == "score"
+    assert entry["level"] == "INFO"
+    assert entry["score"] == 4.
+    assert json.loads(JSONFormatter().format(get_event_record("Message")))["message"] == "Message"
+
+
+def test_queued_logs(tmpdir):
+    """ Tests the queued logs are written to the log file by the listener """
+    path = str(tmpdir.join("app.log"))
+    client = get_test_client(extra_config={"LOG_FORMAT": "json", "LOG_QUEUE": True, "LOG_FILE": path})
+    headers = get_authentication_headers(client)
+
+    # The logging configuration disables the logger of the applications created before
+    client.application.logger.disabled = False
+    response = client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer"},
+                           headers=headers)
+    assert response.status_code == 200
+
+    queue_handler, = [handler for handler in logging.getLogger().handlers if isinstance(handler, LogQueueHandler)]
+    queue_handler.stop()
+
+    with open(path, "r") as fh:
+        entries = [json.loads(line) for line in fh]
+    entry, = [entry for entry in entries if entry.get("event") == "recommendation"]
+    assert entry["id"] == response.get_json()["id"]
+    assert entry["data"] == {"age": 30, "gender": "M", "occupation": "engineer"}
+    assert entry["movies"] == response.get_json()["recommendations"]
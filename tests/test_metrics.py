@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import multiprocessing
+
+from flask_app.metrics import MetricsRegistry
+from tests.utils import get_authentication_headers, get_dummy_forest_model, get_test_client
+
+
+def get_registry(path=None):
+    registry = MetricsRegistry(path, buckets=(0.1, 1.))
+    registry.add_counter("requests_total", "Requests.", [{"route": "/a"}, {"route": "/b"}])
+    registry.add_histogram("duration_seconds", "Duration.")
+    return registry
+
+
+def test_metrics_render():
+    """ Tests the counters and histograms are rendered in the Prometheus format """
+    registry = get_registry()
+    registry.inc("requests_total", (("route", "/a"),))
+    registry.inc("requests_total", (("route", "/a"),))
+    registry.observe("duration_seconds", (), 0.05)
+    registry.observe("duration_seconds", (), 0.5)
+    registry.observe("duration_seconds", (), 5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/a"} 2.0' in lines
+    assert 'requests_total{route="/b"} 0.0' in lines
+    assert 'duration_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 'duration_seconds_bucket{le="1.0"} 2.0' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 3.0' in lines
+    assert "duration_seconds_sum 5.55" in lines
+    assert "duration_seconds_count 3.0" in lines
+
+
+def increment_requests(registry):
+    registry.inc("requests_total", (("route", "/b"),), 3)
+
+
+def test_metrics_processes(tmpdir):
+    """ Tests the metrics of all the processes are aggregated """
+    registry = get_registry(str(tmpdir))
+    registry.inc("requests_total", (("route", "/b"),))
+
+    process = multiprocessing.get_context("fork").Process(target=increment_requests, args=(registry,))
+    process.start()
+    process.join()
+
+    assert 'requests_total{route="/b"} 4.0' in registry.render().splitlines()
+    assert len(tmpdir.listdir()) == 2
+
+
+def test_metrics_dead_processes(tmpdir):
+    """ Tests the files of the processes that are no longer running are removed when the registry is created """
+    registry = get_registry(str(tmpdir))
+    registry.inc("requests_total", (("route", "/b"),))
+
+    process = multiprocessing.get_context("fork").Process(target=increment_requests, args=(registry,))
+    process.start()
+    process.join()
+    assert len(tmpdir.listdir()) == 2
+
+    registry = get_registry(str(tmpdir))
+    assert len(tmpdir.listdir()) == 1
+    assert 'requests_total{route="/b"} 1.0' in registry.render().splitlines()
+
+
+def test_metrics_endpoint():
+    """ Tests the metrics endpoint reports the requests and the stages of the recommendations """
+    client = get_test_client(model=get_dummy_forest_model())
+    headers = get_authentication_headers(client)
+    client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer"}, headers=headers)
+    client.post("/api/recommend", json={"age": 30, "gender": "X", "occupation": "engineer"}, headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'recommend_requests_total{route="/api/recommend",status="2xx"} 1.0' in lines
+    assert 'recommend_requests_total{route="/api/recommend",status="4xx"} 1.0' in lines
+    assert 'recommend_request_duration_seconds_count{route="/api/recommend"} 2.0' in lines
+    assert 'recommend_stage_duration_seconds_count{stage="validation"} 2.0' in lines
+    for stage in ["cache", "candidates", "predict", "ranking", "logging", "serialization"]:
+        assert 'recommend_stage_duration_seconds_count{stage="%s"} 1.0' % stage in lines
+
+
+def test_metrics_disabled():
+    """ Tests the metrics endpoint is not available when the metrics are disabled """
+    client = get_test_client(extra_config={"METRICS_ENABLED": False})
+
+    assert client.get("/metrics").status_code == 404
+
+
+def test_metrics_micro_batching():
+    """ Tests the stages of the recommendations scored by the micro-batching thread are timed """
+    client = get_test_client(model=get_dummy_forest_model(), extra_config={"MICRO_BATCHING": True,
+                                                                          "MICRO_BATCH_WINDOW": 0.001})
+    headers = get_authentication_headers(client)
+    client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer"}, headers=headers)
+
+    lines = client.get("/metrics").get_data(as_text=True).splitlines()
+    for stage in ["candidates", "predict"]:
+        assert 'recommend_stage_duration_seconds_count{stage="%s"} 1.0' % stage in lines
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import pytest
+import threading
+
+from flask_app.prefilter import DemographicPrefilter
+from flask_app.recommender import Recommender
+from tests.utils import get_authentication_headers, get_dummy_forest_model, get_test_client
+
+
+@pytest.fixture
+def recommender():
+    yield Recommender.from_pipeline(get_dummy_forest_model())
+
+
+def test_lookup(recommender):
+    """ Tests the candidates of a user are the top movies of the representative user of its group """
+    prefilter = DemographicPrefilter.build(recommender, 5, ages=[20, 40])
+
+    for age, representative_age in [(0, 20), (29, 20), (31, 40), (90, 40)]:
+        data = {"age": age, "gender": "F", "occupation": "writer"}
+        top_indices, _ = recommender.rank(dict(data, age=representative_age)).top(5)
+        assert np.array_equal(prefilter.lookup(data), np.sort(top_indices))
+
+    assert prefilter.lookup({"age": 30, "gender": "X", "occupation": "writer"}) is None
+
+
+def test_rank_candidates(recommender):
+    """ Tests the rankings of the prefiltered users only have the candidates, sorted by the model score """
+    users = [{"age": age, "gender": "M", "occupation": "engineer"} for age in [15, 45]] + \
+        [{"age": 30, "gender": "X", "occupation": "engineer"}]
+    scores = recommender.predict_many(users)
+    recommender.prefilter = DemographicPrefilter.build(recommender, 8)
+
+    for data, user_scores, ranking in zip(users, scores, recommender.rank_many(users)):
+        assert np.array_equal(ranking.indices, recommender.rank(data).indices)
+        if data["gender"] == "X":
+            assert len(ranking) == len(recommender.movies)
+            continue
+
+        candidates = recommender.prefilter.lookup(data)
+        assert len(ranking) == 8
+        assert sorted(ranking.indices) == sorted(candidates)
+        assert np.allclose(ranking.sorted_scores, user_scores[ranking.indices])
+        assert np.all(np.diff(ranking.sorted_scores) <= 0)
+
+
+def test_rank_past_candidates(recommender):
+    """ Tests the pages past the candidates have the rest of the movies, sorted by the model score """
+    recommender.prefilter = DemographicPrefilter.build(recommender, 8)
+    data = {"age": 30, "gender": "F", "occupation": "artist"}
+    scores = recommender.predict(data)
+    candidates = recommender.prefilter.lookup(data)
+
+    ranking = recommender.rank(data)
+    first_page, _ = ranking.top(5)
+    assert len(ranking) == 8
+
+    indices, top_scores = ranking.top(len(recommender.movies), 5)
+    assert np.array_equal(ranking.top(5)[0], first_page)
+    assert sorted(np.concatenate([first_page, indices])) == list(range(len(recommender.movies)))
+    assert sorted(indices[:3]) == sorted(np.setdiff1d(candidates, first_page))
+    assert np.allclose(top_scores, scores[indices])
+    assert np.all(np.diff(top_scores[3:]) <= 0)
+
+
+def test_rank_past_candidates_threads(recommender):
+    """ Tests a ranking shared between threads is extended only once when they page past its candidates """
+    recommender.prefilter = DemographicPrefilter.build(recommender, 3)
+    data = {"age": 30, "gender": "F", "occupation": "artist"}
+    n_movies = len(recommender.movies)
+    pages = []
+
+    def top(ranking, barrier):
+        barrier.wait()
+        pages.append(ranking.top(n_movies, 5)[0])
+
+    for _ in range(20):
+        ranking = recommender.rank(data)
+        barrier = threading.Barrier(4)
+        threads = [threading.Thread(target=top, args=(ranking, barrier)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(ranking) == n_movies
+        assert sorted(ranking.indices) == list(range(n_movies))
+
+    assert all(np.array_equal(page, pages[0]) for page in pages)
+    assert len(pages[0]) == n_movies - 5
+
+
+def test_full_prefilter(recommender):
+    """ Tests a prefilter with all the movies gives the same rankings as the model """
+    recommender.prefilter = DemographicPrefilter.build(recommender, len(recommender.movies))
+    data = {"age": 33, "gender": "O", "occupation": "doctor"}
+
+    assert np.array_equal(recommender.rank(data).top(10)[0], np.argsort(-recommender.predict(data),
+                                                                         kind="mergesort")[:10])
+
+
+def test_prefilter_app():
+    """ Tests the application recommends the candidates of the prefilter first, and then the rest """
+    client = get_test_client(model=get_dummy_forest_model(), extra_config={"PREFILTER_CANDIDATES": 3})
+    headers = get_authentication_headers(client)
+
+    response = client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer",
+                                                   "max_recs": 10}, headers=headers)
+    assert response.status_code == 200
+    recommendations = response.get_json()["recommendations"]
+    assert len(recommendations) == 10
+
+    # The pages go on past the candidates
+    response = client.post("/api/recommend", json={"id": response.get_json()["id"], "offset": 10,
+                                                   "max_recs": 10}, headers=headers)
+    assert len(response.get_json()["recommendations"]) == 10
+    assert not set(recommendations) & set(response.get_json()["recommendations"])
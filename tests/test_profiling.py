@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import pstats
+import threading
+import time
+
+from flask_app.profiling import RequestProfiler
+from tests.utils import get_authentication_headers, get_test_client
+
+RECOMMEND_DATA = {"age": 30, "gender": "M", "occupation": "engineer"}
+
+
+def wait_for_profiles(tmpdir, n_profiles, timeout=5.):
+    # The profiles are dumped by a background thread
+    deadline = time.time() + timeout
+    while len(tmpdir.listdir()) < n_profiles and time.time() < deadline:
+        time.sleep(0.01)
+    return tmpdir.listdir()
+
+
+def test_profiling_aggregation(tmpdir):
+    """ Tests the profiles of a route are aggregated in a single pstats file per window """
+    profiler = RequestProfiler(str(tmpdir), window=3600)
+    for _ in range(3):
+        profile = profiler.start()
+        sorted(range(1000), key=lambda x: -x)
+        profiler.stop(profile, "/api/recommend")
+
+    assert profiler.stats()["routes"] == ["/api/recommend"]
+    paths = profiler.dump()
+    assert len(paths) == 1
+    assert tmpdir.listdir()[0].basename.startswith("api-recommend-")
+
+    stats = pstats.Stats(paths[0])
+    sorted_key = [key for key in stats.stats if key[2] == "<built-in method builtins.sorted>"][0]
+    assert stats.stats[sorted_key][1] == 3
+    assert profiler.dump() == []
+
+
+def test_profiling_background_dump(tmpdir):
+    """ Tests the profiles are aggregated and dumped by the background thread, not by the request """
+    profiler = RequestProfiler(str(tmpdir), window=0)
+    dump = profiler.dump
+    dump_threads = []
+
+    def record_dump():
+        dump_threads.append(threading.current_thread().name)
+        return dump()
+
+    profiler.dump = record_dump
+    profile = profiler.start()
+    sorted(range(1000), key=lambda x: -x)
+    profiler.stop(profile, "/api/recommend")
+
+    assert [path.basename.rsplit("-", 2)[0] for path in wait_for_profiles(tmpdir, 1)] == ["api-recommend"]
+    assert dump_threads == ["profile-dumper"]
+
+
+def test_profiling_single_request():
+    """ Tests a single request is profiled at a time """
+    profiler = RequestProfiler("unused")
+    profile = profiler.start()
+    assert profiler.start() is None
+    profile.disable()
+
+
+def test_profiling_sampled_requests(tmpdir):
+    """ Tests the sampled requests are profiled and dumped per route """
+    client = get_test_client(extra_config={"PROFILING_DIR": str(tmpdir), "PROFILING_SAMPLE_RATE": 1.,
+                                           "PROFILING_WINDOW": 0})
+    headers = get_authentication_headers(client)
+    client.post("/api/recommend", json=RECOMMEND_DATA, headers=headers)
+
+    routes = sorted(path.basename.rsplit("-", 2)[0] for path in wait_for_profiles(tmpdir, 2))
+    assert routes == ["api-login", "api-recommend"]
+    assert client.get("/api/stats", headers=headers).get_json()["profiling"]["profiled"] == 2
+
+
+def test_profiling_debug_header(tmpdir):
+    """ Tests only the requests with the debug token are profiled if there's no sampling """
+    client = get_test_client(extra_config={"PROFILING_DIR": str(tmpdir), "PROFILING_TOKEN": "secret",
+                                           "PROFILING_WINDOW": 0})
+    headers = get_authentication_headers(client)
+    client.post("/api/recommend", json=RECOMMEND_DATA, headers=headers)
+    client.post("/api/recommend", json=RECOMMEND_DATA, headers=dict(headers, **{"X-Profile-Token": "wrong"}))
+    response = client.post("/api/recommend", json=RECOMMEND_DATA,
+                           headers=dict(headers, **{"X-Profile-Token": "s\u00e9cret"}))
+    assert response.status_code == 200
+    assert tmpdir.listdir() == []
+
+    client.post("/api/recommend", json=RECOMMEND_DATA, headers=dict(headers, **{"X-Profile-Token": "secret"}))
+    assert [path.basename.rsplit("-", 2)[0] for path in wait_for_profiles(tmpdir, 1)] == ["api-recommend"]
+
+
+def test_profiling_disabled(client):
+    """ Tests the profiling hooks are not registered by default """
+    assert "profiling" not in client.get("/api/stats", headers=get_authentication_headers(client)).get_json()
+    assert not any(fn.__name__ == "start_request_profile" for fn in client.application.before_request_funcs[None])
@@ -5,6 +5,8 @@ from __future__ import absolute_import, unicode_literals
 import pytest
 import uuid
 
+from tests.utils import get_authentication_headers
+
 
 @pytest.fixture
 def authentication_headers(client):
@@ -219,6 +221,20 @@ def test_score_movie_1(client, authentication_headers):
     assert "movie" in response_message
 
 
+def test_score_movie_2(client, authentication_headers):
+    request_data = {"id": str(uuid.uuid4()), "movie": {"title": "Test"}, "score": 1}
+    response = client.post("/api/recommend/score", json=request_data, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 400
+    assert "message" in response_data
+
+    response_message = response_data["message"].lower()
+    assert "parameter" in response_message
+    assert "movie" in response_message
+    assert "string" in response_message
+
+
 def test_score_score_1(client, authentication_headers):
     request_data = {"id": str(uuid.uuid4()), "movie": "Test"}
     response = client.post("/api/recommend/score", json=request_data, headers=authentication_headers)
@@ -260,3 +276,119 @@ def test_score_score_3(client, authentication_headers):
     assert "parameter" in response_message
     assert "score" in response_message
     assert "interval" in response_message
+
+
+def test_recommend_offset(client, authentication_headers):
+    """ Tests error on recommend request when 'offset' is not valid """
+    request_data = {"age": 1, "gender": "O", "occupation": "none", "offset": -1}
+    response = client.post("/api/recommend", json=request_data, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 400
+    assert "message" in response_data
+
+    response_message = response_data["message"].lower()
+    assert "parameter" in response_message
+    assert "offset" in response_message
+
+
+def test_recommend_pages(forest_client):
+    """ Tests the pages of a recommendation are the same as the full recommendation """
+    headers = get_authentication_headers(forest_client)
+    request_data = {"age": 30, "gender": "F", "occupation": "student", "max_recs": 15}
+    response = forest_client.post("/api/recommend", json=request_data, headers=headers)
+    all_recommendations = response.get_json()["recommendations"]
+
+    request_data["max_recs"] = 5
+    response = forest_client.post("/api/recommend", json=request_data, headers=headers)
+    response_data = response.get_json()
+    recommendations = response_data["recommendations"]
+
+    for offset in [5, 10]:
+        request_data = {"id": response_data["id"], "offset": offset, "max_recs": 5}
+        response = forest_client.post("/api/recommend", json=request_data, headers=headers)
+
+        assert response.status_code == 200
+        assert response.get_json()["id"] == response_data["id"]
+        recommendations += response.get_json()["recommendations"]
+
+    assert recommendations == all_recommendations
+
+
+def test_recommend_page_id(client, authentication_headers):
+    """ Tests error on recommend page request when 'id' is not a previous recommendation """
+    request_data = {"id": str(uuid.uuid4()), "offset": 10}
+    response = client.post("/api/recommend", json=request_data, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 404
+    assert "message" in response_data
+    assert "id" in response_data["message"].lower()
+
+
+def test_recommend_page_offset(client, authentication_headers):
+    """ Tests error on recommend page request when 'offset' is not present """
+    request_data = {"id": str(uuid.uuid4())}
+    response = client.post("/api/recommend", json=request_data, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 400
+    assert "message" in response_data
+
+    response_message = response_data["message"].lower()
+    assert "missing" in response_message
+    assert "offset" in response_message
+
+
+def test_recommend_batch(forest_client):
+    """ Tests the batch recommendations are the same as the recommendations of each user """
+    headers = get_authentication_headers(forest_client)
+    users = [
+        {"age": 30, "gender": "F", "occupation": "student"},
+        {"age": 65, "gender": "M", "occupation": "retired", "max_recs": 3},
+        {"age": 18, "gender": "O", "occupation": "none", "max_recs": 5, "offset": 2}
+    ]
+    response = forest_client.post("/api/recommend/batch", json={"users": users}, headers=headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 200
+    assert "results" in response_data
+    assert len(response_data["results"]) == len(users)
+
+    for user_data, result in zip(users, response_data["results"]):
+        response = forest_client.post("/api/recommend", json=user_data, headers=headers)
+
+        assert result["recommendations"] == response.get_json()["recommendations"]
+        assert len(result["id"]) == 36
+        assert len(result["id"].split("-")) == 5
+
+
+def test_recommend_batch_users(client, authentication_headers):
+    """ Tests error on batch recommend request when 'users' is not a list """
+    response = client.post("/api/recommend/batch", json={"users": {}}, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 400
+    assert "message" in response_data
+
+    response_message = response_data["message"].lower()
+    assert "parameter" in response_message
+    assert "users" in response_message
+    assert "list" in response_message
+
+
+def test_recommend_batch_invalid_user(client, authentication_headers):
+    """ Tests error on batch recommend request when a user is not valid """
+    users = [
+        {"age": 1, "gender": "O", "occupation": "none"},
+        {"age": 1, "gender": "X", "occupation": "none"}
+    ]
+    response = client.post("/api/recommend/batch", json={"users": users}, headers=authentication_headers)
+
+    response_data = response.get_json()
+    assert response.status_code == 400
+    assert response_data["user"] == 1
+
+    response_message = response_data["message"].lower()
+    assert "user 1" in response_message
+    assert "gender" in response_message
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import importlib.util
+import json
+import os
+import pytest
+import sys
+
+from flask_app.recommender import Recommender
+from tests.utils import get_dummy_forest_model
+
+# The script has a hyphen in its name, so it's loaded from its path (and
+# registered, so the pool of processes can find its functions)
+_spec = importlib.util.spec_from_file_location(
+    "recommend_offline", os.path.join(os.path.dirname(__file__), "..", "recommend-offline.py"))
+recommend_offline = sys.modules.setdefault("recommend_offline", importlib.util.module_from_spec(_spec))
+_spec.loader.exec_module(recommend_offline)
+
+
+@pytest.fixture
+def recommender(monkeypatch):
+    recommender = Recommender.from_pipeline(get_dummy_forest_model())
+    monkeypatch.setattr(recommend_offline, "_recommender", recommender)
+
+    yield recommender
+
+
+def get_profiles(n_profiles):
+    occupations = ["engineer", "student", "writer", "none"]
+    return [json.dumps({"id": i, "age": 10 + i, "gender": "MF"[i % 2], "occupation": occupations[i % 4],
+                        "max_recs": 1 + i % 5}) + "\n" for i in range(n_profiles)]
+
+
+def test_get_done_profiles(tmpdir):
+    """ Tests the profiles of an interrupted run are counted and its partial last line is removed """
+    path = tmpdir.join("output.jsonl")
+    assert recommend_offline.get_done_profiles(str(path)) == 0
+
+    path.write('{"id": 0}\n{"id": 1}\n{"id": 2}\n{"id"')
+    assert recommend_offline.get_done_profiles(str(path)) == 3
+    assert path.read() == '{"id": 0}\n{"id": 1}\n{"id": 2}\n'
+
+    assert recommend_offline.get_done_profiles(str(path)) == 3
+    assert path.read() == '{"id": 0}\n{"id": 1}\n{"id": 2}\n'
+
+
+def test_resume(recommender, tmpdir):
+    """ Tests resuming an interrupted run gives the output of a complete run """
+    profiles = get_profiles(12)
+    expected = recommend_offline.recommend_block(profiles, 10)
+
+    # The run was interrupted while writing the line of the 8th profile
+    path = tmpdir.join("output.jsonl")
+    lines = expected.splitlines(True)
+    path.write("".join(lines[:7]) + lines[7][:10])
+
+    done = recommend_offline.get_done_profiles(str(path))
+    assert done == 7
+    with open(str(path), "a") as fh:
+        for output, _ in recommend_offline.recommend_blocks(iter([profiles[done:done + 3], profiles[done + 3:]]),
+                                                            10, 1):
+            fh.write(output)
+
+    assert path.read() == expected
+
+
+def test_recommend_block_errors(recommender):
+    """ Tests the invalid profiles get an error line, in their place of the block """
+    block = [
+        '{"id": "a", "age": 30, "gender": "F", "occupation": "writer", "max_recs": 3}',
+        '{"id": "b", "age": 30, "gender": "X", "occupation": "writer"}',
+        'not json',
+        '[1, 2]',
+        {"id": "c", "age": 40, "gender": "M", "occupation": "engineer"}
+    ]
+    results = [json.loads(line) for line in recommend_offline.recommend_block(block, 5).splitlines()]
+
+    assert len(results) == 5
+    assert results[0]["id"] == "a"
+    assert len(results[0]["recommendations"]) == 3
+    assert results[1]["id"] == "b"
+    assert "gender" in results[1]["error"]
+    assert "recommendations" not in results[1]
+    assert results[2] == {"error": "Invalid JSON line"}
+    assert results[3] == {"error": "Invalid JSON line"}
+    assert results[4]["id"] == "c"
+    assert len(results[4]["recommendations"]) == 5
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 8])
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_recommend_blocks(recommender, block_size, n_processes):
+    """ Tests splitting the profiles in blocks and processes gives the output of a serial run """
+    profiles = get_profiles(20)
+    expected = recommend_offline.recommend_block(profiles, 10)
+
+    blocks = [profiles[start:start + block_size] for start in range(0, len(profiles), block_size)]
+    outputs = list(recommend_offline.recommend_blocks(iter(blocks), 10, n_processes))
+
+    assert "".join(output for output, _ in outputs) == expected
+    assert [n_profiles for _, n_profiles in outputs] == [len(block) for block in blocks]
+
+
+def test_read_profiles(tmpdir):
+    """ Tests the CSV and JSON lines profiles are read with the same values """
+    csv_path = tmpdir.join("profiles.csv")
+    csv_path.write("id,age,gender,occupation,max_recs\n1,30,F,writer,3\n2,40,M,engineer,\n")
+    jsonl_path = tmpdir.join("profiles.jsonl")
+    jsonl_path.write('{"id": "1", "age": 30, "gender": "F", "occupation": "writer", "max_recs": 3}\n\n' +
+                     '{"id": "2", "age": 40, "gender": "M", "occupation": "engineer"}\n')
+
+    assert list(recommend_offline.read_profiles(str(csv_path))) == \
+        [json.loads(line) for line in recommend_offline.read_profiles(str(jsonl_path))]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import pytest
+import sys
+import threading
+
+from flask_app.recommender import Ranking, Recommender
+from tests.utils import get_dummy_forest_model, get_dummy_test_model
+
+
+@pytest.fixture(params=["linear", "forest"])
+def model(request):
+    if request.param == "linear":
+        yield get_dummy_test_model()
+    else:
+        yield get_dummy_forest_model()
+
+
+@pytest.mark.parametrize("data", [
+    {"age": 25, "gender": "M", "occupation": "engineer"},
+    {"age": 1, "gender": "O", "occupation": "none"},
+    {"age": 0, "gender": "F", "occupation": "doctor"}
+])
+def test_candidates_predictions(model, data):
+    """ Tests the precomputed candidates give the same predictions as the pipeline """
+    recommender = Recommender.from_pipeline(model)
+    X = [dict(movie=movie, **data) for movie in recommender.movies]
+
+    assert np.allclose(recommender.predict(data), model.predict(X))
+
+
+def test_recommend(model):
+    """ Tests the recommendations are sorted by score """
+    recommender = Recommender.from_pipeline(model)
+    indices, scores = recommender.recommend({"age": 30, "gender": "F", "occupation": "writer"}, 3)
+
+    assert len(indices) == min(3, len(recommender.movies))
+    assert np.all(np.diff(scores) <= 0)
+
+
+@pytest.mark.parametrize("max_recs", [0, 1, 3, 4, 5, 8, 10])
+@pytest.mark.parametrize("offset", [0, 2, 7])
+def test_ranking_top(max_recs, offset):
+    """ Tests the partial selection gives the same movies as the full sort (with ties) """
+    scores = np.array([3., 1., 5., 3., 3., 2., 5., 1.])
+    indices, top_scores = Ranking(scores).top(max_recs, offset)
+
+    ranking = Ranking(scores)
+    ranking.sort()
+    sorted_indices, sorted_scores = ranking.top(max_recs, offset)
+
+    assert np.array_equal(indices, sorted_indices)
+    assert np.array_equal(top_scores, sorted_scores)
+    assert np.array_equal(sorted_indices, [2, 6, 0, 3, 4, 5, 1, 7][offset:offset + max_recs])
+
+
+def test_ranking_sort_threads():
+    """ Tests a ranking shared between threads is never seen half sorted """
+    scores = np.random.RandomState(0).rand(2000)
+    order = np.argsort(-scores, kind="mergesort")
+    errors = []
+
+    def top(ranking, barrier):
+        barrier.wait()
+        try:
+            # Past the end of the ranking the movies are taken from the full sort
+            assert np.array_equal(ranking.top(10, len(scores) - 5)[0], order[-5:])
+        except Exception as e:
+            errors.append(e)
+
+    # Switch threads as often as possible to interleave the sort and the reads
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(500):
+            ranking = Ranking(scores)
+            barrier = threading.Barrier(4)
+            threads = [threading.Thread(target=top, args=(ranking, barrier)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert errors == []
+
+
+def test_rank_many(model):
+    """ Tests the rankings of many users scored at once are the same as the ranking of each user """
+    recommender = Recommender.from_pipeline(model)
+    recommender.max_block_size = 2 * len(recommender.movies)
+    users = [{"age": age, "gender": gender, "occupation": "engineer"}
+             for age in [10, 35, 60] for gender in ["M", "F"]]
+
+    for data, ranking in zip(users, recommender.rank_many(users)):
+        assert np.allclose(ranking.scores, recommender.predict(data))
+
+
+def test_predict_many(model):
+    """ Tests the scores of many users are predicted in blocks, as the scores of each user """
+    recommender = Recommender.from_pipeline(model)
+    recommender.max_block_size = 2 * len(recommender.movies)
+    users = [{"age": age, "gender": "F", "occupation": "writer"} for age in [10, 20, 30, 40, 50]]
+
+    scores = recommender.predict_many(users)
+    assert scores.shape == (len(users), len(recommender.movies))
+    assert np.allclose(scores, [recommender.predict(data) for data in users])
+    assert recommender.predict_many([]).shape == (0, len(recommender.movies))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import pytest
+
+from sklearn.externals import joblib
+
+from flask_app.registry import ModelRegistry, get_version_key
+from flask_app.utils import InvalidConfigurationError
+from tests.utils import get_dummy_forest_model, get_authentication_headers, get_test_client
+
+
+@pytest.fixture
+def registry_path(tmpdir):
+    joblib.dump(get_dummy_forest_model(n_movies=10), str(tmpdir.join("1")))
+    tmpdir.mkdir("2")
+    joblib.dump(get_dummy_forest_model(n_movies=15), str(tmpdir.join("2", "model.pkl")))
+
+    yield str(tmpdir)
+
+
+def get_registry_client(registry_path):
+    return get_test_client(extra_config={"MODEL_REGISTRY_PATH": registry_path,
+                                         "MODEL_REGISTRY_POLL_INTERVAL": 0})
+
+
+def test_version_key():
+    """ Tests the versions are sorted by their numeric parts """
+    assert sorted(["1.10.0", "1.9.0", "2", "1.9.1"], key=get_version_key) == ["1.9.0", "1.9.1", "1.10.0", "2"]
+
+
+def test_registry_latest_version(registry_path):
+    """ Tests the application serves the greatest version of the registry """
+    client = get_registry_client(registry_path)
+    headers = get_authentication_headers(client)
+    response = client.post("/api/recommend", json={"age": 30, "gender": "M", "occupation": "engineer"},
+                           headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()["model_version"] == "2"
+
+
+def test_registry_swap(registry_path, tmpdir):
+    """ Tests the target version of the registry is swapped in """
+    registry = ModelRegistry(registry_path, poll_interval=0)
+    assert registry.check()
+    assert registry.recommender.version == "2"
+    assert len(registry.recommender.movies) == 15
+    assert not registry.check()
+
+    tmpdir.join("CURRENT").write("1\n")
+    assert registry.check()
+    assert registry.recommender.version == "1"
+    assert len(registry.recommender.movies) == 10
+
+
+def test_registry_broken_version(registry_path, tmpdir):
+    """ Tests a version that can't be loaded doesn't replace the served one """
+    registry = ModelRegistry(registry_path, poll_interval=0)
+    registry.check()
+
+    tmpdir.join("3").write("not a model")
+    assert not registry.check()
+    assert registry.recommender.version == "2"
+    assert registry.failed_version == "3"
+
+
+def test_registry_retry_version(registry_path, tmpdir):
+    """ Tests a version that failed to load is loaded again when its files change or after a while """
+    registry = ModelRegistry(registry_path, poll_interval=0)
+    registry.check()
+
+    # The version is found while it's being copied
+    tmpdir.mkdir("3")
+    assert not registry.check()
+    assert not registry.check()
+    assert registry.failed_version == "3"
+
+    joblib.dump(get_dummy_forest_model(n_movies=12), str(tmpdir.join("3", "model.pkl")))
+    assert registry.check()
+    assert registry.recommender.version == "3"
+    assert registry.failed_version is None
+
+    # A version that doesn't change is only loaded again after the retry interval
+    tmpdir.join("4").write("not a model")
+    loaded = []
+    load = registry.load
+    registry.load = lambda version: load(loaded.append(version) or version)
+    assert not registry.check()
+    assert not registry.check()
+    assert loaded == ["4"]
+    registry.retry_interval = 0
+    assert not registry.check()
+    assert loaded == ["4", "4"]
+    assert registry.recommender.version == "3"
+
+
+def test_registry_empty(tmpdir):
+    """ Tests the application doesn't start without a model in the registry """
+    with pytest.raises(InvalidConfigurationError):
+        get_registry_client(str(tmpdir))
+
+    tmpdir.join("1").write("not a model")
+    with pytest.raises(InvalidConfigurationError):
+        get_registry_client(str(tmpdir))
+
+
+def test_registry_pages(registry_path):
+    """ Tests the pages of a recommendation are served with its version of the model """
+    client = get_registry_client(registry_path)
+    headers = get_authentication_headers(client)
+    response = client.post("/api/recommend", json={"age": 30, "gender": "F", "occupation": "writer",
+                                                   "max_recs": 5}, headers=headers)
+    request_id = response.get_json()["id"]
+
+    response = client.post("/api/recommend", json={"id": request_id, "offset": 10}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.get_json()["model_version"] == "2"
+    assert len(response.get_json()["recommendations"]) == 5
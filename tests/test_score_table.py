@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import numpy as np
+import pytest
+
+from flask_app.recommender import Recommender
+from flask_app.score_table import ScoreTable
+from tests.utils import get_dummy_forest_model, get_dummy_test_model
+
+
+@pytest.fixture(scope="module")
+def recommender():
+    yield Recommender.from_pipeline(get_dummy_forest_model())
+
+
+@pytest.fixture(scope="module")
+def score_table(recommender):
+    yield ScoreTable.build(recommender)
+
+
+@pytest.mark.parametrize("age", [-100, 0, 10, 11, 25, 26, 47, 79, 80, 150])
+@pytest.mark.parametrize("gender", ["M", "F", "O"])
+@pytest.mark.parametrize("occupation", ["engineer", "none", "doctor"])
+def test_lookup(recommender, score_table, age, gender, occupation):
+    """ Tests the table gives the same results as the model """
+    data = {"age": age, "gender": gender, "occupation": occupation}
+    scores = recommender.predict(data)
+    indices, table_scores = score_table.lookup(data).top(len(recommender.movies))
+
+    assert np.allclose(scores[indices], table_scores)
+    assert np.allclose(np.sort(scores)[::-1], table_scores)
+
+
+def test_lookup_unknown_user(score_table):
+    """ Tests users outside the table are not served from it """
+    assert score_table.lookup({"age": 30, "gender": "X", "occupation": "none"}) is None
+
+
+def test_check_model(recommender, score_table):
+    """ Tests the table is only valid for the model it was built for """
+    assert score_table.check_model(recommender)
+    assert not score_table.check_model(Recommender.from_pipeline(get_dummy_forest_model(seed=1)))
+    assert not score_table.check_model(Recommender.from_pipeline(get_dummy_test_model()))
+
+
+def test_save_load(recommender, score_table, tmpdir):
+    """ Tests the table is the same after saving and loading it """
+    path = str(tmpdir.join("score_table"))
+    score_table.save(path)
+    loaded_table = ScoreTable.load(path)
+
+    assert loaded_table.check_model(recommender)
+    assert loaded_table.genders == score_table.genders
+    assert loaded_table.occupations == score_table.occupations
+    assert np.array_equal(loaded_table.rankings, score_table.rankings)
+    assert np.array_equal(loaded_table.scores, score_table.scores)
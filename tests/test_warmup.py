@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+
+from flask_app.recommender import Recommender
+from flask_app.utils import VALID_GENDERS, VALID_OCCUPATIONS
+from flask_app.warmup import get_warmup_profiles, is_ready, warm_up
+from tests.utils import get_dummy_forest_model, get_test_client
+
+
+def test_warmup_profiles():
+    """ Tests the warmup profiles cover every gender and occupation """
+    profiles = get_warmup_profiles(64)
+
+    assert len(profiles) == 64
+    assert {data["gender"] for data in profiles} == VALID_GENDERS
+    assert {data["occupation"] for data in profiles} == VALID_OCCUPATIONS
+
+
+def test_warm_up():
+    """ Tests the latency of the warmup is measured and gates the readiness """
+    recommender = Recommender.from_pipeline(get_dummy_forest_model())
+    assert not is_ready(recommender)
+
+    warmup_stats = warm_up(recommender, 16)
+    assert warmup_stats["requests"] == 16
+    assert 0 <= warmup_stats["p50"] <= warmup_stats["p95"] <= warmup_stats["max"]
+    assert is_ready(recommender)
+    assert is_ready(recommender, warmup_stats["p95"])
+    assert not is_ready(recommender, warmup_stats["p95"] / 2)
+
+
+def test_ready(forest_client):
+    """ Tests a warm worker is reported as ready """
+    response = forest_client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.get_json()["ready"]
+    assert response.get_json()["warmup"]["requests"] == 64
+
+
+def test_not_ready():
+    """ Tests a worker over the latency budget is not reported as ready """
+    client = get_test_client(model=get_dummy_forest_model(),
+                             extra_config={"READINESS_P95_BUDGET": 1e-9, "READINESS_RETRY_INTERVAL": 0})
+    response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert not response.get_json()["ready"]
+
+
+def test_ready_background(monkeypatch):
+    """ Tests the latency of a worker that is not ready is measured again out of the probe """
+    client = get_test_client(model=get_dummy_forest_model(),
+                             extra_config={"READINESS_P95_BUDGET": 1e-9, "READINESS_RETRY_INTERVAL": 0})
+    released = threading.Event()
+    measures = []
+
+    def blocked_warm_up(recommender, n_requests):
+        measures.append(n_requests)
+        released.wait()
+        recommender.warmup_stats = dict(recommender.warmup_stats, p95=0., measured_at=time.time())
+
+    monkeypatch.setattr("flask_app.app.warm_up", blocked_warm_up)
+
+    # The probes don't wait for the measure, and only one measure runs at a time
+    assert client.get("/ready").status_code == 503
+    while not measures:
+        time.sleep(0.01)
+    assert client.get("/ready").status_code == 503
+    assert measures == [64]
+
+    released.set()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.01)
+    assert measures == [64]
@@ -4,8 +4,10 @@
 from __future__ import absolute_import
 
 import datetime
+import numpy as np
 
 from passlib.hash import pbkdf2_sha256 as sha256
+from sklearn.ensemble import RandomForestRegressor
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.linear_model import LinearRegression
 from sklearn.pipeline import make_pipeline
@@ -23,10 +25,42 @@ def get_dummy_test_model():
     return model
 
 
-def get_test_client(jwt_expiration_time=3600):
+def get_dummy_forest_model(n_movies=20, n_samples=500, seed=0):
+    """
+    Returns a small random forest pipeline trained over random data, closer to
+    the production model than the dummy test model.
+    """
+    rng = np.random.RandomState(seed)
+    genders = ["M", "F"]
+    occupations = ["engineer", "student", "writer", "none"]
+    movies = ["Movie %d" % i for i in range(n_movies)]
+
+    X = []
+    y = []
+    for _ in range(n_samples):
+        movie = rng.randint(n_movies)
+        row = {
+            "age": int(rng.randint(10, 80)),
+            "gender": genders[rng.randint(len(genders))],
+            "occupation": occupations[rng.randint(len(occupations))],
+            "movie": movies[movie]
+        }
+        X.append(row)
+        y.append(1 + (movie % 5) * (row["age"] / 80.) + (row["gender"] == "F") +
+                 rng.uniform(0, 1))
+
+    model = make_pipeline(DictVectorizer(), RandomForestRegressor(n_estimators=5, random_state=seed))
+    model.fit(X, y)
+
+    return model
+
+
+def get_test_client(jwt_expiration_time=3600, model=None, extra_config=None):
     """
     Returns a client for testing purposes.
     :param jwt_expiration_time: Set the expiration time (in seconds) for the JWT tokens.
+    :param model: Model for the application (defaults to the dummy test model).
+    :param extra_config: Extra configuration for the application.
     :return: Application's test client
     """
     config = {
@@ -36,5 +70,17 @@ def get_test_client(jwt_expiration_time=3600):
         "JWT_SECRET_KEY": "test-secret-key",
         "JWT_ACCESS_TOKEN_EXPIRES": datetime.timedelta(seconds=jwt_expiration_time)
     }
+    config.update(extra_config or {})
+
+    return create_app(config, model if model is not None else get_dummy_test_model()).test_client()
+
+
+def get_authentication_headers(client):
+    """
+    Returns a valid token authorization header for the given client.
+    :param client: Application's test client.
+    :return: Dictionary with the authorization header.
+    """
+    response = client.post("/api/login", json={"session_password": "test-password"})
 
-    return create_app(config, get_dummy_test_model()).test_client()
+    return {"Authorization": "Bearer %s" % response.get_json()["access_token"]}